@@ -0,0 +1,558 @@
+"""
+Benchmark przepustowości potoku /research bez dostępu do sieci.
+
+Uruchamia lokalny serwer udający API OpenAI (chat, streaming, embeddingi) i Tavily
+(wyszukiwanie) z konfigurowalnym rozkładem opóźnień i gotowymi odpowiedziami,
+kieruje na niego klientów aplikacji i mierzy:
+- zadania/min dla 1-50 scenariuszy,
+- p50/p95 czasu każdego etapu (spany z tracing.py),
+- szczytowe zużycie pamięci.
+
+Przykłady:
+  python benchmark.py --scenarios 1,5,10 --jobs 3 --llm-latency lognormal:0.8,0.4
+  python benchmark.py --mode agents --repeat 20 --llm-latency fixed:0.2
+  python benchmark.py --scenarios 10 --with-cache --json wyniki.json
+
+Rozkłady opóźnień (sekundy): fixed:X, uniform:A,B, normal:MU,SIGMA, lognormal:MEDIANA,SIGMA.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1536
+
+COUNTRY_POOL = [
+    "Niemcy", "Francja", "Finlandia", "Ukraina", "USA", "Japonia",
+    "Chiny", "Tajwan", "Norwegia", "Katar", "Wielka Brytania", "Korea Południowa",
+]
+SUBJECT_POOL = [
+    "Gospodarka naftowa", "Półprzewodniki", "Motoryzacja", "Energetyka odnawialna", "Handel morski",
+    "Cyberbezpieczeństwo", "Rolnictwo", "Surowce krytyczne", "Obronność", "Infrastruktura AI",
+]
+
+# rozpoznawanie agenta po treści promptu systemowego (kolejność ma znaczenie)
+ROUTES = [
+    ("określ 5 krajów", "scenario"),
+    ("usuń TYLKO dane poufne", "safety"),
+    ("PROGNOZĘ", "prediction"),
+    ("JEDEN zbiorczy raport", "report"),
+    ("zwięzłe streszczenie", "brief"),
+]
+
+DEFAULT_RESPONSES = {
+    "prediction": json.dumps({
+        "12m_positive": "W części scenariuszy rośnie eksport przemysłu Atlantis o 3–5%.",
+        "12m_negative": "Wzrost cen energii o 12% obciąża gospodarstwa domowe.",
+        "36m_positive": "Inwestycje w OZE i centra danych przyciągają 4 mld euro kapitału.",
+        "36m_negative": "Trwała utrata konkurencyjności sektora ICT przy przedłużonym embargu.",
+    }, ensure_ascii=False),
+    "report": (
+        "# Raport strategiczny dla państwa Atlantis\n"
+        "## Horyzont 12 miesięcy\n### Scenariusze – ujęcie pozytywne\n" + "Analiza szans krótkoterminowych. " * 60 + "\n"
+        "### Scenariusze – ujęcie negatywne\n" + "Analiza zagrożeń krótkoterminowych. " * 60 + "\n"
+        "## Horyzont 36 miesięcy\n### Scenariusze – ujęcie pozytywne\n" + "Analiza szans długoterminowych. " * 60 + "\n"
+        "### Scenariusze – ujęcie negatywne\n" + "Analiza zagrożeń długoterminowych. " * 60 + "\n"
+        "## Rekomendacje dla rządu Atlantis\n"
+        + "".join(f"- Rekomendacja {i}: dywersyfikacja dostaw i wzmocnienie odporności (12m/36m).\n" for i in range(1, 7))
+    ),
+    "brief": "Krótkie streszczenie raportu: " + "najważniejsze wnioski dla rządu Atlantis. " * 25,
+    "cell": (
+        "Dla mieszkańca Atlantis oznacza to wzrost cen paliw o około 8%. "
+        "Część zakładów przemysłowych może ograniczyć produkcję. "
+        "Rząd powinien monitorować dostawy i zapasy. "
+        "Największym zagrożeniem jest przerwanie łańcuchów dostaw. "
+        "Szansą jest przeniesienie produkcji do regionu. "
+        "W dostępnych źródłach podano wartość eksportu 2,1 mld euro."
+    ),
+}
+
+
+class LatencyModel:
+    """Rozkład opóźnienia w sekundach, np. "lognormal:0.8,0.4" (mediana 0.8 s)."""
+
+    def __init__(self, spec: str, rng: random.Random):
+        self.spec = spec
+        self.rng = rng
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")] if params else []
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Nieznany rozkład opóźnienia: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = self.rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            value = self.rng.lognormvariate(math.log(median), sigma)
+        return max(0.0, value)
+
+
+class FakeBackend:
+    """Stan serwera: opóźnienia, odpowiedzi i liczniki zapytań (deterministyczne przy danym seed)."""
+
+    def __init__(self, args, responses: Dict[str, str]):
+        self._rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self.llm_latency = LatencyModel(args.llm_latency, self._rng)
+        self.stream_chunk_latency = LatencyModel(args.stream_chunk_latency, self._rng)
+        self.embedding_latency = LatencyModel(args.embedding_latency, self._rng)
+        self.search_latency = LatencyModel(args.search_latency, self._rng)
+        self.responses = responses
+        self.countries, self.subjects = args.matrix
+        self.requests: Dict[str, int] = {}
+
+    def delay(self, model: LatencyModel) -> None:
+        with self._lock:
+            seconds = model.sample()
+        time.sleep(seconds)
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def chat_response(self, messages: List[Dict[str, Any]]) -> Tuple[str, str]:
+        system = " ".join(str(m.get("content")) for m in messages if m.get("role") in ("system", "developer"))
+        user = " ".join(str(m.get("content")) for m in messages if m.get("role") == "user")
+        route = next((name for marker, name in ROUTES if marker in system), "cell")
+
+        if route in self.responses and route not in ("scenario", "safety"):
+            return route, self.responses[route]
+        if route == "scenario":
+            # kraje i tematy zależą od treści scenariusza - częściowe pokrywanie się między scenariuszami
+            seed = int(hashlib.sha256(user.encode("utf-8")).hexdigest(), 16)
+            picker = random.Random(seed)
+            return route, self.responses.get("scenario") or json.dumps({
+                "countries": picker.sample(COUNTRY_POOL, self.countries),
+                "subjects": picker.sample(SUBJECT_POOL, self.subjects),
+            }, ensure_ascii=False)
+        if route == "safety":
+            # echo wejścia - dane "po redakcji" są takie same
+            try:
+                texts = json.loads(user)["texts"]
+            except (ValueError, KeyError):
+                texts = []
+            return route, self.responses.get("safety") or json.dumps({"texts": texts}, ensure_ascii=False)
+        return route, self.responses["cell"]
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    backend: FakeBackend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.endswith("/chat/completions"):
+            self._chat(body)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif self.path.endswith("/search"):
+            self._search(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Nieznana ścieżka {self.path}"}})
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chat(self, body: Dict[str, Any]) -> None:
+        backend = self.backend
+        route, content = backend.chat_response(body.get("messages", []))
+        backend.count(f"chat:{route}")
+        backend.delay(backend.llm_latency)
+
+        prompt_tokens = sum(len(str(m.get("content"))) for m in body.get("messages", [])) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+        }
+        base = {"id": "chatcmpl-benchmark", "created": int(time.time()), "model": body.get("model")}
+
+        if not body.get("stream"):
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        # strumień SSE: fragmenty po ~20 znaków, połączenie zamykane po [DONE]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        pieces = [content[i:i + 20] for i in range(0, len(content), 20)] or [""]
+        for i, piece in enumerate(pieces):
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": piece} if i == 0 else {"content": piece},
+                    "finish_reason": "stop" if i == len(pieces) - 1 else None,
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            backend.delay(backend.stream_chunk_latency)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _embeddings(self, body: Dict[str, Any]) -> None:
+        backend = self.backend
+        backend.count("embeddings")
+        backend.delay(backend.embedding_latency)
+        inputs = body.get("input")
+        texts = inputs if isinstance(inputs, list) else [inputs]
+
+        data = []
+        for index, text in enumerate(texts):
+            seed = int(hashlib.sha256(str(text).encode("utf-8")).hexdigest()[:16], 16)
+            vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS)
+            vector /= np.linalg.norm(vector)
+            data.append({"object": "embedding", "index": index, "embedding": vector.round(6).tolist()})
+        tokens = sum(len(str(text)) for text in texts) // 4
+        self._send_json(200, {
+            "object": "list", "data": data, "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _search(self, body: Dict[str, Any]) -> None:
+        backend = self.backend
+        backend.count("tavily")
+        backend.delay(backend.search_latency)
+        query = body.get("query", "")
+        results = [
+            {
+                "title": f"Wynik {i + 1}",
+                "url": f"https://example.org/{hashlib.md5(query.encode('utf-8')).hexdigest()[:8]}/{i}",
+                "content": f"{query}: eksport wzrósł o {3 + i}% r/r, wartość kontraktów {1.5 + i} mld USD.",
+                "score": round(1 - i * 0.1, 2),
+            }
+            for i in range(int(body.get("max_results") or 5))
+        ]
+        self._send_json(200, {"query": query, "results": results, "response_time": 0.0})
+
+
+def start_fake_server(backend: FakeBackend) -> ThreadingHTTPServer:
+    handler = type("BoundFakeApiHandler", (FakeApiHandler,), {"backend": backend})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-api").start()
+    return server
+
+
+def configure_environment(base_url: str, args, workdir: str) -> None:
+    """Zmienne środowiskowe muszą być ustawione przed importem modułów aplikacji (config2, flask_main)."""
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_BASE": f"{base_url}/v1",
+        "TAVILY_API_KEY": "benchmark",
+        "LLM_CACHE_ENABLED": "1" if args.with_cache else "0",
+        "SEARCH_CACHE_ENABLED": "1" if args.with_cache else "0",
+        "SAFETY_CACHE_ENABLED": "1" if args.with_cache else "0",
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite"),
+        "SEARCH_CACHE_PATH": os.path.join(workdir, "search_cache.sqlite"),
+        "SAFETY_CACHE_PATH": os.path.join(workdir, "safety_cache.sqlite"),
+        "RATE_LIMIT_ENABLED": "1" if args.rate_limit else "0",
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(workdir, "vector_store"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite"),
+        "SQL_CONNECTION_NAME": "",
+        "RAG_ENABLED": "1" if args.rag else "0",
+    })
+
+    # TavilySearchAPIWrapper składa adres z modułowej stałej
+    from langchain_community.utilities import tavily_search
+    tavily_search.TAVILY_API_URL = base_url
+
+
+def reset_peak_memory() -> bool:
+    """
+    Zeruje szczytowe RSS procesu (Linux: zapis "5" do /proc/self/clear_refs resetuje VmHWM),
+    żeby pomiar dotyczył tylko następnego przebiegu. False, jeśli system tego nie obsługuje -
+    wtedy peak_memory_mb podaje maksimum od startu procesu.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _proc_status_mb(field: str) -> Optional[float]:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def peak_memory_mb() -> Optional[float]:
+    """Szczytowe RSS procesu (MB) - VmHWM z /proc albo ru_maxrss; None, jeśli nie da się go odczytać."""
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux podaje kB, macOS bajty
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(durations: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    from tracing import percentile
+    return {
+        stage: {
+            "count": len(values),
+            "p50_seconds": round(percentile(values, 50), 3),
+            "p95_seconds": round(percentile(values, 95), 3),
+        }
+        for stage, values in sorted(durations.items())
+    }
+
+
+def build_scenarios(count: int, templates) -> List[tuple]:
+    return [
+        (f"{templates[i % len(templates)][0]} (wariant {i + 1})", templates[i % len(templates)][1])
+        for i in range(count)
+    ]
+
+
+def seed_vector_store(store, chunks: int, seed: int) -> None:
+    """Syntetyczne fragmenty w lokalnym magazynie - przy pustym magazynie run_engine pomija retrieval."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((chunks, EMBEDDING_DIMENSIONS))
+    store.save_batch([
+        (f"benchmark-{i % 10}.txt", f"Fragment dokumentu benchmarku nr {i}.", vector, f"benchmark-chunk-{i}", f"benchmark-file-{i % 10}")
+        for i, vector in enumerate(vectors)
+    ])
+
+
+def run_engine_benchmark(args) -> List[Dict[str, Any]]:
+    import flask_main
+    import tracing
+
+    if args.rag and args.rag_chunks:
+        seed_vector_store(flask_main.get_vector_store(), args.rag_chunks, args.seed)
+
+    results = []
+    for size in args.scenarios:
+        scenarios = build_scenarios(size, flask_main.scenarios)
+        durations: Dict[str, List[float]] = {}
+        job_seconds: List[float] = []
+        lock = threading.Lock()
+        per_run_memory = reset_peak_memory()
+        # po resecie szczyt zaczyna się od bieżącego RSS (pamięć zajęta przez wcześniejsze przebiegi)
+        start_memory = _proc_status_mb("VmRSS")
+
+        def run_job(job_index):
+            job_id = f"benchmark-{size}-{job_index}"
+            trace = tracing.start_trace(job_id)
+            started = time.monotonic()
+            try:
+                flask_main.run_engine(scenarios)
+            finally:
+                elapsed = time.monotonic() - started
+                tracing.end_trace(job_id)
+                with lock:
+                    job_seconds.append(elapsed)
+                    for stage, values in trace.durations.items():
+                        durations.setdefault(stage, []).extend(values)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="benchmark-job") as executor:
+            list(executor.map(tracing.in_context(run_job), range(args.jobs)))
+        elapsed = time.monotonic() - started
+
+        results.append({
+            "scenarios": size,
+            "jobs": args.jobs,
+            "concurrency": args.concurrency,
+            "elapsed_seconds": round(elapsed, 3),
+            "jobs_per_minute": round(args.jobs / elapsed * 60, 2),
+            "job_p50_seconds": round(tracing.percentile(job_seconds, 50), 3),
+            "job_p95_seconds": round(tracing.percentile(job_seconds, 95), 3),
+            "stages": summarize(durations),
+            "start_memory_mb": start_memory,
+            "peak_memory_mb": peak_memory_mb(),
+            # "run": szczyt tylko tego przebiegu; "cumulative": maksimum od startu procesu (rośnie monotonicznie)
+            "peak_memory_scope": "run" if per_run_memory else "cumulative",
+        })
+    return results
+
+
+def run_agents_benchmark(args) -> List[Dict[str, Any]]:
+    """Każdy agent osobno, args.repeat wywołań - bez kolejkowania i równoległości potoku."""
+    import flask_main
+    from external_research_agent_2 import ExternalResearchAgent
+    from predictive_impact_agent import PredictiveImpactAgent
+    from safety_agent import safety_agent
+    from scenario_agent_with_verificator import scenario_agent_with_verificator
+    from summary_brief_agent import SummaryBriefAgent
+    from summary_report_agent import SummaryReportAgent
+
+    flask_main.ensure_llm_cache()
+    home_context = flask_main.user_prompt
+    scenario, weight = flask_main.scenarios[0]
+    external_agent = ExternalResearchAgent()
+    predictive_agent = PredictiveImpactAgent()
+    report_agent = SummaryReportAgent()
+    brief_agent = SummaryBriefAgent()
+    external_results = {"Niemcy": {"Motoryzacja": DEFAULT_RESPONSES["cell"]}}
+    predictions = json.loads(DEFAULT_RESPONSES["prediction"])
+
+    agents = {
+        "scenario_agent": lambda i: scenario_agent_with_verificator(home_context, f"{scenario} ({i})", weight),
+        "safety_agent": lambda i: safety_agent(home_context, f"{scenario} ({i})"),
+        "tavily_search": lambda i: external_agent.search_tool.invoke({"query": f"benchmark {i}"}),
+        "cell_analysis": lambda i: external_agent.analyze_impact(
+            flask_main.HOME_COUNTRY_NAME, home_context, "Niemcy", f"Motoryzacja {i}", scenario,
+        ),
+        "prediction": lambda i: predictive_agent.predict_for_scenario(home_context, f"{scenario} ({i})", external_results),
+        "report": lambda i: report_agent.build_global_report(
+            home_context, [{"scenario": f"{scenario} ({i})", "weight": weight, "predictions": predictions}],
+        ),
+        "report_stream": lambda i: "".join(report_agent.stream_global_report(
+            home_context, [{"scenario": f"{scenario} ({i}, stream)", "weight": weight, "predictions": predictions}],
+        )),
+        "brief": lambda i: brief_agent.build_brief_summary(f"{DEFAULT_RESPONSES['report']} ({i})"),
+    }
+
+    durations: Dict[str, List[float]] = {}
+    for name, call in agents.items():
+        for i in range(args.repeat):
+            started = time.monotonic()
+            call(i)
+            durations.setdefault(name, []).append(time.monotonic() - started)
+
+    return [{
+        "repeat": args.repeat, "stages": summarize(durations),
+        "peak_memory_mb": peak_memory_mb(), "peak_memory_scope": "cumulative",
+    }]
+
+
+def print_report(mode: str, results: List[Dict[str, Any]], requests_count: Dict[str, int]) -> None:
+    for result in results:
+        print("=" * 78)
+        if mode == "engine":
+            print(
+                f"Scenariusze: {result['scenarios']}  zadania: {result['jobs']}  równolegle: {result['concurrency']}  "
+                f"czas: {result['elapsed_seconds']} s"
+            )
+            print(
+                f"Przepustowość: {result['jobs_per_minute']} zadań/min  "
+                f"zadanie p50/p95: {result['job_p50_seconds']} / {result['job_p95_seconds']} s"
+            )
+        else:
+            print(f"Agenci osobno, powtórzeń: {result['repeat']}")
+        scope = "w tym przebiegu" if result["peak_memory_scope"] == "run" else "łącznie od startu procesu"
+        start = f" (na starcie przebiegu: {result['start_memory_mb']} MB)" if result.get("start_memory_mb") else ""
+        print(f"Szczytowa pamięć (RSS, {scope}): {result['peak_memory_mb']} MB{start}")
+        print(f"{'etap':<22}{'liczba':>8}{'p50 [s]':>12}{'p95 [s]':>12}")
+        for stage, stats in result["stages"].items():
+            print(f"{stage:<22}{stats['count']:>8}{stats['p50_seconds']:>12}{stats['p95_seconds']:>12}")
+    print("=" * 78)
+    print("Zapytania do atrap API:", json.dumps(requests_count, ensure_ascii=False, sort_keys=True))
+
+
+def parse_matrix(value: str):
+    countries, _, subjects = value.partition("x")
+    return int(countries), int(subjects)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark potoku /research na lokalnych atrapach OpenAI i Tavily")
+    parser.add_argument("--mode", choices=["engine", "agents"], default="engine")
+    parser.add_argument("--scenarios", default="1,5,10",
+                        type=lambda v: [int(x) for x in v.split(",")], help="liczby scenariuszy, np. 1,5,10,50")
+    parser.add_argument("--jobs", type=int, default=3, help="zadań na każdą liczbę scenariuszy")
+    parser.add_argument("--concurrency", type=int, default=1, help="zadań uruchamianych jednocześnie")
+    parser.add_argument("--repeat", type=int, default=10, help="wywołań każdego agenta (tryb agents)")
+    parser.add_argument("--matrix", type=parse_matrix, default=(5, 5), help="kraje x tematy na scenariusz, np. 5x5")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.4")
+    parser.add_argument("--stream-chunk-latency", default="fixed:0.01")
+    parser.add_argument("--embedding-latency", default="uniform:0.05,0.15")
+    parser.add_argument("--search-latency", default="lognormal:0.6,0.3")
+    parser.add_argument("--responses", help="JSON z odpowiedziami do podmiany (klucze: scenario, safety, "
+                                            "prediction, report, brief, cell)")
+    parser.add_argument("--with-cache", action="store_true", help="włącz cache LLM i wyszukiwania (w katalogu tymczasowym)")
+    parser.add_argument("--rate-limit", action="store_true", help="włącz limiter zapytań")
+    parser.add_argument("--rag", action="store_true", help="włącz retrieval z lokalnego magazynu wektorów")
+    parser.add_argument("--rag-chunks", type=int, default=200,
+                        help="syntetycznych fragmentów w magazynie przy --rag (0 = pusty magazyn, retrieval pomijany)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="zapisz wyniki do pliku JSON")
+    parser.add_argument("--verbose", action="store_true", help="nie wyciszaj wydruków agentów")
+    args = parser.parse_args()
+
+    responses = dict(DEFAULT_RESPONSES)
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses.update(json.load(f))
+
+    backend = FakeBackend(args, responses)
+    server = start_fake_server(backend)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    workdir = tempfile.mkdtemp(prefix="atlantis-benchmark-")
+    configure_environment(base_url, args, workdir)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+    # run_engine zapisuje pliki wynikowe w katalogu bieżącym
+    os.chdir(workdir)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        if args.mode == "engine":
+            results = run_engine_benchmark(args)
+        else:
+            results = run_agents_benchmark(args)
+    server.shutdown()
+
+    print_report(args.mode, results, backend.requests)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "results": results, "requests": backend.requests}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class CacheEntry:
+    value: str
+    created_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+class CacheStore(ABC):
+    """
+    Prosty magazyn klucz -> wartość (tekst) używany przez cache LLM i cache wyszukiwania.
+    Implementacje mają być bezpieczne wątkowo - agenci działają równolegle.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class SQLiteCacheStore(CacheStore):
+    """
+    Domyślny backend na dysku (SQLite):
+    - ttl_seconds: twarde wygaśnięcie wpisu (None = bez limitu),
+    - max_entries: limit rozmiaru, przy przekroczeniu usuwamy najdawniej używane wpisy (LRU).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "cache",
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = 10000,
+    ):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_idx ON {table} (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return CacheEntry(value=value, created_at=created_at)
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evict(self) -> None:
+        # wywoływane pod blokadą
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        if self.max_entries is not None:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            if cursor.rowcount:
+                logging.info(f"Cache '{self.table}': usunięto {cursor.rowcount} najdawniej używanych wpisów (LRU).")
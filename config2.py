@@ -1,7 +1,66 @@
+import json
 import os
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
\ No newline at end of file
+OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+
+# Wspólne klienty LLM (llm_clients.py) - jedna pula połączeń na proces
+LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4.1")
+LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "1") == "1"
+LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", 50))
+LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+LLM_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", 60))
+LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))
+# ustawienia per model, np. {"gpt-4.1": {"timeout": 180, "max_retries": 3}}
+LLM_MODEL_SETTINGS: dict = json.loads(os.getenv("LLM_MODEL_SETTINGS", "{}"))
+
+# Ponowienia 429 / 5xx z backoffem i Retry-After (rate_limiter.py) działają zawsze;
+# limity zapytań/tokenów na minutę (na proces) włączamy po ustawieniu limitów konta
+RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "0") == "1"
+# domyślne limity modeli czatu i (osobno) modeli embeddingów
+OPENAI_RPM: float = float(os.getenv("OPENAI_RPM", 500))
+OPENAI_TPM: float = float(os.getenv("OPENAI_TPM", 30000))
+OPENAI_EMBEDDING_RPM: float = float(os.getenv("OPENAI_EMBEDDING_RPM", 3000))
+OPENAI_EMBEDDING_TPM: float = float(os.getenv("OPENAI_EMBEDDING_TPM", 1000000))
+# limity per model, np. {"gpt-4o-mini": {"rpm": 5000, "tpm": 2000000}}
+OPENAI_RATE_LIMITS: dict = json.loads(os.getenv("OPENAI_RATE_LIMITS", "{}"))
+# szacowana długość odpowiedzi pobierana z limitu przed zapytaniem (max_tokens to tylko górna granica);
+# odpowiedzi bez strumienia są potem rozliczane wg rzeczywistego usage
+OPENAI_COMPLETION_ESTIMATE_TOKENS: int = int(os.getenv("OPENAI_COMPLETION_ESTIMATE_TOKENS", 500))
+TAVILY_RPM: float = float(os.getenv("TAVILY_RPM", 100))
+RATE_LIMIT_MAX_RETRIES: int = int(os.getenv("RATE_LIMIT_MAX_RETRIES", 5))
+RATE_LIMIT_BACKOFF_BASE_SECONDS: float = float(os.getenv("RATE_LIMIT_BACKOFF_BASE_SECONDS", 1))
+RATE_LIMIT_BACKOFF_MAX_SECONDS: float = float(os.getenv("RATE_LIMIT_BACKOFF_MAX_SECONDS", 60))
+
+# Cache odpowiedzi LLM (współdzielony przez wszystkich agentów)
+LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+LLM_CACHE_TTL_SECONDS: float = float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 20000))
+
+# Cache wyników wyszukiwania Tavily
+SEARCH_CACHE_ENABLED: bool = os.getenv("SEARCH_CACHE_ENABLED", "1") == "1"
+SEARCH_CACHE_PATH: str = os.getenv("SEARCH_CACHE_PATH", os.path.join(".cache", "search_cache.sqlite"))
+# wynik świeży - zwracany bez odpytywania sieci
+SEARCH_CACHE_TTL_SECONDS: float = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", 6 * 3600))
+# wynik nieświeży - zwracany od razu, ale odświeżany w tle
+SEARCH_CACHE_STALE_SECONDS: float = float(os.getenv("SEARCH_CACHE_STALE_SECONDS", 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES: int = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 5000))
+
+# Cache redakcji safety (klucz: hash treści) - ten sam kontekst i scenariusze nie idą drugi raz do LLM
+SAFETY_CACHE_ENABLED: bool = os.getenv("SAFETY_CACHE_ENABLED", "1") == "1"
+SAFETY_CACHE_PATH: str = os.getenv("SAFETY_CACHE_PATH", os.path.join(".cache", "safety_cache.sqlite"))
+SAFETY_CACHE_TTL_SECONDS: float = float(os.getenv("SAFETY_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+SAFETY_CACHE_MAX_ENTRIES: int = int(os.getenv("SAFETY_CACHE_MAX_ENTRIES", 5000))
+# maksymalna łączna długość tekstów w jednym wywołaniu safety (odpowiedź musi zmieścić się w max_tokens)
+SAFETY_BATCH_MAX_CHARS: int = int(os.getenv("SAFETY_BATCH_MAX_CHARS", 16000))
+
+# Ekstrakcja tekstu z PDF (w zadaniu w tle, strony parsowane równolegle w puli procesów)
+PDF_EXTRACT_WORKERS: int = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+# szybka ścieżka pypdf; strony z mniejszą liczbą znaków są parsowane ponownie pdfplumberem
+PDF_FASTPATH_ENABLED: bool = os.getenv("PDF_FASTPATH_ENABLED", "1") == "1"
+PDF_FASTPATH_MIN_CHARS: int = int(os.getenv("PDF_FASTPATH_MIN_CHARS", 20))
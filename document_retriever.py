@@ -0,0 +1,63 @@
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class DocumentRetriever:
+    """
+    Etap retrieval dla /research: zamiast wklejać całe pliki kontekstowe do promptów,
+    wyszukujemy k najbliższych fragmentów (pgvector) dla scenariusza i dla każdej
+    komórki (kraj, temat), a potem przycinamy je do budżetu tokenów.
+
+    Zależności (embedding, wyszukiwanie, liczenie tokenów) są wstrzykiwane,
+    żeby moduł nie zależał od konkretnego backendu bazy.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        search: Callable[[List[float], int, Optional[Sequence[str]]], List[dict]],
+        count_tokens: Callable[[str], int],
+        k: int = 4,
+        token_budget: int = 1500,
+        filenames: Optional[Sequence[str]] = None,
+    ):
+        self.embed_batch = embed_batch
+        self.search = search
+        self.count_tokens = count_tokens
+        self.k = k
+        self.token_budget = token_budget
+        self.filenames = list(filenames) if filenames else None
+
+    @staticmethod
+    def cell_query(scenario: str, country: str, subject: str) -> str:
+        return f"{subject} – {country}. {scenario}"
+
+    def retrieve(self, queries: List[str]) -> List[str]:
+        """Zwraca gotowy tekst kontekstu (w limicie tokenów) dla każdego zapytania."""
+        if not queries:
+            return []
+        try:
+            vectors = self.embed_batch(queries)
+            return [self.format_chunks(self.search(vector, self.k, self.filenames)) for vector in vectors]
+        except Exception as e:
+            # brak kontekstu nie może zatrzymać analizy
+            logging.warning(f"Retrieval dokumentów nie powiódł się: {e}")
+            return ["" for _ in queries]
+
+    def for_scenario(self, scenario: str) -> str:
+        return self.retrieve([scenario])[0]
+
+    def for_cells(self, scenario: str, cells: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        queries = [self.cell_query(scenario, country, subject) for country, subject in cells]
+        return dict(zip(cells, self.retrieve(queries)))
+
+    def format_chunks(self, chunks: List[dict]) -> str:
+        parts, used = [], 0
+        for chunk in chunks:
+            part = f"[{chunk['filename']}]\n{chunk['content'].strip()}"
+            tokens = self.count_tokens(part)
+            if used + tokens > self.token_budget:
+                break
+            parts.append(part)
+            used += tokens
+        return "\n\n".join(parts)
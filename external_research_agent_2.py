@@ -1,11 +1,15 @@
 import json
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 
 import config2
+from llm_clients import get_chat_model
+from rate_limiter import RateLimitedSearchTool
+from tracing import in_context, span
+from search_cache import CachedSearchTool, normalize_query
 from safety_agent import safety_agent
 from scenario_agent_with_verificator import scenario_agent_with_verificator
 
@@ -16,23 +20,30 @@ class ExternalResearchAgent:
     - GPT-4.1 (analiza),
     - perspektywa mieszkańca Atlantis,
     - WYMUSZONE WIARYGODNE LICZBY.
+
+    max_concurrency określa, ile komórek macierzy kraj × temat może być
+    analizowanych jednocześnie (1 = tryb sekwencyjny).
     """
 
-    def __init__(self, max_results: int = 5, search_depth: str = "advanced"):
+    SEARCH_FAILED = "Nie udało się pobrać danych z internetu."
+    ANALYSIS_FAILED = "Nie udało się wygenerować analizy."
+
+    def __init__(self, max_results: int = 5, search_depth: str = "advanced", max_concurrency: int = 5):
+
+        self.max_concurrency = max(1, max_concurrency)
 
         # LLM
-        self.llm = ChatOpenAI(
-            model="gpt-4.1",
-            api_key=lambda: config2.OPENAI_API_KEY,
-            temperature=0.2,
-            max_tokens=900,
-        )
+        self.llm = get_chat_model(temperature=0.2, max_tokens=900)
 
-        # Tavily
+        # Tavily (z cache wyników - te same zapytania powtarzają się między scenariuszami)
+        # limiter pod cache: trafienia w cache nie zużywają limitu Tavily
         self.search_tool = TavilySearchResults(
             max_results=max_results,
             search_depth=search_depth,
         )
+        self.search_tool = RateLimitedSearchTool(self.search_tool)
+        if config2.SEARCH_CACHE_ENABLED:
+            self.search_tool = CachedSearchTool(self.search_tool, max_results, search_depth)
 
         # PROMPT Z WYMUSZENIEM LICZB
         self.research_prompt = ChatPromptTemplate.from_messages([
@@ -42,7 +53,7 @@ class ExternalResearchAgent:
                 "Wyjaśniasz, jak wydarzenia w innych krajach wpływają na jego życie: ceny, pracę, "
                 "bezpieczeństwo i stabilność państwa. "
                 "NIE używaj urzędniczego języka. Pisz prosto i konkretnie. "
-                "WOLNO korzystać TYLKO z danych zawartych w wynikach wyszukiwania i scenariuszu. "
+                "WOLNO korzystać TYLKO z danych zawartych w wynikach wyszukiwania, dokumentach analityków i scenariuszu. "
                 "NIE WOLNO wymyślać żadnych faktów ani liczb."
             ),
             (
@@ -53,6 +64,7 @@ class ExternalResearchAgent:
                 "Temat: {subject}\n\n"
                 "Scenariusz sytuacyjny:\n{scenario}\n\n"
                 "Wyniki wyszukiwania (surowe dane):\n{search_results}\n\n"
+                "Fragmenty dokumentów wgranych przez analityków:\n{reference_docs}\n\n"
                 "Zadanie:\n"
                 "- napisz OKOŁO 6 ZDAŃ (5–7 zdań),\n"
                 "- co najmniej 4 zdania mają dotyczyć wpływu na życie mieszkańców Atlantis,\n"
@@ -67,6 +79,40 @@ class ExternalResearchAgent:
             ),
         ])
 
+    @staticmethod
+    def build_query(foreign_country: str, subject: str) -> str:
+        # zapytanie nie zależy od scenariusza - można je współdzielić między scenariuszami
+        return (
+            f"najnowsze informacje o temacie '{subject}' w kraju {foreign_country}, "
+            f"lata 2024-2025, gospodarka, bezpieczeństwo, handel, polityka"
+        )
+
+    def prefetch_searches(
+        self,
+        cells: Iterable[Tuple[str, str]],
+        max_concurrency: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Wykonuje każde unikalne wyszukiwanie (kraj, temat) dokładnie raz.
+        Zwraca słownik znormalizowane zapytanie -> wyniki; zapytania zakończone błędem są pomijane,
+        wtedy analyze_impact spróbuje wyszukać je ponownie.
+        """
+        queries = list(dict.fromkeys(self.build_query(country, subject) for country, subject in cells))
+        workers = max(1, max_concurrency or self.max_concurrency)
+
+        def run_search(query):
+            try:
+                with span("tavily_search"):
+                    return query, self.search_tool.invoke({"query": query})
+            except Exception as e:
+                print(f"❌ Tavily error (prefetch): {e}")
+                return query, None
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="research-search") as executor:
+            fetched = list(executor.map(in_context(run_search), queries))
+
+        return {normalize_query(query): results for query, results in fetched if results is not None}
+
     def analyze_impact(
         self,
         home_country_name: str,
@@ -74,19 +120,19 @@ class ExternalResearchAgent:
         foreign_country: str,
         subject: str,
         scenario: str,
+        search_results: Any = None,
+        reference_docs: str = "",
     ) -> str:
 
-        query = (
-            f"najnowsze informacje o temacie '{subject}' w kraju {foreign_country}, "
-            f"lata 2024-2025, gospodarka, bezpieczeństwo, handel, polityka"
-        )
-
-        # Tavily
-        try:
-            search_results = self.search_tool.invoke({"query": query})
-        except Exception as e:
-            print(f"❌ Tavily error: {e}")
-            return "Nie udało się pobrać danych z internetu."
+        # Tavily (pomijamy, jeśli wyniki zostały pobrane wcześniej przez planer)
+        if search_results is None:
+            query = self.build_query(foreign_country, subject)
+            try:
+                with span("tavily_search"):
+                    search_results = self.search_tool.invoke({"query": query})
+            except Exception as e:
+                print(f"❌ Tavily error: {e}")
+                return self.SEARCH_FAILED
 
         print(f"\n=== [DEBUG] TAVILY: {foreign_country} | {subject} ===")
         try:
@@ -102,6 +148,7 @@ class ExternalResearchAgent:
             subject=subject,
             scenario=scenario,
             search_results=search_results,
+            reference_docs=reference_docs or "(brak)",
         )
 
         try:
@@ -109,7 +156,12 @@ class ExternalResearchAgent:
             return response.content
         except Exception as e:
             print(f"❌ LLM error: {e}")
-            return "Nie udało się wygenerować analizy."
+            return self.ANALYSIS_FAILED
+
+    @classmethod
+    def is_failed(cls, summary: str) -> bool:
+        """Czy analiza komórki jest komunikatem o błędzie (takiej komórki nie zapisujemy w checkpoincie)."""
+        return summary in (cls.SEARCH_FAILED, cls.ANALYSIS_FAILED)
 
     def analyze_matrix_for_scenario(
         self,
@@ -118,33 +170,65 @@ class ExternalResearchAgent:
         scenario: str,
         foreign_countries: List[str],
         subjects: List[str],
+        max_concurrency: Optional[int] = None,
+        search_results: Optional[Dict[str, Any]] = None,
+        reference_docs: Optional[Dict[Tuple[str, str], str]] = None,
+        on_cell_done: Optional[Callable[[str, str, str], None]] = None,
+        completed: Optional[Dict[Tuple[str, str], str]] = None,
     ) -> Dict[str, Dict[str, str]]:
-
-        results: Dict[str, Dict[str, str]] = {}
-
-        for country in foreign_countries:
-            results[country] = {}
-
-            print("\n" + "=" * 100)
-            print(f"🌍 ANALIZA DLA KRAJU: {country}")
-            print("=" * 100)
-
-            for subject in subjects:
-                print("\n" + "#" * 80)
-                print(f"### TEMAT: {subject}")
-                print("#" * 80)
-
+        """
+        Analizuje całą macierz kraj × temat.
+        Komórki są niezależne, więc wykonujemy je równolegle (wyszukiwanie Tavily
+        i wywołanie LLM to operacje sieciowe), maksymalnie `max_concurrency` naraz.
+        Wynik ma zawsze tę samą kolejność kluczy co listy wejściowe.
+        search_results: opcjonalne wyniki z prefetch_searches (zapytanie -> wyniki).
+        reference_docs: opcjonalne fragmenty dokumentów dla komórek ((kraj, temat) -> tekst).
+        on_cell_done: opcjonalny callback (kraj, temat, analiza) wołany po każdej komórce.
+        completed: analizy komórek gotowe wcześniej ((kraj, temat) -> tekst), np. z checkpointu
+        wznawianego zadania - tych komórek nie analizujemy ponownie.
+        """
+
+        search_results = search_results or {}
+        reference_docs = reference_docs or {}
+        completed = completed or {}
+
+        workers = max(1, max_concurrency or self.max_concurrency)
+        cells = [(country, subject) for country in foreign_countries for subject in subjects]
+
+        def run_cell(cell):
+            if cell in completed:
+                return completed[cell]
+            country, subject = cell
+            with span("cell_analysis", country=country, subject=subject):
                 summary = self.analyze_impact(
                     home_country_name=home_country_name,
                     home_context=home_context,
                     foreign_country=country,
                     subject=subject,
                     scenario=scenario,
+                    search_results=search_results.get(normalize_query(self.build_query(country, subject))),
+                    reference_docs=reference_docs.get((country, subject), ""),
                 )
-
-                results[country][subject] = summary
-
-                print("\n--- ANALIZA (~6 zdań, z liczbami jeśli są) ---")
-                print(summary)
-
-        return results
\ No newline at end of file
+            print(f"\n--- ANALIZA {country} | {subject} (~6 zdań, z liczbami jeśli są) ---")
+            print(summary)
+            if on_cell_done is not None:
+                on_cell_done(country, subject, summary)
+            return summary
+
+        print("\n" + "=" * 100)
+        print(f"🌍 ANALIZA MACIERZY: {len(foreign_countries)} krajów × {len(subjects)} tematów "
+              f"(równolegle: {workers})")
+        print("=" * 100)
+
+        if workers == 1 or len(cells) <= 1:
+            summaries = [run_cell(cell) for cell in cells]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="research-cell") as executor:
+                # executor.map zachowuje kolejność wejścia => deterministyczny wynik
+                summaries = list(executor.map(in_context(run_cell), cells))
+
+        results: Dict[str, Dict[str, str]] = {country: {} for country in foreign_countries}
+        for (country, subject), summary in zip(cells, summaries):
+            results[country][subject] = summary
+
+        return results
@@ -1,33 +1,46 @@
+import hashlib
+import itertools
 import logging
 import os
 import json
+import tarfile
 import uuid
+import zipfile
 import threading
 import time
-import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 import datetime
 
 # --- BIBLIOTEKI INFRASTRUKTURALNE ---
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template
-from openai import OpenAI
-from google.cloud import storage
-from google.cloud.sql.connector import Connector, IPTypes
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 import sqlalchemy
 import pg8000
-import pdfplumber
 import numpy as np
-from pypdf import PdfReader
+import tiktoken
 
 # --- BIBLIOTEKI ML/CHUNKOWANIA ---
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from safety_agent import safety_agent
+from safety_agent import safety_pass
 from external_research_agent_2 import ExternalResearchAgent
 from predictive_impact_agent import PredictiveImpactAgent
 from summary_brief_agent import SummaryBriefAgent
 from summary_report_agent import SummaryReportAgent
 from scenario_agent_with_verificator import scenario_agent_with_verificator
+from llm_cache import init_llm_cache
+from llm_clients import get_openai_client
+from rate_limiter import limiter_stats
+from research_planner import plan_searches
+from document_retriever import DocumentRetriever
+from vector_search import VectorSearch
+from local_vector_store import LocalVectorStore
+from text_chunker import iter_file_blocks, iter_text_chunks
+from pdf_extraction import iter_pdf_text_to_file
+from job_store import JobCheckpoints, PostgresJobStore, SQLiteJobStore
+from job_scheduler import JobScheduler, SchedulerSaturated
+from job_events import JobEventBus, stream_job_events
+from ingest_pipeline import Pipeline, Stage, get_pipeline_stats
+from tracing import METRICS, end_trace, get_trace_summary, in_context, span, start_trace
 
 # Ładowanie zmiennych środowiskowych z pliku .env
 load_dotenv()
@@ -48,18 +61,74 @@ SQL_USER = os.environ.get("SQL_USER")
 SQL_PASSWORD = os.environ.get("SQL_PASSWORD")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")  # Konieczne dla klienta OpenAI
 
+# Maksymalna liczba równoległych komórek (kraj × temat) analizowanych w jednym scenariuszu
+RESEARCH_CELL_CONCURRENCY = int(os.environ.get("RESEARCH_CELL_CONCURRENCY", 5))
+# Maksymalna liczba scenariuszy przetwarzanych równolegle w jednym zadaniu /research
+SCENARIO_CONCURRENCY = int(os.environ.get("SCENARIO_CONCURRENCY", 3))
+REPORT_CHUNK_CHARS = int(os.environ.get("REPORT_CHUNK_CHARS", 200))
+
+# Embeddingi: wiele fragmentów w jednym żądaniu, ograniczone liczbą tokenów i elementów
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get("EMBEDDING_BATCH_MAX_TOKENS", 50000))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.environ.get("EMBEDDING_BATCH_MAX_ITEMS", 256))
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", 3))
+
+# Retrieval z wgranych dokumentów (pgvector): liczba fragmentów i budżet tokenów na jeden prompt
+RAG_ENABLED = os.environ.get("RAG_ENABLED", "1") == "1"
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", 4))
+RAG_TOKEN_BUDGET = int(os.environ.get("RAG_TOKEN_BUDGET", 1500))
+
+# Magazyn wektorów: "pgvector" (Cloud SQL) albo "local" (memmap .npy + SQLite, bez sieci)
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "pgvector" if SQL_CONNECTION_NAME else "local")
+LOCAL_VECTOR_STORE_DIR = os.environ.get("LOCAL_VECTOR_STORE_DIR", os.path.join(os.path.dirname(__file__), "vector_store"))
+
+# Indeks ANN na documents.embedding ("hnsw", "ivfflat" lub "none") i strojenie zapytań
+VECTOR_INDEX_METHOD = os.environ.get("VECTOR_INDEX_METHOD", "hnsw")
+VECTOR_EF_SEARCH = int(os.environ["VECTOR_EF_SEARCH"]) if os.environ.get("VECTOR_EF_SEARCH") else None
+VECTOR_PROBES = int(os.environ["VECTOR_PROBES"]) if os.environ.get("VECTOR_PROBES") else None
+
+# Magazyn zadań: "postgres" (wspólny dla wielu instancji) albo "sqlite" (pojedyncza instancja)
+JOB_STORE_BACKEND = os.environ.get("JOB_STORE_BACKEND", "postgres" if SQL_CONNECTION_NAME else "sqlite")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join(os.path.dirname(__file__), "jobs", "jobs.sqlite"))
+JOB_TTL_SECONDS = float(os.environ.get("JOB_TTL_SECONDS", 7 * 24 * 3600))
+
+# Pula workerów: ile zadań danego typu działa naraz i ile może czekać w kolejce (potem 429)
+RESEARCH_WORKERS = int(os.environ.get("RESEARCH_WORKERS", 2))
+RESEARCH_MAX_QUEUED = int(os.environ.get("RESEARCH_MAX_QUEUED", 10))
+# priorytet z żądania /research: 0 (domyślny, najwcześniej) .. RESEARCH_PRIORITY_MAX - klient
+# może tylko ustąpić innym zadaniom, nie wyprzedzić kolejki
+RESEARCH_PRIORITY_MAX = int(os.environ.get("RESEARCH_PRIORITY_MAX", 9))
+# zadanie "running" bez aktualizacji przez ten czas uznajemy za przerwane (np. restart instancji)
+RESUME_STALE_SECONDS = float(os.environ.get("RESUME_STALE_SECONDS", 300))
+EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", 2))
+EMBEDDING_MAX_QUEUED = int(os.environ.get("EMBEDDING_MAX_QUEUED", 50))
+# potok wgrywania: pojemność kolejek między etapami i liczba wątków etapów embeddingu i zapisu
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 8))
+INGEST_EMBED_WORKERS = int(os.environ.get("INGEST_EMBED_WORKERS", 4))
+INGEST_WRITE_WORKERS = int(os.environ.get("INGEST_WRITE_WORKERS", 2))
+# limity /upload/bulk: liczba plików i łączny rozmiar po rozpakowaniu (chroni też przed "bombami" zip)
+BULK_MAX_FILES = int(os.environ.get("BULK_MAX_FILES", 1000))
+BULK_MAX_TOTAL_BYTES = int(os.environ.get("BULK_MAX_TOTAL_BYTES", 2 * 1024 ** 3))
+# co ile stron PDF wysyłamy zdarzenie extraction_progress
+EXTRACTION_PROGRESS_PAGES = int(os.environ.get("EXTRACTION_PROGRESS_PAGES", 10))
+
 DB_ENGINE = None
-research_queue = {}
+VECTOR_STORE = None
+JOB_STORE = None
+EVENTS = JobEventBus()
+SCHEDULER = JobScheduler(
+    concurrency={"research": RESEARCH_WORKERS, "embedding": EMBEDDING_WORKERS},
+    max_queued={"research": RESEARCH_MAX_QUEUED, "embedding": EMBEDDING_MAX_QUEUED},
+)
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-try:
-    client_openai = OpenAI()
-    client_gcs = storage.Client()
-    connector = Connector()
-except Exception as e:
-    logging.error(f"Błąd inicjalizacji klientów usług: {e}")
-    # Aplikacja wystartuje, ale operacje na chmurze będą niemożliwe
+# klienty usług i cache LLM tworzymy leniwie, nie przy imporcie: procesy puli PDF (tryb spawn)
+# importują moduł główny jako __mp_main__ i nie mogą otwierać połączeń ani cache
+SQL_CONNECTOR = None
+GCS_CLIENT = None
+LLM_CACHE = None
+_services_lock = threading.Lock()
 
 app = Flask(__name__)
 
@@ -121,107 +190,450 @@ dług publiczny w okolicach średniej unijnej
 # === FUNKCJE DB I EMBEDDINGU (LangChain, GCS, SQL) ===
 # =======================================================
 
+def get_sql_connector():
+    global SQL_CONNECTOR
+    with _services_lock:
+        if SQL_CONNECTOR is None:
+            from google.cloud.sql.connector import Connector
+            SQL_CONNECTOR = Connector()
+        return SQL_CONNECTOR
+
+def get_gcs_client():
+    global GCS_CLIENT
+    with _services_lock:
+        if GCS_CLIENT is None:
+            from google.cloud import storage
+            GCS_CLIENT = storage.Client()
+        return GCS_CLIENT
+
+def ensure_llm_cache():
+    """Globalny cache LangChain (init_llm_cache) - przed pierwszym wywołaniem agentów."""
+    global LLM_CACHE
+    with _services_lock:
+        if LLM_CACHE is None:
+            try:
+                LLM_CACHE = init_llm_cache()
+            except Exception as e:
+                logging.error(f"Błąd inicjalizacji cache LLM: {e}")
+        return LLM_CACHE
+
 def init_db_engine():
     global DB_ENGINE
     if DB_ENGINE is not None: return DB_ENGINE
     try:
+        from google.cloud.sql.connector import IPTypes
+
         def getconn() -> pg8000.dbapi.Connection:
-            conn = connector.connect(SQL_CONNECTION_NAME, "pg8000", user=SQL_USER, password=SQL_PASSWORD, db=SQL_DATABASE, ip_type=IPTypes.PUBLIC)
+            conn = get_sql_connector().connect(SQL_CONNECTION_NAME, "pg8000", user=SQL_USER, password=SQL_PASSWORD, db=SQL_DATABASE, ip_type=IPTypes.PUBLIC)
             return conn
         DB_ENGINE = sqlalchemy.create_engine("postgresql+pg8000://", creator=getconn, pool_pre_ping=True, pool_size=5, max_overflow=2, pool_timeout=30, pool_recycle=1800)
         return DB_ENGINE
     except Exception as e:
         logging.error(f"Błąd inicjalizacji Engine'u SQLAlchemy: {e}"); DB_ENGINE = None; raise e
 
-def get_chunks_from_text(text, chunk_size=1000, overlap=100):
-    if not text: return []
-    cleaned_text = re.sub(r'\s+', ' ', text).strip()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap, length_function=len, separators=["\n\n", "\n", " ", ""])
-    return text_splitter.split_text(cleaned_text)
-
 def generate_embedding(text_content):
-    response = client_openai.embeddings.create(input=text_content, model="text-embedding-ada-002")
+    response = get_openai_client().embeddings.create(input=text_content, model=EMBEDDING_MODEL)
     return response.data[0].embedding
 
-def save_embedding_to_db(engine, filename, chunk_text, embedding_vector):
-    vector_string = '[' + ','.join(map(str, embedding_vector)) + ']'
-    insert_query_template = f"""
-        INSERT INTO documents (filename, content, embedding, created_at) 
-        VALUES (:filename, :content, '{vector_string}'::vector, now())
+_embedding_encoding = None
+
+def count_embedding_tokens(text):
+    global _embedding_encoding
+    if _embedding_encoding is None:
+        try:
+            _embedding_encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        except Exception as e:
+            # tiktoken pobiera słownik BPE z sieci - offline szacujemy ok. 4 znaki na token
+            logging.warning(f"Brak kodowania tiktoken ({e}), liczba tokenów będzie szacowana.")
+            _embedding_encoding = False
+    if _embedding_encoding is False:
+        return len(text) // 4 + 1
+    return len(_embedding_encoding.encode(text, disallowed_special=()))
+
+def iter_embedding_batches(chunks, max_tokens=EMBEDDING_BATCH_MAX_TOKENS, max_items=EMBEDDING_BATCH_MAX_ITEMS):
+    """Dzieli strumień fragmentów (TextChunk) na paczki mieszczące się w limicie tokenów i liczby elementów."""
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = count_embedding_tokens(chunk.text)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def generate_embeddings_batch(texts, max_retries=EMBEDDING_MAX_RETRIES):
+    """
+    Jedno żądanie embeddings.create dla całej paczki. Przy błędzie ponawiamy z backoffem,
+    a jeśli paczka dalej nie przechodzi - dzielimy ją na pół i ponawiamy osobno każdą część.
+    """
+    for attempt in range(max_retries):
+        try:
+            response = get_openai_client().embeddings.create(input=texts, model=EMBEDDING_MODEL)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            logging.warning(f"Błąd embeddingu paczki ({len(texts)} fragmentów), próba {attempt + 1}/{max_retries}: {e}")
+            if attempt < max_retries - 1:
+                time.sleep(2 ** attempt)
+            elif len(texts) == 1:
+                raise
+
+    middle = len(texts) // 2
+    return generate_embeddings_batch(texts[:middle], max_retries) + generate_embeddings_batch(texts[middle:], max_retries)
+
+def get_job_store():
+    global JOB_STORE
+    if JOB_STORE is not None: return JOB_STORE
+    if JOB_STORE_BACKEND == "postgres":
+        JOB_STORE = PostgresJobStore(init_db_engine(), ttl_seconds=JOB_TTL_SECONDS)
+    else:
+        JOB_STORE = SQLiteJobStore(JOB_STORE_PATH, ttl_seconds=JOB_TTL_SECONDS)
+    return JOB_STORE
+
+def get_vector_store():
+    """
+    Magazyn wektorów z interfejsem save_batch / search / file_exists / find_file / find_embeddings.
+    Schemat i indeksy pgvector przygotowuje prepare_vector_store przy starcie serwera.
+    """
+    global VECTOR_STORE
+    if VECTOR_STORE is not None: return VECTOR_STORE
+    if VECTOR_STORE_BACKEND == "local":
+        VECTOR_STORE = LocalVectorStore(LOCAL_VECTOR_STORE_DIR)
+    else:
+        VECTOR_STORE = VectorSearch(init_db_engine())
+    return VECTOR_STORE
+
+def prepare_vector_store():
+    """
+    Przy starcie serwera (poza żądaniami): kolumny z hashami od razu - zapis fragmentów ich wymaga,
+    a dodanie kolumny bez wartości domyślnej jest natychmiastowe; indeksy (ANN i pomocnicze)
+    w tle - CREATE INDEX CONCURRENTLY na dużej tabeli trwa długo, ale nie blokuje zapisu,
+    a do końca budowy wyszukiwanie jest po prostu wolniejsze. To samo: `python vector_search.py create`.
+    """
+    if VECTOR_STORE_BACKEND == "local":
+        return
+    vector_search = get_vector_store()
+    try:
+        vector_search.ensure_schema()
+    except Exception as e:
+        logging.error(f"Nie udało się dodać kolumn z hashami do tabeli documents: {e}")
+
+    def build_indexes():
+        try:
+            vector_search.ensure_index(None if VECTOR_INDEX_METHOD == "none" else VECTOR_INDEX_METHOD)
+        except Exception as e:
+            logging.error(f"Nie udało się utworzyć indeksów tabeli documents: {e}")
+
+    threading.Thread(target=build_indexes, daemon=True, name="vector-index").start()
+
+def search_similar_chunks(query_vector, k, filenames=None):
+    """Najbliższe fragmenty (odległość kosinusowa), opcjonalnie tylko w wybranych plikach."""
+    return get_vector_store().search(
+        query_vector, k, filenames=filenames, ef_search=VECTOR_EF_SEARCH, probes=VECTOR_PROBES,
+    )
+
+def build_document_retriever(context_filenames=None):
     """
-    insert_query = sqlalchemy.text(insert_query_template)
-    with engine.connect() as conn:
-        conn.execute(insert_query, {"filename": filename, "content": chunk_text}); conn.commit()
+    Retriever fragmentów dokumentów dla /research. Bez context_files przeszukujemy cały magazyn;
+    gdy nie ma w nim nic do znalezienia (pusty magazyn albo wybrane pliki bez fragmentów),
+    zwracamy None - inaczej każde zadanie embeddowałoby zapytania wszystkich komórek na próżno.
+    """
+    if not RAG_ENABLED:
+        return None
+    try:
+        if not get_vector_store().has_documents(context_filenames):
+            logging.info("Brak fragmentów dokumentów do wyszukania - pomijamy retrieval.")
+            return None
+    except Exception as e:
+        logging.warning(f"Nie udało się sprawdzić magazynu wektorów - pomijamy retrieval: {e}")
+        return None
+    return DocumentRetriever(
+        embed_batch=generate_embeddings_batch,
+        search=search_similar_chunks,
+        count_tokens=count_embedding_tokens,
+        k=RAG_TOP_K,
+        token_budget=RAG_TOKEN_BUDGET,
+        filenames=context_filenames,
+    )
 
-def check_if_file_exists_in_db(filename):
-    engine = init_db_engine()
-    select_query = sqlalchemy.text("SELECT COUNT(*) FROM documents WHERE filename = :filename")
+def find_file_in_db(file_hash):
+    """Nazwa pliku o tej samej treści, który jest już w bazie (None, jeśli nie ma)."""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(select_query, {"filename": filename}).scalar()
-        return result > 0
+        return get_vector_store().find_file(file_hash)
     except Exception as e:
-        logging.error(f"Błąd podczas sprawdzania istnienia pliku w DB: {e}"); return False
+        logging.error(f"Błąd podczas sprawdzania istnienia pliku w DB: {e}"); return None
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cell_checkpoint_key(index, country, subject):
+    return f"cell:{index}:{country}:{subject}"
+
+
+def run_engine(scenarios_raw, context_filenames=None, on_event=None, checkpoints=None):
+    """
+    context_filenames: nazwy plików kontekstowych w tabeli documents - retrieval szuka tylko w nich.
+    on_event: opcjonalny callback (nazwa_zdarzenia, dane) - postęp etapów dla strumienia SSE.
+    checkpoints: opcjonalny JobCheckpoints - wyniki etapów (scenariusz po przygotowaniu, każda komórka,
+    scenariusz z predykcją, raport) są zapisywane na bieżąco; przy wznowieniu zadania
+    wykonywane jest tylko to, czego brakuje.
+    """
+    ensure_llm_cache()
+
+    def emit(event, **data):
+        if on_event is not None:
+            on_event(event, data)
 
+    saved = checkpoints.load() if checkpoints is not None else {}
 
-def run_engine(scenarios_raw, textfiles):
-    external_agent = ExternalResearchAgent()
+    def checkpoint(key, value):
+        if checkpoints is None:
+            return
+        try:
+            checkpoints.save(key, value)
+        except Exception as e:
+            # brak checkpointu nie może przerwać analizy - najwyżej wznowienie powtórzy krok
+            logging.warning(f"Nie udało się zapisać checkpointu {key}: {e}")
+
+    progress_lock = threading.Lock()
+    progress = {"completed": 0, "total": 0}
+
+    retriever = build_document_retriever(context_filenames)
+    external_agent = ExternalResearchAgent(max_concurrency=RESEARCH_CELL_CONCURRENCY)
     predictive_agent = PredictiveImpactAgent()
     summary_agent = SummaryReportAgent()
     brief_agent = SummaryBriefAgent()
 
-    all_external_results_per_scenario = []
+    def is_prepared(index, scenario):
+        restored = saved.get(f"prepare:{index}")
+        return restored is not None and restored.get("scenario") == scenario
+
+    # SAFETY: jeden przebieg dla kontekstu i wszystkich scenariuszy (zamiast wywołania na scenariusz);
+    # działa równolegle z agentami scenariuszy, scenariusze odtworzone z checkpointów pomijamy
+    pending_safety = [
+        (index, scenario) for index, (scenario, _) in enumerate(scenarios_raw) if not is_prepared(index, scenario)
+    ]
+
+    @in_context
+    def run_safety_pass():
+        with span("safety_agent", texts=len(pending_safety) + 1):
+            sanitized_context, sanitized_scenarios = safety_pass(user_prompt, [s for _, s in pending_safety])
+        return sanitized_context, {index: text for (index, _), text in zip(pending_safety, sanitized_scenarios)}
+
+    safety_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="safety")
+    safety_future = safety_executor.submit(run_safety_pass) if pending_safety else None
+    safety_executor.shutdown(wait=False)
+
+    def prepare_scenario(index, scenario, weight):
+        restored = saved.get(f"prepare:{index}")
+        if is_prepared(index, scenario):
+            emit("scenario_prepared", scenario_index=index, countries=restored["countries"],
+                 subjects=restored["subjects"], restored=True)
+            return restored
 
-    for scenario, weight in scenarios_raw:
         logging.info(f"Rozpoczynanie analizy scenariusza (waga={weight}): {scenario[:50]}...")
+        emit("scenario_started", scenario_index=index, scenario=scenario[:200], weight=weight)
 
-        resp = scenario_agent_with_verificator(user_prompt, scenario, weight)
+        with span("scenario_agent"):
+            resp = scenario_agent_with_verificator(user_prompt, scenario, weight)
 
         if isinstance(resp, dict) and "countries" in resp and "subjects" in resp:
             countries = resp["countries"]
             subjects = resp["subjects"]
         else:
             logging.error(f"❌ BŁĘDNA STRUKTURA z scenario_agent dla: {scenario[:30]}")
-            continue
+            emit("scenario_failed", scenario_index=index)
+            return None
+
+        sanitized_user_prompt, sanitized_scenarios = safety_future.result()
+        sanitized_scenario = sanitized_scenarios[index]
+        if sanitized_user_prompt is None or sanitized_scenario is None:
+            logging.error(f"❌ Safety agent nie zredagował scenariusza: {scenario[:30]}")
+            emit("scenario_failed", scenario_index=index)
+            return None
+        emit("scenario_prepared", scenario_index=index, countries=countries, subjects=subjects)
+
+        spec = {
+            "index": index,
+            "scenario": scenario,
+            "weight": weight,
+            "countries": countries,
+            "subjects": subjects,
+            "sanitized_user_prompt": sanitized_user_prompt,
+            "sanitized_scenario": sanitized_scenario,
+        }
+        checkpoint(f"prepare:{index}", spec)
+        return spec
+
+    def restored_cells(spec):
+        return {
+            (country, subject): saved[cell_checkpoint_key(spec["index"], country, subject)]
+            for country in spec["countries"]
+            for subject in spec["subjects"]
+            if cell_checkpoint_key(spec["index"], country, subject) in saved
+        }
+
+    def on_cell_done(spec, country, subject, summary):
+        if not ExternalResearchAgent.is_failed(summary):
+            checkpoint(cell_checkpoint_key(spec["index"], country, subject), summary)
+        with progress_lock:
+            progress["completed"] += 1
+            completed = progress["completed"]
+        emit(
+            "cell_completed", scenario_index=spec["index"], country=country, subject=subject,
+            summary=summary, completed=completed, total=progress["total"],
+        )
 
-        sanitized_user_prompt, sanitized_scenario = safety_agent(user_prompt, scenario)
+    def analyze_scenario(spec, search_results):
+        restored = saved.get(f"scenario:{spec['index']}")
+        if restored is not None:
+            return restored
+
+        # fragmenty wgranych dokumentów: dla całego scenariusza (predykcja) i dla każdej komórki
+        scenario_docs, cell_docs = "", {}
+        if retriever is not None:
+            with span("retrieval"):
+                scenario_docs = retriever.for_scenario(spec["sanitized_scenario"])
+                cell_docs = retriever.for_cells(
+                    spec["sanitized_scenario"],
+                    [(country, subject) for country in spec["countries"] for subject in spec["subjects"]],
+                )
 
         external_results = external_agent.analyze_matrix_for_scenario(
             home_country_name=HOME_COUNTRY_NAME,
-            home_context=sanitized_user_prompt,
-            scenario=sanitized_scenario,
-            foreign_countries=countries,
-            subjects=subjects,
-        )
-
-        predictions = predictive_agent.predict_for_scenario(
-            home_context=sanitized_user_prompt,
-            scenario=sanitized_scenario,
-            external_results=external_results,
+            home_context=spec["sanitized_user_prompt"],
+            scenario=spec["sanitized_scenario"],
+            foreign_countries=spec["countries"],
+            subjects=spec["subjects"],
+            search_results=search_results,
+            reference_docs=cell_docs,
+            on_cell_done=lambda country, subject, summary: on_cell_done(spec, country, subject, summary),
+            completed=restored_cells(spec),
         )
 
-        all_external_results_per_scenario.append({
-            "scenario": scenario,
-            "weight": weight,
-            "countries": countries,
-            "subjects": subjects,
+        with span("prediction"):
+            predictions = predictive_agent.predict_for_scenario(
+                home_context=spec["sanitized_user_prompt"],
+                scenario=spec["sanitized_scenario"],
+                external_results=external_results,
+                reference_docs=scenario_docs,
+            )
+        emit("prediction_done", scenario_index=spec["index"], predictions=predictions)
+
+        result = {
+            "scenario": spec["scenario"],
+            "weight": spec["weight"],
+            "countries": spec["countries"],
+            "subjects": spec["subjects"],
             "external_results": external_results,
             "predictions": predictions,
-        })
+        }
+        if predictions is not None:
+            checkpoint(f"scenario:{spec['index']}", result)
+        return result
+
+    # Scenariusze są niezależne aż do raportu zbiorczego - uruchamiamy je równolegle.
+    # executor.map czeka na wszystkie (bariera) i zachowuje kolejność wejścia.
+    workers = max(1, min(SCENARIO_CONCURRENCY, len(scenarios_raw)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scenario") as executor:
+        # ETAP 1: kraje/tematy dla każdego scenariusza (+ wynik wspólnego przebiegu safety)
+        specs = [
+            s for s in executor.map(in_context(lambda item: prepare_scenario(item[0], *item[1])), enumerate(scenarios_raw))
+            if s is not None
+        ]
+
+        # ETAP 2: planer - każde unikalne wyszukiwanie (kraj, temat) wykonujemy raz na całe zadanie;
+        # komórki odtworzone z checkpointów nie wymagają wyszukiwania
+        completed_cells = {
+            (spec["index"], country, subject)
+            for spec in specs
+            for country in spec["countries"]
+            for subject in spec["subjects"]
+            if f"scenario:{spec['index']}" in saved or cell_checkpoint_key(spec["index"], country, subject) in saved
+        }
+        search_plan = plan_searches(specs, completed_cells)
+        logging.info(
+            f"Plan wyszukiwań: {search_plan.total_cells} komórek, "
+            f"{search_plan.distinct_searches} unikalnych wyszukiwań (dedup={search_plan.dedup_ratio})"
+        )
+        progress["total"] = search_plan.total_cells
+        progress["completed"] = search_plan.completed_cells
+        if any(key != "input" for key in saved):
+            emit("resumed", completed_cells=search_plan.completed_cells, total_cells=search_plan.total_cells)
+        emit("search_plan", **search_plan.to_dict())
+        search_results = external_agent.prefetch_searches(search_plan.cells)
+
+        # ETAP 3: analizy komórek (zależne od scenariusza) i predykcje
+        all_external_results_per_scenario = list(
+            executor.map(in_context(lambda spec: analyze_scenario(spec, search_results)), specs)
+        )
 
     # ZAPIS SUROWYCH DANYCH
     with open("external_results.json", "w", encoding="utf-8") as f:
         json.dump(all_external_results_per_scenario, f, ensure_ascii=False, indent=2)
 
-    # RAPORT ZBIORCZY
-    final_report = summary_agent.build_global_report(
+    # RAPORT ZBIORCZY - strumieniowo; fragmenty łączymy w paczki (~REPORT_CHUNK_CHARS znaków),
+    # żeby nie zalać historii zdarzeń SSE pojedynczymi tokenami
+    emit("report_started")
+    report_parts, pending = [], []
+    brief_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="brief")
+    brief_future = None
+
+    @in_context
+    def build_brief(report_text, partial):
+        # KRÓTKIE STRESZCZENIE (250–300 słów)
+        emit("brief_started", partial_report=partial)
+        brief_parts = []
+        with span("brief"):
+            for chunk in brief_agent.stream_brief_summary(report_text):
+                brief_parts.append(chunk)
+                emit("brief_chunk", text=chunk)
+        return "".join(brief_parts)
+
+    # raport z checkpointu wznawianego zadania zwracamy jako jeden fragment
+    report_stream = [saved["report"]] if "report" in saved else summary_agent.stream_global_report(
         home_context=user_prompt,
         scenarios_data=all_external_results_per_scenario,
     )
 
-
-    # KRÓTKIE STRESZCZENIE (250–300 słów)
-    brief_summary = brief_agent.build_brief_summary(final_report)
+    try:
+        with span("report"):
+            for chunk in report_stream:
+                report_parts.append(chunk)
+                pending.append(chunk)
+                if sum(len(p) for p in pending) >= REPORT_CHUNK_CHARS:
+                    emit("report_chunk", text="".join(pending))
+                    pending = []
+
+                # gdy po rekomendacjach zaczyna się kolejna sekcja, streszczenie startuje równolegle
+                # z dopisywaniem końcówki raportu (sprawdzamy tylko na końcach linii); inaczej po strumieniu
+                if brief_future is None and "\n" in chunk and SummaryBriefAgent.is_report_ready("".join(report_parts)):
+                    brief_future = brief_executor.submit(build_brief, "".join(report_parts), True)
+
+        if pending:
+            emit("report_chunk", text="".join(pending))
+        final_report = "".join(report_parts)
+        emit("report_done", length=len(final_report))
+        # błąd w trakcie strumienia przerywa zadanie przed tym miejscem - niepełny raport nie trafia
+        # do checkpointu, więc /resume wygeneruje go od nowa
+        if "report" not in saved and final_report != SummaryReportAgent.FALLBACK_REPORT:
+            checkpoint("report", final_report)
+
+        if brief_future is None:
+            brief_future = brief_executor.submit(build_brief, final_report, False)
+        brief_summary = brief_future.result()
+    finally:
+        brief_executor.shutdown(wait=False)
+    emit("brief_done", brief_summary=brief_summary)
     with open("raport_atlantis.md", "w", encoding="utf-8") as f:
         f.write(final_report)
 
@@ -230,60 +642,333 @@ def run_engine(scenarios_raw, textfiles):
         "raw_data": all_external_results_per_scenario,
         "final_report": final_report,
         "brief_summary": brief_summary,
-        "context_files_used": textfiles,
+        "context_files_used": context_filenames or [],
+        "llm_cache": LLM_CACHE.stats() if LLM_CACHE else None,
+        "rate_limits": limiter_stats(),
+        "search_plan": search_plan.to_dict(),
     }
 
 
-def embed_chunks_to_db_worker(file_id, original_filename, text_content):
-    job = research_queue.get(file_id)
-    if job:
-        job['status'] = 'processing_embedding'
+def iter_uploaded_text(job_id, file_id, source_path):
+    """
+    Tekst wgranego pliku kawałkami; na końcu leży w UPLOAD_DIR/<file_id>.txt (/research sprawdza go dla context_files).
+    PDF jest parsowany w puli procesów i zapisywany strumieniowo - kolejne strony parsują się w tle,
+    gdy wcześniejsze są już chunkowane i embeddowane. Plik TXT jest już na miejscu.
+    Zdarzenia trafiają do zadania job_id (przy wgrywaniu zbiorczym jedno zadanie obejmuje wiele plików).
+    """
+    txt_path = os.path.join(UPLOAD_DIR, file_id + ".txt")
+    if source_path == txt_path:
+        yield from iter_file_blocks(txt_path)
+        return
+
+    started = time.monotonic()
+    pages = 0
+    try:
+        for block in iter_pdf_text_to_file(source_path, txt_path):
+            pages += 1
+            if pages % EXTRACTION_PROGRESS_PAGES == 0:
+                EVENTS.publish(job_id, 'extraction_progress', {'file_id': file_id, 'pages': pages})
+            yield block
+    except Exception as e:
+        raise RuntimeError(f"Błąd przetwarzania PDF: {e}") from e
+    finally:
+        os.remove(source_path)
+
+    logging.info(f"Wyodrębniono tekst z {pages} stron PDF ({file_id}) w {time.monotonic() - started:.1f} s.")
+    EVENTS.publish(job_id, 'extraction_done', {'file_id': file_id, 'pages': pages})
+
+
+def run_ingest_pipeline(job_id, documents):
+    """
+    Potok wgrywania dokumentów (ingest_pipeline): ekstrakcja -> chunkowanie -> embedding -> zapis,
+    z ograniczonymi kolejkami między etapami - embedding (sieć) i zapis (baza) działają jednocześnie.
+    documents: lista {"id", "filename", "source_path", "file_hash"}; fragmenty kolejnych dokumentów
+    idą wspólnymi paczkami embeddingu. Fragmenty, których treść (hash) jest już w bazie, dostają
+    zapisany wektor bez wywołania API. Błąd ekstrakcji jednego dokumentu nie przerywa pozostałych -
+    trafia do jego liczników ("error"); jego zapisane fragmenty usuwa finalize_documents.
+    Zwraca (statystyki etapów, liczniki per dokument).
+    """
+    jobs = get_job_store()
+    store = get_vector_store()
+    by_id = {document["id"]: document for document in documents}
+    counters = {document["id"]: {"processed": 0, "embedded": 0, "error": None} for document in documents}
+    totals = {"processed": 0, "extracted": 0, "embedding_started": False}
+    lock = threading.Lock()
+
+    def report_progress():
+        # przy wielu plikach postęp zbiorczy: pliki po ekstrakcji i zapisane fragmenty
+        with lock:
+            processed, extracted = totals["processed"], totals["extracted"]
+        if len(documents) > 1:
+            jobs.update(job_id, progress=f"{extracted}/{len(documents)} plików, {processed} fragmentów")
+        else:
+            jobs.update(job_id, progress=f"{processed}/?")
+
+    def extract():
+        jobs.update(job_id, status='processing_extraction')
+        for document in documents:
+            try:
+                for block in iter_uploaded_text(job_id, document["id"], document["source_path"]):
+                    yield document["id"], block
+            except Exception as e:
+                logging.error(f"Błąd ekstrakcji pliku {document['filename']}: {e}")
+                counters[document["id"]]["error"] = str(e)
+                EVENTS.publish(job_id, 'file_failed', {'file_id': document["id"], 'error': str(e)})
+                continue
+            with lock:
+                totals["extracted"] += 1
+            if len(documents) > 1:
+                EVENTS.publish(job_id, 'file_extracted', {'file_id': document["id"], 'filename': document["filename"]})
+                report_progress()
+
+    def chunk(items):
+        # dokumenty przychodzą po kolei - chunker działa osobno dla każdego, paczki są wspólne
+        chunks = itertools.chain.from_iterable(
+            iter_text_chunks((block for _, block in blocks), chunk_size=1000, overlap=100, source=document_id)
+            for document_id, blocks in itertools.groupby(items, key=lambda item: item[0])
+        )
+        return iter_embedding_batches(chunks)
+
+    def embed(batch):
+        with lock:
+            if not totals["embedding_started"]:
+                totals["embedding_started"] = True
+                jobs.update(job_id, status='processing_embedding')
+        hashes = [hash_text(chunk.text) for chunk in batch]
+        vectors = store.find_embeddings(list(set(hashes)))
+        missing = {content_hash: chunk for content_hash, chunk in zip(hashes, batch) if content_hash not in vectors}
+        if missing:
+            with span("embedding_batch"):
+                vectors.update(zip(missing, generate_embeddings_batch([chunk.text for chunk in missing.values()])))
+            with lock:
+                for chunk in missing.values():
+                    counters[chunk.source]["embedded"] += 1
+        return [(batch, hashes, vectors)]
+
+    def write(item):
+        batch, hashes, vectors = item
+        with span("vector_store_save"):
+            store.save_batch([
+                (by_id[chunk.source]["filename"], chunk.text, vectors[content_hash], content_hash, by_id[chunk.source]["file_hash"])
+                for chunk, content_hash in zip(batch, hashes)
+            ])
+        with lock:
+            for chunk in batch:
+                counters[chunk.source]["processed"] += 1
+            totals["processed"] += len(batch)
+            processed = totals["processed"]
+        report_progress()
+        EVENTS.publish(job_id, 'embedding_progress', {'completed': processed, 'page': batch[-1].page_end})
+
+    pipeline = Pipeline(job_id, extract(), [
+        Stage("chunking", chunk, stream=True, queue_size=INGEST_QUEUE_SIZE),
+        Stage("embedding", embed, workers=INGEST_EMBED_WORKERS, queue_size=INGEST_QUEUE_SIZE, size=len),
+        Stage(
+            "vector_store_save", write, workers=INGEST_WRITE_WORKERS, queue_size=INGEST_QUEUE_SIZE,
+            size=lambda item: len(item[0]),
+        ),
+    ], source_name="extraction")
+    return pipeline.run(), counters
+
+
+def finalize_documents(documents, counters):
+    """
+    Domknięcie dokumentów po potoku: kompletny dokument zastępuje poprzednią wersję pliku
+    o tej samej nazwie (dopiero teraz - wyszukiwanie nie widzi luki), a fragmenty dokumentu,
+    którego ekstrakcja się nie udała, są usuwane. Zwraca wynik per dokument.
+    """
+    store = get_vector_store()
+    results = []
+    with span("vector_store_save"):
+        for document in documents:
+            counter = counters[document["id"]]
+            replaced = 0
+            if counter["error"] is not None:
+                store.delete_file_content(document["filename"], document["file_hash"])
+                remove_uploaded_files(document)
+            else:
+                replaced = store.delete_file_versions(document["filename"], document["file_hash"])
+            results.append({
+                "file_id": document["id"],
+                "filename": document["filename"],
+                "chunks_processed": counter["processed"],
+                "chunks_embedded": counter["embedded"],
+                "chunks_reused": counter["processed"] - counter["embedded"],
+                "chunks_replaced": replaced,
+                "error": counter["error"],
+            })
+    return results
+
+
+def embed_chunks_to_db_worker(file_id, original_filename, source_path, file_hash):
+    """
+    Ekstrakcja, chunkowanie i zapis embeddingów pliku (run_ingest_pipeline). Nowa wersja pliku
+    o tej samej nazwie embeddinguje tylko zmienione fragmenty, a fragmenty poprzedniej wersji
+    są na końcu usuwane.
+    """
+    jobs = get_job_store()
+    start_trace(file_id)
 
     logging.info(f"Start przetwarzania embeddingu dla pliku: {original_filename}")
+    documents = [{"id": file_id, "filename": original_filename, "source_path": source_path, "file_hash": file_hash}]
 
     try:
         if GCS_BUCKET_NAME:
             logging.warning("Pomięto zapis do GCS - brakuje implementacji GCS w tym bloku kodu.")
 
-        chunks = get_chunks_from_text(text_content, chunk_size=1000, overlap=100)
-        logging.info(f"Plik podzielony na {len(chunks)} fragmentów (LangChain).")
+        pipeline_stats, counters = run_ingest_pipeline(file_id, documents)
+        result = finalize_documents(documents, counters)[0]
+        if result["error"] is not None:
+            raise RuntimeError(result["error"])
+        processed, embedded, replaced = result["chunks_processed"], result["chunks_embedded"], result["chunks_replaced"]
 
-        engine = init_db_engine()
-
-        for i, chunk in enumerate(chunks):
-            embedding_vector = generate_embedding(chunk)
-            save_embedding_to_db(engine, original_filename, chunk, embedding_vector)
-            job['progress'] = f"{i + 1}/{len(chunks)}"
-
-        set_to_done(file_id, {"chunks_processed": len(chunks), "filename": original_filename})
+        logging.info(
+            f"Plik podzielony na {processed} fragmentów, nowych embeddingów: {embedded}, "
+            f"usunięte fragmenty poprzedniej wersji: {replaced}."
+        )
+        jobs.update(file_id, progress=f"{processed}/{processed}")
+        set_to_done(file_id, {
+            "chunks_processed": processed, "chunks_embedded": embedded, "chunks_reused": processed - embedded,
+            "chunks_replaced": replaced, "filename": original_filename,
+            "pipeline": pipeline_stats, "timings": end_trace(file_id),
+        })
+        EVENTS.publish(file_id, 'done', {'chunks_processed': processed, 'chunks_embedded': embedded})
         logging.info(f"Zakończono zapis embeddingów dla pliku: {original_filename}")
 
     except Exception as e:
         logging.error(f"Krytyczny błąd worker'a embeddingu dla {original_filename}: {e}")
-        research_queue[file_id]['status'] = 'error'
-        research_queue[file_id]['error'] = str(e)
+        discard_documents(documents)
+        jobs.update(file_id, status='error', error=str(e), timings=end_trace(file_id))
+        EVENTS.publish(file_id, 'error', {'error': str(e)})
+
+
+def bulk_ingest_worker(job_id, documents):
+    """
+    Wgrywanie zbiorcze (/upload/bulk): wszystkie pliki jednym potokiem - paczki embeddingu łączą
+    fragmenty wielu plików, a postęp i statystyki są zbiorcze, pod jednym job_id. Błąd ekstrakcji
+    pojedynczego pliku trafia do jego wyniku i nie przerywa pozostałych. Wiersze zadań plików
+    (file_id) dostają na końcu status i wynik swojego pliku.
+    """
+    jobs = get_job_store()
+    start_trace(job_id)
+    finished = set()
+
+    logging.info(f"Start wgrywania zbiorczego {job_id}: {len(documents)} plików")
+
+    try:
+        for document in documents:
+            jobs.update(document["id"], status='processing_extraction')
+        pipeline_stats, counters = run_ingest_pipeline(job_id, documents)
+        files = finalize_documents(documents, counters)
+        for result in files:
+            if result["error"] is not None:
+                jobs.update(result["file_id"], status='error', error=result["error"])
+            else:
+                jobs.update(result["file_id"], progress=f"{result['chunks_processed']}/{result['chunks_processed']}")
+                set_to_done(result["file_id"], result)
+            finished.add(result["file_id"])
+        failed = sum(1 for result in files if result["error"] is not None)
+        if failed == len(files):
+            raise RuntimeError(f"Żaden plik nie został przetworzony: {files[0]['error']}")
+        totals = {
+            key: sum(result[key] for result in files)
+            for key in ("chunks_processed", "chunks_embedded", "chunks_reused", "chunks_replaced")
+        }
+
+        logging.info(
+            f"Wgrywanie zbiorcze {job_id}: {len(files) - failed}/{len(files)} plików, "
+            f"{totals['chunks_processed']} fragmentów, nowych embeddingów: {totals['chunks_embedded']}."
+        )
+        jobs.update(job_id, progress=f"{len(files) - failed}/{len(files)} plików, {totals['chunks_processed']} fragmentów")
+        set_to_done(job_id, {
+            "files": files, "files_failed": failed, **totals,
+            "pipeline": pipeline_stats, "timings": end_trace(job_id),
+        })
+        EVENTS.publish(job_id, 'done', {'files': len(files), 'files_failed': failed, **totals})
 
+    except Exception as e:
+        logging.error(f"Krytyczny błąd wgrywania zbiorczego {job_id}: {e}")
+        discard_documents(documents)
+        for document in documents:
+            if document["id"] not in finished:
+                jobs.update(document["id"], status='error', error=str(e))
+        jobs.update(job_id, status='error', error=str(e), timings=end_trace(job_id))
+        EVENTS.publish(job_id, 'error', {'error': str(e)})
+
+
+def discard_documents(documents):
+    """
+    Sprzątanie po przerwanym potoku: usuwa zapisane fragmenty dokumentów (inaczej częściowo
+    zapisany plik blokowałby ponowne wgranie jako duplikat) i pliki dokumentów z UPLOAD_DIR.
+    """
+    for document in documents:
+        try:
+            get_vector_store().delete_file_content(document["filename"], document["file_hash"])
+        except Exception as e:
+            logging.error(f"Nie udało się usunąć fragmentów pliku {document['filename']}: {e}")
+        remove_uploaded_files(document)
+
+
+def remove_uploaded_files(document):
+    """Usuwa plik źródłowy (PDF) i tekst dokumentu (<file_id>.txt) - plik, który się nie wgrał, nie jest kontekstem /research."""
+    txt_path = os.path.join(UPLOAD_DIR, document["id"] + ".txt")
+    for path in {document["source_path"], txt_path}:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def pass_research_request(research_id, scenarios, context_filenames=None, priority=0):
+    """
+    Kolejkuje zadanie /research. Wyniki etapów trafiają do checkpointów zadania,
+    więc to samo wywołanie wznawia przerwane zadanie (/resume) od miejsca przerwania.
+    """
+    def on_event(event, data):
+        EVENTS.publish(research_id, event, data)
+        if event == 'cell_completed':
+            get_job_store().update(research_id, progress=f"{data['completed']}/{data['total']}")
 
-def pass_research_request(research_id, scenarios, textfiles):
     def worker():
-        research_queue[research_id]['status'] = 'running'
+        jobs = get_job_store()
+        jobs.update(research_id, status='running')
+        EVENTS.publish(research_id, 'running')
+        start_trace(research_id)
         try:
-            res = run_engine(scenarios, textfiles)
+            res = run_engine(
+                scenarios, context_filenames, on_event,
+                checkpoints=JobCheckpoints(jobs, research_id),
+            )
+            res['timings'] = end_trace(research_id)
             set_to_done(research_id, res)
+            EVENTS.publish(research_id, 'done', {'brief_summary': res.get('brief_summary')})
         except Exception as e:
-            research_queue[research_id]['status'] = 'error'
-            research_queue[research_id]['error'] = str(e)
+            jobs.update(research_id, status='error', error=str(e), timings=end_trace(research_id))
+            EVENTS.publish(research_id, 'error', {'error': str(e)})
 
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
+    return SCHEDULER.submit('research', research_id, worker, priority=priority)
+
+
+def saturated_response(error):
+    return jsonify({
+        'error': str(error),
+        'status': 'rejected',
+        'retry_after': error.retry_after,
+    }), 429, {'Retry-After': str(error.retry_after)}
 
 
 def set_to_done(research_id, result=None):
-    job = research_queue.get(research_id)
-    if job is not None:
-        job['status'] = 'done'
-        if result is not None:
-            job['result'] = result
+    jobs = get_job_store()
+    if result is None:
+        jobs.update(research_id, status='done')
+        return
+    # pełny wynik osobno, w wierszu statusu tylko krótkie streszczenie dla /status;
+    # checkpointy nie są już potrzebne
+    jobs.set_result(research_id, result)
+    jobs.clear_checkpoints(research_id)
+    # rozbicie czasu na etapy (i statystyki potoku wgrywania) zostają też w wierszu statusu (dla /status)
+    fields = {}
+    if isinstance(result, dict):
+        fields = {key: result[key] for key in ('brief_summary', 'timings', 'pipeline') if result.get(key) is not None}
+    jobs.update(research_id, status='done', **fields)
 
 
 
@@ -302,23 +987,107 @@ def get_status():
     research_id = request.args.get('research_id')
     if not research_id:
         return jsonify({'error': 'Missing research_id query parameter'}), 400
-    job = research_queue.get(research_id)
+    job = get_job_store().get(research_id)
     if not job:
         return jsonify({'error': 'Research id not found'}), 404
 
-    result = job.get('result', {})
-
     # Zwracamy wynik, który zawiera skrót raportu, gdy status jest 'done'
-    brief_summary_display = result.get('brief_summary', 'Analiza w toku...') if job.get('status') == 'done' else None
+    brief_summary_display = job.get('brief_summary', 'Analiza w toku...') if job.get('status') == 'done' else None
 
     return jsonify({
         'research_id': research_id,
         'status': job.get('status'),
-        'progress': job.get('progress', 'N/A'),
+        'progress': job.get('progress') or 'N/A',
+        'error': job.get('error'),
+        'queue_position': SCHEDULER.queue_position(research_id),
+        # rozbicie czasu i tokenów na etapy: na żywo dla działającego zadania, potem z magazynu
+        'timings': get_trace_summary(research_id) or job.get('timings'),
+        # przepustowość etapów potoku wgrywania dokumentów (tylko zadania embeddingu)
+        'pipeline': get_pipeline_stats(research_id) or job.get('pipeline'),
         'result': brief_summary_display
     }), 200
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Metryki w formacie Prometheusa: czasy etapów, tokeny, trafienia w cache, ponowienia, kolejki."""
+    scheduler_stats = SCHEDULER.stats()
+    gauges = {
+        'jobs_running': {kind: stats['running'] for kind, stats in scheduler_stats.items()},
+        'jobs_queued': {kind: stats['queued'] for kind, stats in scheduler_stats.items()},
+    }
+    return Response(METRICS.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    """Strumień SSE z postępem zadania (zamiast odpytywania /status)."""
+    research_id = request.args.get('research_id')
+    if not research_id:
+        return jsonify({'error': 'Missing research_id query parameter'}), 400
+    if not get_job_store().get(research_id):
+        return jsonify({'error': 'Research id not found'}), 404
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+
+    events = stream_job_events(EVENTS, research_id, get_job_store().get, last_event_id)
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/result', methods=['GET'])
+def get_result():
+    research_id = request.args.get('research_id')
+    if not research_id:
+        return jsonify({'error': 'Missing research_id query parameter'}), 400
+    jobs = get_job_store()
+    job = jobs.get(research_id)
+    if not job:
+        return jsonify({'error': 'Research id not found'}), 404
+    if job.get('status') != 'done':
+        return jsonify({'research_id': research_id, 'status': job.get('status')}), 409
+
+    return jsonify({'research_id': research_id, 'status': 'done', 'result': jobs.get_result(research_id)}), 200
+
+
+def load_context_files(context_files):
+    """
+    Oryginalne nazwy plików kontekstowych w tabeli documents (treść trafia do promptów przez
+    retrieval, plików nie czytamy). Zwraca (nazwy, nieznane file_id) - nieznany plik (brak zadania
+    wgrywania albo pliku z tekstem) nie może być pominięty, bo retrieval przeszukałby wtedy całą bazę.
+    """
+    context_filenames = []
+    unknown = []
+    for file_id in context_files:
+        # nazwa pliku w tabeli documents - żeby retrieval przeszukiwał tylko wybrane pliki;
+        # zadanie zbiorcze (files_total) nie odpowiada jednemu plikowi - pliki mają własne file_id
+        upload_job = get_job_store().get(file_id) if isinstance(file_id, str) else None
+        if not upload_job or upload_job.get('kind') != 'embedding' or not upload_job.get('original_filename') \
+                or upload_job.get('files_total') is not None:
+            unknown.append(file_id)
+            continue
+
+        if not os.path.exists(os.path.join(UPLOAD_DIR, os.path.basename(file_id) + ".txt")):
+            logging.warning(f"Plik kontekstowy {file_id}.txt nie został znaleziony.")
+            unknown.append(file_id)
+            continue
+        context_filenames.append(upload_job['original_filename'])
+    return context_filenames, unknown
+
+
+def unknown_context_files_response(unknown):
+    return jsonify({
+        'error': 'Nieznane pliki kontekstowe (brak wgranego pliku o tym file_id albo jego tekstu).',
+        'unknown_context_files': unknown,
+    }), 400
+
+
 @app.route('/research', methods=['POST'])
 def start_research():
     data = request.get_json(force=True, silent=True)
@@ -333,30 +1102,98 @@ def start_research():
 
     if context_files is None:
         context_files = []
+    if not isinstance(context_files, list):
+        return jsonify({'error': 'Invalid context_files (expected list of file_id)'}), 400
+
+    priority = data.get('priority')
+    if priority is None:
+        priority = 0
+    if isinstance(priority, str) and priority.strip().isdigit():
+        priority = int(priority)
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        return jsonify({'error': f'Invalid priority (expected integer 0-{RESEARCH_PRIORITY_MAX})'}), 400
+    priority = min(max(priority, 0), RESEARCH_PRIORITY_MAX)
 
-    # Pobieranie treści plików kontekstowych (które zostały załadowane do UPLOAD_DIR)
-    textfiles = []
-    for file_id in context_files:
-        txt_path = os.path.join(UPLOAD_DIR, file_id + ".txt")
-        try:
-            with open(txt_path, "r", encoding="utf-8") as f:
-                textfiles.append(f.read())
-        except FileNotFoundError:
-            logging.warning(f"Plik kontekstowy {file_id}.txt nie został znaleziony.")
-            continue
+    try:
+        SCHEDULER.ensure_capacity('research')
+    except SchedulerSaturated as e:
+        return saturated_response(e)
+
+    context_filenames, unknown = load_context_files(context_files)
+    if unknown:
+        return unknown_context_files_response(unknown)
 
     research_id = uuid.uuid4().hex
-    job = {
-        'id': research_id,
-        'status': 'queued',
-        'result': None,
-    }
-    research_queue[research_id] = job
+    jobs = get_job_store()
+    jobs.create(research_id, 'research', status='queued')
+    # dane wejściowe zadania - potrzebne do wznowienia (/resume)
+    jobs.save_checkpoint(research_id, 'input', {
+        'scenarios': scenarios_data, 'context_files': context_files, 'priority': priority,
+    })
+
+    # Uruchomienie workera (kolejka z ograniczoną pulą)
+    try:
+        position = pass_research_request(research_id, scenarios_data, context_filenames or None, priority)
+    except SchedulerSaturated as e:
+        get_job_store().update(research_id, status='error', error=str(e))
+        return saturated_response(e)
+
+    return jsonify({'research_id': research_id, 'status': 'queued', 'queue_position': position}), 202
+
+
+@app.route('/resume', methods=['POST'])
+def resume_research():
+    """
+    Wznawia przerwane zadanie /research (błąd, restart instancji) pod tym samym research_id.
+    Gotowe etapy są odtwarzane z checkpointów, wykonywane jest tylko to, czego brakuje.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    research_id = data.get('research_id') or request.args.get('research_id')
+    if not research_id:
+        return jsonify({'error': 'Missing research_id'}), 400
+
+    jobs = get_job_store()
+    job = jobs.get(research_id)
+    if not job or job.get('kind') != 'research':
+        return jsonify({'error': 'Research id not found'}), 404
+    if job.get('status') == 'done':
+        return jsonify({'error': 'Zadanie jest już zakończone.', 'status': 'done'}), 409
+    if SCHEDULER.is_active(research_id) or (
+        job.get('status') in ('queued', 'running') and time.time() - job['updated_at'] < RESUME_STALE_SECONDS
+    ):
+        return jsonify({'error': 'Zadanie jest w toku.', 'status': job.get('status')}), 409
+
+    checkpoints = jobs.get_checkpoints(research_id)
+    request_input = checkpoints.get('input')
+    if not request_input:
+        return jsonify({'error': 'Brak danych wejściowych zadania - nie można go wznowić.'}), 409
 
-    # Uruchomienie workera
-    pass_research_request(research_id, scenarios_data, textfiles)
+    try:
+        SCHEDULER.ensure_capacity('research')
+    except SchedulerSaturated as e:
+        return saturated_response(e)
+
+    context_filenames, unknown = load_context_files(request_input.get('context_files') or [])
+    if unknown:
+        return unknown_context_files_response(unknown)
+    # historia zdarzeń poprzedniego przebiegu kończy się zdarzeniem error - /events odtworzyłby je nowym klientom
+    EVENTS.reset(research_id)
+    jobs.update(research_id, status='queued', error=None)
+    try:
+        position = pass_research_request(
+            research_id, request_input['scenarios'], context_filenames or None,
+            min(max(int(request_input.get('priority', 0)), 0), RESEARCH_PRIORITY_MAX),
+        )
+    except SchedulerSaturated as e:
+        jobs.update(research_id, status='error', error=str(e))
+        return saturated_response(e)
 
-    return jsonify({'research_id': research_id, 'status': 'queued'}), 202
+    return jsonify({
+        'research_id': research_id,
+        'status': 'queued',
+        'queue_position': position,
+        'checkpoints': len(checkpoints) - 1,
+    }), 202
 
 
 @app.route('/upload', methods=['POST'])
@@ -374,65 +1211,215 @@ def upload_file():
     if file_extension not in ['pdf', 'txt']:
         return jsonify({'error': 'Nieobsługiwany format pliku (tylko PDF/TXT)'}), 400
 
-    # WALIDACJA DUPLIKATÓW
-    if check_if_file_exists_in_db(original_filename):
-        return jsonify({
-            'error': f'Plik o nazwie "{original_filename}" został już przetworzony i jest w bazie danych.',
-            'status': 'conflict'
-        }), 409
-    if any(job.get('original_filename') == original_filename and job.get('status') in ['queued', 'processing_embedding']
-           for job in research_queue.values()):
+    if get_job_store().exists('embedding', ['queued', 'processing_extraction', 'processing_embedding'], original_filename=original_filename):
         return jsonify({
             'error': f'Plik o nazwie "{original_filename}" jest już w trakcie przetwarzania.',
             'status': 'processing'
         }), 409
 
-    # 1. Generowanie ID i zapis pliku tymczasowego
+    try:
+        SCHEDULER.ensure_capacity('embedding')
+    except SchedulerSaturated as e:
+        return saturated_response(e)
+
+    # 1. Generowanie ID i zapis pliku (TXT od razu pod docelową nazwą)
     file_id = uuid.uuid4().hex
     temp_save_path = os.path.join(UPLOAD_DIR, file_id + "." + file_extension)
     file.save(temp_save_path)
 
-    text_content = ""
-
-    # 2. Wyodrębnianie tekstu
-    if file_extension == "pdf":
-        try:
-            with pdfplumber.open(temp_save_path) as pdf:
-                for page in pdf.pages:
-                    t = page.extract_text()
-                    if t:
-                        text_content += t + '\n'
-        except Exception as e:
-            os.remove(temp_save_path)
-            return jsonify({'error': f'Błąd przetwarzania PDF: {str(e)}'}), 500
-    else:
-        with open(temp_save_path, "r", encoding="utf-8") as f:
-            text_content = f.read()
-
-    # ZAPISUJEMY TEKST W PLIKU .TXT dla /research endpointu, a następnie usuwamy plik tymczasowy.
-    with open(os.path.join(UPLOAD_DIR, file_id + ".txt"), "w", encoding="utf-8") as f:
-        f.write(text_content)
-    os.remove(temp_save_path)
+    # WALIDACJA DUPLIKATÓW - po treści pliku, nie po nazwie; plik o tej samej nazwie
+    # i innej treści to nowa wersja (zastąpi poprzednią)
+    file_hash = hash_file(temp_save_path)
+    existing_filename = find_file_in_db(file_hash)
+    if existing_filename is not None:
+        os.remove(temp_save_path)
+        return jsonify({
+            'error': f'Plik o tej samej treści został już przetworzony i jest w bazie danych jako "{existing_filename}".',
+            'existing_filename': existing_filename,
+            'status': 'conflict'
+        }), 409
 
-    # 3. Uruchomienie asynchronicznego zadania chunkowania i embeddingu
-    job = {
-        'id': file_id,
-        'status': 'queued',
-        'original_filename': original_filename,
-        'progress': '0/0'
-    }
-    research_queue[file_id] = job
+    # 2. Ekstrakcja tekstu, chunkowanie i embedding w zadaniu w tle - odpowiadamy od razu (202)
+    get_job_store().create(file_id, 'embedding', status='queued', original_filename=original_filename, progress='0/0')
 
-    t = threading.Thread(target=embed_chunks_to_db_worker, args=(file_id, original_filename, text_content), daemon=True)
-    t.start()
+    try:
+        position = SCHEDULER.submit(
+            'embedding', file_id, embed_chunks_to_db_worker, file_id, original_filename, temp_save_path, file_hash,
+        )
+    except SchedulerSaturated as e:
+        get_job_store().update(file_id, status='error', error=str(e))
+        os.remove(temp_save_path)
+        return saturated_response(e)
 
     return jsonify({
         'file_id': file_id,
         'original_filename': original_filename,
         'status': 'embedding_queued',
+        'queue_position': position,
         'check_status_url': f'/status?research_id={file_id}'
     }), 202
 
 
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+class BulkLimitExceeded(Exception):
+    """Przekroczony limit liczby plików albo łącznego rozmiaru wgrywania zbiorczego."""
+
+
+def iter_bulk_members(file):
+    """
+    Pliki (ścieżka, strumień binarny) z pliku wgranego do /upload/bulk: archiwa zip/tar są czytane
+    po kolei, bez rozpakowywania na dysk; pozostałe pliki są zwracane bez zmian.
+    Pomijamy katalogi, linki i pliki ukryte/systemowe (np. __MACOSX/, .DS_Store).
+    """
+    name = file.filename.lower()
+    if not name.endswith(ARCHIVE_SUFFIXES):
+        yield file.filename, file.stream
+        return
+
+    def visible(path):
+        return not any(part.startswith(('.', '__MACOSX')) for part in path.split('/') if part)
+
+    if name.endswith('.zip'):
+        with zipfile.ZipFile(file.stream) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and visible(info.filename):
+                    with archive.open(info) as member:
+                        yield info.filename, member
+        return
+
+    with tarfile.open(fileobj=file.stream, mode='r:*') as archive:
+        for info in archive:
+            if info.isfile() and visible(info.name):
+                yield info.name, archive.extractfile(info)
+
+
+def save_bulk_member(stream, path, budget):
+    """Zapisuje strumień do path, licząc hash treści; budget: pozostałe bajty limitu (lista 1-elementowa)."""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for block in iter(lambda: stream.read(1024 * 1024), b''):
+            budget[0] -= len(block)
+            if budget[0] < 0:
+                raise BulkLimitExceeded(f'Łączny rozmiar plików przekracza limit {BULK_MAX_TOTAL_BYTES} B.')
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+@app.route('/upload/bulk', methods=['POST'])
+def upload_bulk():
+    """
+    Wgrywanie zbiorcze: wiele plików PDF/TXT (klucz "files", powtarzany) i/lub archiwa zip/tar.
+    Wszystkie pliki idą jednym zadaniem i wspólnym potokiem (paczki embeddingu łączą fragmenty
+    wielu plików); postęp zbiorczy pod jednym job_id. Każdy plik ma też własny wiersz zadania
+    (file_id -> nazwa, status) - dla blokady wgrywania tej samej nazwy i dla context_files w /research.
+    Pliki nieobsługiwane, duplikaty treści (w bazie albo w tym samym żądaniu) i pliki w trakcie
+    przetwarzania są pomijane - lista w "skipped".
+    """
+    uploads = [file for file in request.files.getlist('files') if file.filename]
+    if not uploads:
+        return jsonify({'error': 'No files in the request (expected key "files")'}), 400
+
+    try:
+        SCHEDULER.ensure_capacity('embedding')
+    except SchedulerSaturated as e:
+        return saturated_response(e)
+
+    jobs = get_job_store()
+    job_id = uuid.uuid4().hex
+    documents, skipped = [], []
+    seen_hashes, seen_names = {}, set()
+    budget = [BULK_MAX_TOTAL_BYTES]
+
+    def discard_saved(error):
+        for document in documents:
+            os.remove(document['source_path'])
+            jobs.update(document['id'], status='error', error=error)
+
+    try:
+        for upload in uploads:
+            for filename, stream in iter_bulk_members(upload):
+                file_extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+                if file_extension not in ['pdf', 'txt']:
+                    skipped.append({'filename': filename, 'reason': 'unsupported'})
+                    continue
+                # ta sama nazwa w jednym zadaniu - druga wersja usunęłaby fragmenty pierwszej
+                if filename in seen_names:
+                    skipped.append({'filename': filename, 'reason': 'duplicate_name'})
+                    continue
+                if jobs.exists('embedding', ['queued', 'processing_extraction', 'processing_embedding'], original_filename=filename):
+                    skipped.append({'filename': filename, 'reason': 'processing'})
+                    continue
+                if len(documents) >= BULK_MAX_FILES:
+                    raise BulkLimitExceeded(f'Liczba plików przekracza limit {BULK_MAX_FILES}.')
+
+                file_id = uuid.uuid4().hex
+                save_path = os.path.join(UPLOAD_DIR, file_id + '.' + file_extension)
+                try:
+                    file_hash = save_bulk_member(stream, save_path, budget)
+                except BaseException:
+                    if os.path.exists(save_path):
+                        os.remove(save_path)
+                    raise
+
+                existing_filename = seen_hashes.get(file_hash) or find_file_in_db(file_hash)
+                if existing_filename is not None:
+                    os.remove(save_path)
+                    skipped.append({'filename': filename, 'reason': 'duplicate', 'existing_filename': existing_filename})
+                    continue
+
+                seen_hashes[file_hash] = filename
+                seen_names.add(filename)
+                documents.append({'id': file_id, 'filename': filename, 'source_path': save_path, 'file_hash': file_hash})
+                # wiersz pliku od razu - od tej chwili /upload i /upload/bulk widzą tę nazwę jako przetwarzaną
+                jobs.create(file_id, 'embedding', status='queued', original_filename=filename, progress='0/0', bulk_job_id=job_id)
+    except BulkLimitExceeded as e:
+        discard_saved(str(e))
+        return jsonify({'error': str(e), 'status': 'rejected'}), 413
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        discard_saved(f'Nie udało się odczytać archiwum: {e}')
+        return jsonify({'error': f'Nie udało się odczytać archiwum: {e}'}), 400
+    except Exception as e:
+        discard_saved(str(e))
+        raise
+
+    if not documents:
+        unsupported = all(item['reason'] == 'unsupported' for item in skipped)
+        return jsonify({
+            'error': 'Brak nowych plików PDF/TXT do przetworzenia.',
+            'skipped': skipped,
+            'status': 'rejected' if unsupported else 'conflict',
+        }), 400 if unsupported else 409
+
+    label = uploads[0].filename if len(uploads) == 1 else f'{len(uploads)} plików'
+    jobs.create(
+        job_id, 'embedding', status='queued', original_filename=label,
+        progress=f'0/{len(documents)} plików, 0 fragmentów', files_total=len(documents),
+    )
+
+    try:
+        position = SCHEDULER.submit('embedding', job_id, bulk_ingest_worker, job_id, documents)
+    except SchedulerSaturated as e:
+        jobs.update(job_id, status='error', error=str(e))
+        discard_saved(str(e))
+        return saturated_response(e)
+
+    return jsonify({
+        'job_id': job_id,
+        'files': [{'file_id': document['id'], 'original_filename': document['filename']} for document in documents],
+        'skipped': skipped,
+        'status': 'embedding_queued',
+        'queue_position': position,
+        'check_status_url': f'/status?research_id={job_id}'
+    }), 202
+
+
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=PORT)
\ No newline at end of file
+    debug = True
+    # przy debug=True moduł wykonuje też proces nadzorujący przeładowanie - indeksy budujemy tylko w procesie serwera
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        ensure_llm_cache()
+        prepare_vector_store()
+    app.run(debug=debug, host="0.0.0.0", port=PORT)
\ No newline at end of file
@@ -0,0 +1,239 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from tracing import in_context
+
+# znacznik końca strumienia w kolejce między etapami
+_END = object()
+# co ile sekund zablokowany put/get sprawdza, czy potok nie został przerwany błędem
+_POLL_SECONDS = 0.2
+
+
+class PipelineAborted(Exception):
+    """Inny etap potoku zakończył się błędem - ten etap przerywa pracę."""
+
+
+class Stage:
+    """
+    Etap potoku:
+    - fn(item) -> iterowalne wyniki (0..n) przekazywane do następnego etapu (albo None),
+      a przy stream=True fn(iterator wejścia) -> iterowalne wyniki (etap stanowy, np. chunker; 1 worker),
+    - workers: liczba wątków etapu,
+    - queue_size: pojemność kolejki wejściowej - pełna kolejka wstrzymuje poprzedni etap (backpressure),
+    - size: opcjonalna "waga" elementu wejściowego do statystyk (np. liczba fragmentów w paczce).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        workers: int = 1,
+        queue_size: int = 8,
+        stream: bool = False,
+        size: Optional[Callable[[Any], int]] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = 1 if stream else max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.stream = stream
+        self.size = size
+
+
+class StageStats:
+    """
+    Przepustowość etapu: przetworzone elementy (i ich waga) na sekundę. Czas wątków jest dzielony na
+    pracę, czekanie na wejście (etap niedożywiony) i czekanie na miejsce w kolejce następnego etapu
+    (backpressure) - widać, który etap jest wąskim gardłem.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.items = 0
+        self.units = 0
+        self.waiting_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 0, units: int = 0, waiting: float = 0.0, blocked: float = 0.0) -> None:
+        with self._lock:
+            self.items += items
+            self.units += units
+            self.waiting_seconds += waiting
+            self.blocked_seconds += blocked
+
+    def to_dict(self, queue_depth: int) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = ((self.finished or time.monotonic()) - self.started) if self.started else 0.0
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "units": self.units,
+                "units_per_second": round(self.units / elapsed, 3) if elapsed else 0.0,
+                "busy_seconds": round(max(0.0, self.workers * elapsed - self.waiting_seconds - self.blocked_seconds), 3),
+                "waiting_seconds": round(self.waiting_seconds, 3),
+                "blocked_seconds": round(self.blocked_seconds, 3),
+                "queue_depth": queue_depth,
+                "done": self.finished is not None,
+            }
+
+
+class Pipeline:
+    """
+    Potok producent/konsument: źródło -> etap 1 -> ... -> etap n, z ograniczonymi kolejkami między
+    etapami, więc etapy sieciowe (embedding) i bazodanowe (zapis) działają jednocześnie, a szybszy
+    etap nie zapełnia pamięci wynikami wolniejszego. Wyniki ostatniego etapu są pomijane.
+    Błąd dowolnego etapu przerywa cały potok; run() zgłasza pierwszy błąd.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        source: Iterable,
+        stages: List[Stage],
+        source_name: str = "source",
+        source_size: Optional[Callable[[Any], int]] = None,
+    ):
+        self.job_id = job_id
+        self.source = source
+        self.source_name = source_name
+        self.source_size = source_size
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.stats = {source_name: StageStats(1), **{stage.name: StageStats(stage.workers) for stage in stages}}
+        self._error: Optional[BaseException] = None
+        self._aborted = threading.Event()
+        self._remaining = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """Uruchamia potok, czeka na koniec i zwraca statystyki etapów."""
+        with _active_lock:
+            _active[self.job_id] = self
+        try:
+            threads = [self._thread(self._run_source, self.source_name)]
+            for index, stage in enumerate(self.stages):
+                for worker in range(stage.workers):
+                    threads.append(self._thread(self._run_stage, f"{stage.name}-{worker + 1}", index))
+            now = time.monotonic()
+            for stats in self.stats.values():
+                stats.started = now
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            with _active_lock:
+                _active.pop(self.job_id, None)
+
+        if self._error is not None:
+            raise self._error
+        return self.summary()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        depths = [0] + [q.qsize() for q in self.queues]
+        return {name: stats.to_dict(depth) for (name, stats), depth in zip(self.stats.items(), depths)}
+
+    def _thread(self, target: Callable, name: str, *args) -> threading.Thread:
+        # wątki etapów dziedziczą kontekst zadania (spany trafiają do jego śladu)
+        return threading.Thread(target=in_context(target), args=args, daemon=True, name=f"ingest-{name}")
+
+    def _fail(self, error: BaseException) -> None:
+        with self._lock:
+            if self._error is None and not isinstance(error, PipelineAborted):
+                self._error = error
+        self._aborted.set()
+
+    def _put(self, index: int, item: Any, stats: StageStats) -> None:
+        """Wstawia do kolejki etapu index; czas czekania na miejsce liczy się jako backpressure."""
+        start = time.monotonic()
+        while True:
+            if self._aborted.is_set():
+                raise PipelineAborted()
+            try:
+                self.queues[index].put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        stats.add(blocked=time.monotonic() - start)
+
+    def _iter_input(self, index: int, stats: StageStats, size: Optional[Callable]) -> Iterator[Any]:
+        """Elementy z kolejki etapu index aż do końca strumienia; czas czekania liczy się jako przestój."""
+        while True:
+            start = time.monotonic()
+            while True:
+                if self._aborted.is_set():
+                    raise PipelineAborted()
+                try:
+                    item = self.queues[index].get(timeout=_POLL_SECONDS)
+                    break
+                except queue.Empty:
+                    continue
+            stats.add(waiting=time.monotonic() - start)
+            if item is _END:
+                return
+            yield item
+            stats.add(items=1, units=size(item) if size else 1)
+
+    def _forward(self, index: int, outputs: Optional[Iterable], stats: StageStats) -> None:
+        # za ostatnim etapem wyniki są pomijane
+        for output in outputs or ():
+            if index < len(self.queues):
+                self._put(index, output, stats)
+
+    def _run_source(self) -> None:
+        stats = self.stats[self.source_name]
+        try:
+            for item in self.source:
+                self._put(0, item, stats)
+                stats.add(items=1, units=self.source_size(item) if self.source_size else 1)
+            self._put(0, _END, stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            stats.finished = time.monotonic()
+
+    def _run_stage(self, index: int) -> None:
+        stage = self.stages[index]
+        stats = self.stats[stage.name]
+        try:
+            if stage.stream:
+                self._forward(index + 1, stage.fn(self._iter_input(index, stats, stage.size)), stats)
+            else:
+                for item in self._iter_input(index, stats, stage.size):
+                    self._forward(index + 1, stage.fn(item), stats)
+        except BaseException as e:
+            if not isinstance(e, PipelineAborted):
+                logging.error(f"Błąd etapu {stage.name} potoku {self.job_id}: {e}")
+            self._fail(e)
+            return
+
+        with self._lock:
+            self._remaining[index] -= 1
+            last = self._remaining[index] == 0
+        try:
+            if not last:
+                # pozostałe wątki tego etapu też muszą zobaczyć koniec strumienia
+                self._put(index, _END, StageStats(0))
+                return
+            stats.finished = time.monotonic()
+            if index + 1 < len(self.queues):
+                self._put(index + 1, _END, stats)
+        except PipelineAborted:
+            pass
+
+
+_active: Dict[str, Pipeline] = {}
+_active_lock = threading.Lock()
+
+
+def get_pipeline_stats(job_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Bieżące statystyki etapów działającego potoku (None, jeśli nie działa w tym procesie)."""
+    with _active_lock:
+        pipeline = _active.get(job_id)
+    return pipeline.summary() if pipeline is not None else None
@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, Optional
+
+TERMINAL_EVENTS = ("done", "error")
+
+
+class JobEventBus:
+    """
+    Zdarzenia postępu zadań w pamięci procesu (dla strumienia SSE /events).
+    Każde zadanie ma ograniczoną historię zdarzeń z rosnącymi id, dzięki czemu
+    klient po ponownym połączeniu (nagłówek Last-Event-ID) dostaje tylko brakujące.
+    Historie zakończonych zadań są usuwane po retention_seconds.
+    """
+
+    def __init__(self, history_size: int = 1000, retention_seconds: float = 600):
+        self.history_size = history_size
+        self.retention_seconds = retention_seconds
+        self._events: Dict[str, deque] = {}
+        self._next_id: Dict[str, int] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._condition = threading.Condition()
+
+    def publish(self, job_id: str, event: str, data: Optional[Dict[str, Any]] = None) -> None:
+        with self._condition:
+            self._cleanup()
+            event_id = self._next_id.get(job_id, 0) + 1
+            self._next_id[job_id] = event_id
+            history = self._events.setdefault(job_id, deque(maxlen=self.history_size))
+            history.append({"id": event_id, "event": event, "data": data or {}, "time": time.time()})
+            if event in TERMINAL_EVENTS:
+                self._finished_at[job_id] = time.time()
+            self._condition.notify_all()
+
+    def reset(self, job_id: str) -> None:
+        """
+        Czyści historię zadania przed jego wznowieniem (/resume) - nowe połączenia nie mogą dostać
+        zdarzenia końcowego poprzedniego przebiegu. Numeracja id rośnie dalej, więc klient
+        z Last-Event-ID poprzedniego przebiegu dostanie wszystkie nowe zdarzenia.
+        """
+        with self._condition:
+            self._events.pop(job_id, None)
+            self._finished_at.pop(job_id, None)
+
+    def events_since(self, job_id: str, last_event_id: int = 0) -> list:
+        with self._condition:
+            return [e for e in self._events.get(job_id, ()) if e["id"] > last_event_id]
+
+    def wait(self, job_id: str, last_event_id: int, timeout: float) -> list:
+        """Czeka (maks. timeout sekund) na zdarzenia nowsze niż last_event_id."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._next_id.get(job_id, 0) > last_event_id, timeout=timeout
+            )
+            return [e for e in self._events.get(job_id, ()) if e["id"] > last_event_id]
+
+    def is_finished(self, job_id: str) -> bool:
+        with self._condition:
+            return job_id in self._finished_at
+
+    def _cleanup(self) -> None:
+        # wywoływane pod blokadą
+        now = time.time()
+        for job_id, finished in list(self._finished_at.items()):
+            if now - finished > self.retention_seconds:
+                self._events.pop(job_id, None)
+                self._next_id.pop(job_id, None)
+                self._finished_at.pop(job_id, None)
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    payload = json.dumps(event["data"], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+
+
+def stream_job_events(
+    bus: JobEventBus,
+    job_id: str,
+    get_status,
+    last_event_id: int = 0,
+    heartbeat_seconds: float = 15,
+    max_seconds: float = 3600,
+) -> Iterator[str]:
+    """
+    Generator strumienia SSE. Wysyła zdarzenia z szyny; co heartbeat_seconds wysyła komentarz
+    podtrzymujący połączenie i sprawdza status w magazynie zadań - zadanie mogło działać
+    na innej instancji, wtedy kończymy strumień zdarzeniem statusu z magazynu.
+    """
+    started = time.time()
+    while time.time() - started < max_seconds:
+        events = bus.wait(job_id, last_event_id, timeout=heartbeat_seconds)
+        for event in events:
+            last_event_id = event["id"]
+            yield format_sse(event)
+            if event["event"] in TERMINAL_EVENTS:
+                return
+
+        if not events:
+            job = get_status(job_id)
+            if job is None:
+                yield format_sse({"id": last_event_id, "event": "error", "data": {"error": "Research id not found"}})
+                return
+            if job.get("status") in TERMINAL_EVENTS:
+                if not bus.is_finished(job_id):
+                    yield format_sse({"id": last_event_id, "event": job["status"], "data": {"status": job["status"]}})
+                return
+            yield ": keep-alive\n\n"
@@ -0,0 +1,129 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class SchedulerSaturated(Exception):
+    """Kolejka danego typu zadań jest pełna - klient powinien ponowić po retry_after sekundach."""
+
+    def __init__(self, kind: str, retry_after: int):
+        super().__init__(f"Kolejka zadań '{kind}' jest pełna, spróbuj ponownie za {retry_after} s.")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class _KindPool:
+    def __init__(self, kind: str, concurrency: int, max_queued: int):
+        self.kind = kind
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max_queued
+        self.queue = queue.PriorityQueue()
+        self.running = set()
+        self.durations = []
+        self.threads = []
+
+
+class JobScheduler:
+    """
+    Ograniczona pula workerów z kolejką priorytetową, osobno dla każdego typu zadania
+    (np. "research", "embedding"):
+    - concurrency: ile zadań danego typu działa jednocześnie,
+    - max_queued: ile może czekać; powyżej tego submit rzuca SchedulerSaturated,
+    - priority: mniejsza liczba = wcześniej (przy równym priorytecie kolejność zgłoszeń).
+    """
+
+    def __init__(self, concurrency: Dict[str, int], max_queued: Dict[str, int], default_retry_after: int = 30):
+        self.default_retry_after = default_retry_after
+        self._pools = {
+            kind: _KindPool(kind, workers, max_queued.get(kind, 0))
+            for kind, workers in concurrency.items()
+        }
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _pool(self, kind: str) -> _KindPool:
+        if kind not in self._pools:
+            raise KeyError(f"Nieznany typ zadania: {kind}")
+        return self._pools[kind]
+
+    def ensure_capacity(self, kind: str) -> None:
+        """Sprawdzenie przed kosztowną pracą w handlerze (zapis pliku, ekstrakcja itp.)."""
+        pool = self._pool(kind)
+        if pool.queue.qsize() >= pool.max_queued:
+            raise SchedulerSaturated(kind, self.retry_after(kind))
+
+    def submit(self, kind: str, job_id: str, fn: Callable, *args, priority: int = 0) -> int:
+        """Dodaje zadanie do kolejki i zwraca jego pozycję (1 = następne do uruchomienia, 0 = już działa)."""
+        pool = self._pool(kind)
+        with self._lock:
+            if pool.queue.qsize() >= pool.max_queued:
+                raise SchedulerSaturated(kind, self.retry_after(kind))
+            pool.queue.put((priority, next(self._sequence), job_id, fn, args))
+            self._start_workers(pool)
+        return self.queue_position(job_id) or 0
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """
+        Pozycja zadania w kolejce jego typu (1 = następne do uruchomienia), 0 - zadanie już działa;
+        None, jeśli zadania nie ma w tym procesie (zakończone albo na innej instancji).
+        """
+        for pool in self._pools.values():
+            if job_id in pool.running:
+                return 0
+            with pool.queue.mutex:
+                waiting = sorted(pool.queue.queue)
+            for position, item in enumerate(waiting, start=1):
+                if item[2] == job_id:
+                    return position
+        return None
+
+    def is_active(self, job_id: str) -> bool:
+        """Czy zadanie czeka w kolejce albo działa w tym procesie."""
+        return self.queue_position(job_id) is not None
+
+    def retry_after(self, kind: str) -> int:
+        """Szacunkowy czas do zwolnienia miejsca w kolejce: średni czas zadania / liczba workerów."""
+        pool = self._pool(kind)
+        if not pool.durations:
+            return self.default_retry_after
+        average = sum(pool.durations) / len(pool.durations)
+        return max(1, int(average / pool.concurrency))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            kind: {
+                "running": len(pool.running),
+                "queued": pool.queue.qsize(),
+                "concurrency": pool.concurrency,
+                "max_queued": pool.max_queued,
+            }
+            for kind, pool in self._pools.items()
+        }
+
+    def _start_workers(self, pool: _KindPool) -> None:
+        # wątki startujemy leniwie, przy pierwszym zadaniu danego typu
+        while len(pool.threads) < pool.concurrency:
+            thread = threading.Thread(
+                target=self._worker_loop, args=(pool,), daemon=True,
+                name=f"{pool.kind}-worker-{len(pool.threads) + 1}",
+            )
+            pool.threads.append(thread)
+            thread.start()
+
+    def _worker_loop(self, pool: _KindPool) -> None:
+        while True:
+            _, _, job_id, fn, args = pool.queue.get()
+            pool.running.add(job_id)
+            start = time.monotonic()
+            try:
+                fn(*args)
+            except Exception as e:
+                # funkcje zadań same zapisują błąd w magazynie zadań - tu tylko log
+                logging.error(f"Nieobsłużony błąd zadania {pool.kind}/{job_id}: {e}")
+            finally:
+                pool.running.discard(job_id)
+                pool.durations = (pool.durations + [time.monotonic() - start])[-20:]
+                pool.queue.task_done()
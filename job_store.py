@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Optional
+
+import sqlalchemy
+
+# kolumny wiersza statusu; pozostałe pola zadania trafiają do kolumny meta (JSON)
+STATUS_COLUMNS = ("kind", "status", "progress", "error", "original_filename")
+TERMINAL_STATUSES = ("done", "error")
+
+
+class JobStore(ABC):
+    """
+    Magazyn zadań /research i /upload.
+    Wiersz statusu jest mały (status, postęp, błąd, drobne metadane) - /status czyta tylko jego.
+    Duże wyniki (raw_data, raport) leżą osobno i są czytane tylko na żądanie.
+    Punkty kontrolne (checkpointy) to wyniki pośrednie zadania pod kluczami - pozwalają
+    wznowić przerwane zadanie bez powtarzania wykonanej już pracy.
+    """
+
+    @abstractmethod
+    def create(self, job_id: str, kind: str, **fields) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def update(self, job_id: str, **fields) -> None:
+        ...
+
+    @abstractmethod
+    def set_result(self, job_id: str, result: Any) -> None:
+        ...
+
+    @abstractmethod
+    def get_result(self, job_id: str) -> Any:
+        ...
+
+    @abstractmethod
+    def exists(self, kind: str, statuses: Iterable[str], **filters) -> bool:
+        ...
+
+    @abstractmethod
+    def save_checkpoint(self, job_id: str, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def get_checkpoints(self, job_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def clear_checkpoints(self, job_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def evict_expired(self) -> int:
+        ...
+
+
+class SqlJobStore(JobStore):
+    """
+    Implementacja na SQLAlchemy - ta sama dla SQLite (pojedyncza instancja / dev)
+    i Postgresa (wspólny stan dla wielu workerów gunicorna i instancji Cloud Run).
+    ttl_seconds: czas życia zadania od ostatniej aktualizacji, potem jest usuwane.
+    """
+
+    def __init__(self, engine, ttl_seconds: float = 7 * 24 * 3600, table_prefix: str = "research_"):
+        self.engine = engine
+        self.ttl_seconds = ttl_seconds
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        metadata = sqlalchemy.MetaData()
+        self.jobs = sqlalchemy.Table(
+            f"{table_prefix}jobs", metadata,
+            sqlalchemy.Column("id", sqlalchemy.String(64), primary_key=True),
+            sqlalchemy.Column("kind", sqlalchemy.String(32), nullable=False),
+            sqlalchemy.Column("status", sqlalchemy.String(32), nullable=False, index=True),
+            sqlalchemy.Column("progress", sqlalchemy.String(64)),
+            sqlalchemy.Column("error", sqlalchemy.Text),
+            sqlalchemy.Column("original_filename", sqlalchemy.String(512), index=True),
+            sqlalchemy.Column("meta", sqlalchemy.Text, nullable=False, default="{}"),
+            sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+            sqlalchemy.Column("updated_at", sqlalchemy.Float, nullable=False),
+            sqlalchemy.Column("expires_at", sqlalchemy.Float, nullable=False, index=True),
+        )
+        self.results = sqlalchemy.Table(
+            f"{table_prefix}job_results", metadata,
+            sqlalchemy.Column("id", sqlalchemy.String(64), primary_key=True),
+            sqlalchemy.Column("result", sqlalchemy.Text, nullable=False),
+        )
+        self.checkpoints = sqlalchemy.Table(
+            f"{table_prefix}job_checkpoints", metadata,
+            sqlalchemy.Column("job_id", sqlalchemy.String(64), primary_key=True),
+            sqlalchemy.Column("key", sqlalchemy.String(512), primary_key=True),
+            sqlalchemy.Column("value", sqlalchemy.Text, nullable=False),
+            sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+        )
+        metadata.create_all(engine)
+
+    def create(self, job_id: str, kind: str, **fields) -> Dict[str, Any]:
+        now = time.time()
+        columns, meta = self._split(fields)
+        row = {
+            "id": job_id,
+            "kind": kind,
+            "status": columns.pop("status", "queued"),
+            "meta": json.dumps(meta, ensure_ascii=False),
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + self.ttl_seconds,
+            **columns,
+        }
+        with self.engine.begin() as conn:
+            conn.execute(self.jobs.insert().values(**row))
+        self._after_write()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                sqlalchemy.select(self.jobs).where(self.jobs.c.id == job_id)
+            ).mappings().first()
+        if row is None or row["expires_at"] < time.time():
+            return None
+        job = {key: row[key] for key in ("id", "created_at", "updated_at") + STATUS_COLUMNS}
+        job.update(json.loads(row["meta"] or "{}"))
+        return job
+
+    def update(self, job_id: str, **fields) -> None:
+        now = time.time()
+        columns, meta = self._split(fields)
+        values = {**columns, "updated_at": now, "expires_at": now + self.ttl_seconds}
+        with self.engine.begin() as conn:
+            if meta:
+                current = conn.execute(
+                    sqlalchemy.select(self.jobs.c.meta).where(self.jobs.c.id == job_id)
+                ).scalar()
+                merged = json.loads(current or "{}")
+                merged.update(meta)
+                values["meta"] = json.dumps(merged, ensure_ascii=False)
+            conn.execute(self.jobs.update().where(self.jobs.c.id == job_id).values(**values))
+        self._after_write()
+
+    def set_result(self, job_id: str, result: Any) -> None:
+        payload = json.dumps(result, ensure_ascii=False, default=str)
+        with self.engine.begin() as conn:
+            conn.execute(self.results.delete().where(self.results.c.id == job_id))
+            conn.execute(self.results.insert().values(id=job_id, result=payload))
+
+    def get_result(self, job_id: str) -> Any:
+        with self.engine.connect() as conn:
+            payload = conn.execute(
+                sqlalchemy.select(self.results.c.result).where(self.results.c.id == job_id)
+            ).scalar()
+        return json.loads(payload) if payload is not None else None
+
+    def exists(self, kind: str, statuses: Iterable[str], **filters) -> bool:
+        query = (
+            sqlalchemy.select(self.jobs.c.id)
+            .where(self.jobs.c.kind == kind)
+            .where(self.jobs.c.status.in_(list(statuses)))
+            .where(self.jobs.c.expires_at >= time.time())
+        )
+        for column, value in filters.items():
+            query = query.where(self.jobs.c[column] == value)
+        with self.engine.connect() as conn:
+            return conn.execute(query.limit(1)).first() is not None
+
+    def save_checkpoint(self, job_id: str, key: str, value: Any) -> None:
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        condition = (self.checkpoints.c.job_id == job_id) & (self.checkpoints.c.key == key)
+        with self.engine.begin() as conn:
+            conn.execute(self.checkpoints.delete().where(condition))
+            conn.execute(self.checkpoints.insert().values(job_id=job_id, key=key, value=payload, created_at=time.time()))
+
+    def get_checkpoints(self, job_id: str) -> Dict[str, Any]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                sqlalchemy.select(self.checkpoints.c.key, self.checkpoints.c.value)
+                .where(self.checkpoints.c.job_id == job_id)
+            ).all()
+        return {key: json.loads(value) for key, value in rows}
+
+    def clear_checkpoints(self, job_id: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(self.checkpoints.delete().where(self.checkpoints.c.job_id == job_id))
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        expired = sqlalchemy.select(self.jobs.c.id).where(self.jobs.c.expires_at < now)
+        with self.engine.begin() as conn:
+            conn.execute(self.results.delete().where(self.results.c.id.in_(expired)))
+            conn.execute(self.checkpoints.delete().where(self.checkpoints.c.job_id.in_(expired)))
+            deleted = conn.execute(self.jobs.delete().where(self.jobs.c.expires_at < now)).rowcount
+        if deleted:
+            logging.info(f"Usunięto {deleted} wygasłych zadań z magazynu zadań.")
+        return deleted
+
+    def _split(self, fields: Dict[str, Any]):
+        columns = {key: value for key, value in fields.items() if key in STATUS_COLUMNS}
+        meta = {key: value for key, value in fields.items() if key not in STATUS_COLUMNS and key != "id"}
+        if "progress" in columns and columns["progress"] is not None:
+            columns["progress"] = str(columns["progress"])
+        return columns, meta
+
+    def _after_write(self) -> None:
+        # sprzątanie co jakiś czas, żeby nie obciążać każdego zapisu
+        with self._lock:
+            self._writes += 1
+            if self._writes % 100:
+                return
+        try:
+            self.evict_expired()
+        except Exception as e:
+            logging.warning(f"Nie udało się usunąć wygasłych zadań: {e}")
+
+
+class JobCheckpoints:
+    """Checkpointy jednego zadania - widok na magazyn zadań przekazywany do run_engine."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+
+    def load(self) -> Dict[str, Any]:
+        return self.store.get_checkpoints(self.job_id)
+
+    def save(self, key: str, value: Any) -> None:
+        self.store.save_checkpoint(self.job_id, key, value)
+
+    def clear(self) -> None:
+        self.store.clear_checkpoints(self.job_id)
+
+
+class SQLiteJobStore(SqlJobStore):
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        engine = sqlalchemy.create_engine(
+            f"sqlite:///{path}",
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+        super().__init__(engine, ttl_seconds=ttl_seconds)
+
+
+class PostgresJobStore(SqlJobStore):
+    """Wspólny magazyn dla wielu instancji - korzysta z engine'u Cloud SQL aplikacji."""
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import threading
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration
+
+import config2
+import tracing
+from cache_store import CacheStore, SQLiteCacheStore
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Cache odpowiedzi LLM adresowany treścią.
+
+    Klucz to SHA-256 z konfiguracji modelu (llm_string z LangChain: model, temperature,
+    max_tokens, stop) oraz sformatowanych wiadomości. Dzięki temu ten sam scenariusz
+    uruchomiony ponownie nie płaci drugi raz za tokeny.
+    Backend (CacheStore) jest wymienny - domyślnie SQLite na dysku z TTL i LRU.
+    """
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        entry = self.store.get(self.make_key(prompt, llm_string))
+        if entry is not None:
+            try:
+                generations = loads(entry.value)
+            except Exception as e:
+                logging.warning(f"Nie udało się odczytać wpisu z cache LLM: {e}")
+                generations = None
+            if generations is not None:
+                self._count(hit=True)
+                return generations
+
+        self._count(hit=False)
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        try:
+            self.store.set(self.make_key(prompt, llm_string), dumps(list(return_val)))
+        except Exception as e:
+            # cache nie może wywrócić analizy
+            logging.warning(f"Nie udało się zapisać odpowiedzi do cache LLM: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "entries": len(self.store),
+            }
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            tracing.record(cache_hits=1)
+
+
+def init_llm_cache(store: Optional[CacheStore] = None) -> Optional[LLMResponseCache]:
+    """
+    Ustawia globalny cache LangChain - korzystają z niego wszystkie instancje ChatOpenAI
+    (wszyscy agenci), bez zmian w samych agentach.
+    """
+    if not config2.LLM_CACHE_ENABLED:
+        return None
+
+    current = get_llm_cache()
+    if store is None and isinstance(current, LLMResponseCache):
+        return current
+
+    if store is None:
+        store = SQLiteCacheStore(
+            config2.LLM_CACHE_PATH,
+            table="llm_responses",
+            ttl_seconds=config2.LLM_CACHE_TTL_SECONDS,
+            max_entries=config2.LLM_CACHE_MAX_ENTRIES,
+        )
+
+    cache = LLMResponseCache(store)
+    set_llm_cache(cache)
+    logging.info(f"Cache LLM aktywny ({type(store).__name__}).")
+    return cache
+
+
+def stream_with_cache(llm, messages: List[BaseMessage]) -> Iterator[str]:
+    """
+    Strumieniowanie odpowiedzi (llm.stream) z użyciem tego samego cache co invoke.
+    LangChain przy stream() pomija cache, więc sprawdzamy go sami: przy trafieniu
+    zwracamy całą odpowiedź jako jeden fragment, a po pełnym strumieniu zapisujemy wynik
+    pod tym samym kluczem, którego użyłoby invoke().
+    """
+    cache = get_llm_cache()
+    if not isinstance(cache, BaseCache) or getattr(llm, "cache", None) is False:
+        for chunk in llm.stream(messages):
+            yield chunk.content
+        return
+
+    llm_string = llm._get_llm_string()
+    prompt = dumps([msg.model_copy(update={"id": None}) if msg.id is not None else msg for msg in messages])
+
+    cached = cache.lookup(prompt, llm_string)
+    if isinstance(cached, list) and cached:
+        yield cached[0].text
+        return
+
+    parts = []
+    for chunk in llm.stream(messages):
+        parts.append(chunk.content)
+        yield chunk.content
+
+    cache.update(prompt, llm_string, [ChatGeneration(message=AIMessage(content="".join(parts)))])
@@ -0,0 +1,141 @@
+import functools
+import importlib.util
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+from openai import OpenAI
+
+import config2
+from rate_limiter import AsyncRateLimitedTransport, RateLimitedTransport
+from tracing import TokenUsageCallback
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_openai_client: Optional[OpenAI] = None
+_chat_models: Dict[Tuple[str, float, int], ChatOpenAI] = {}
+_token_usage_callback = TokenUsageCallback()
+
+
+@functools.lru_cache(maxsize=None)
+def _http2_available() -> bool:
+    # httpx obsługuje HTTP/2 tylko z pakietem h2 (httpx[http2]); bez niego zostaje HTTP/1.1 keep-alive
+    if not config2.LLM_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logging.warning("Brak pakietu h2 - klient LLM używa HTTP/1.1 z keep-alive.")
+        return False
+    return True
+
+
+def _transport_options() -> dict:
+    return {
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=config2.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config2.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config2.LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Wspólny dla całego procesu klient HTTP (pula połączeń keep-alive) do API OpenAI.
+    Transport przepuszcza zapytania przez wspólny limiter (rate_limiter.py).
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            transport = RateLimitedTransport(httpx.HTTPTransport(**_transport_options()))
+            _http_client = httpx.Client(
+                transport=transport,
+                timeout=httpx.Timeout(config2.LLM_TIMEOUT_SECONDS, connect=10.0),
+            )
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Asynchroniczny odpowiednik get_http_client (używany przez ainvoke/astream).
+    Pula połączeń httpx.AsyncClient jest związana z pętlą zdarzeń - klient jest przeznaczony
+    dla jednej pętli asyncio na proces.
+    """
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            transport = AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(**_transport_options()))
+            _async_http_client = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(config2.LLM_TIMEOUT_SECONDS, connect=10.0),
+            )
+        return _async_http_client
+
+
+def get_openai_client() -> OpenAI:
+    """Klient OpenAI SDK (embeddingi) na wspólnej puli połączeń."""
+    global _openai_client
+    http_client = get_http_client()
+    with _lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(
+                api_key=config2.OPENAI_API_KEY,
+                http_client=http_client,
+                max_retries=0,
+            )
+        return _openai_client
+
+
+def get_chat_model(temperature: float, max_tokens: int, model: Optional[str] = None) -> ChatOpenAI:
+    """
+    Współdzielona instancja ChatOpenAI dla danej konfiguracji (model, temperature, max_tokens).
+    Instancje są bezstanowe i bezpieczne wątkowo, więc agenci tworzeni per zapytanie
+    dostają gotowy model zamiast budować klienta i nawiązywać nowe połączenia TLS.
+    Domyślny model: config2.LLM_MODEL; ustawienia per model: config2.LLM_MODEL_SETTINGS.
+    """
+    model = model or config2.LLM_MODEL
+    key = (model, temperature, max_tokens)
+    with _lock:
+        chat_model = _chat_models.get(key)
+    if chat_model is not None:
+        return chat_model
+
+    settings = {
+        "timeout": config2.LLM_TIMEOUT_SECONDS,
+        # 429 / 5xx ponawia transport (rate_limiter) - SDK nie powinno ponawiać drugi raz
+        "max_retries": 0,
+        **config2.LLM_MODEL_SETTINGS.get(model, {}),
+    }
+    http_client = get_http_client()
+    async_http_client = get_async_http_client()
+
+    with _lock:
+        if key not in _chat_models:
+            _chat_models[key] = ChatOpenAI(
+                model=model,
+                api_key=lambda: config2.OPENAI_API_KEY,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                http_client=http_client,
+                http_async_client=async_http_client,
+                # zużycie tokenów trafia do spanów (tracing), także przy strumieniowaniu
+                callbacks=[_token_usage_callback],
+                stream_usage=True,
+                **settings,
+            )
+        return _chat_models[key]
+
+
+def close_clients() -> None:
+    """Zamyka wspólne połączenia (np. przy wyłączaniu procesu)."""
+    global _http_client, _async_http_client, _openai_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        _async_http_client = None
+        _openai_client = None
+        _chat_models.clear()
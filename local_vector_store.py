@@ -0,0 +1,254 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def _to_timestamp(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class LocalVectorStore:
+    """
+    Wbudowany magazyn wektorów dla wdrożeń jednowęzłowych, offline i testów
+    (ten sam interfejs save_batch / search / file_exists / find_embeddings co VectorSearch):
+    - embeddingi float32 w pliku .npy otwieranym jako memmap (system operacyjny
+      trzyma w pamięci tylko używane strony, RSS procesu pozostaje niski),
+    - metadane (plik, treść, czas wgrania, hashe treści fragmentu i pliku) w tabeli SQLite obok,
+    - wektory normalizowane przy zapisie, więc podobieństwo kosinusowe to iloczyn skalarny,
+    - top-k liczone wektorowo w blokach przez numpy.
+    """
+
+    def __init__(self, directory: str, initial_capacity: int = 1024, block_rows: int = 65536):
+        self.directory = directory
+        self.block_rows = block_rows
+        self.initial_capacity = initial_capacity
+        self.embeddings_path = os.path.join(directory, "embeddings.npy")
+        self._lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "metadata.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "row_id INTEGER PRIMARY KEY, filename TEXT NOT NULL, "
+            "content TEXT NOT NULL, created_at REAL NOT NULL, "
+            "content_hash TEXT, file_hash TEXT)"
+        )
+        # magazyny sprzed deduplikacji nie mają kolumn z hashami
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        for column in ("content_hash", "file_hash"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE documents ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_filename_idx ON documents (filename)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_created_at_idx ON documents (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_content_hash_idx ON documents (content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_file_hash_idx ON documents (file_hash)")
+        self._conn.commit()
+
+        self._embeddings = None
+        if os.path.exists(self.embeddings_path):
+            self._embeddings = np.load(self.embeddings_path, mmap_mode="r+")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def _next_row_id(self) -> int:
+        # wiersz w pliku .npy = row_id; liczymy od największego, a nie od COUNT(*)
+        return self._conn.execute("SELECT COALESCE(MAX(row_id) + 1, 0) FROM documents").fetchone()[0]
+
+    # --- ZAPIS ---
+
+    def save_batch(self, rows: Sequence[tuple]) -> None:
+        """Zapisuje paczkę (filename, content, embedding_vector, content_hash, file_hash)."""
+        if not rows:
+            return
+
+        vectors = np.asarray([row[2] for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            start = self._next_row_id()
+            self._ensure_capacity(start + len(rows), vectors.shape[1])
+            self._embeddings[start:start + len(rows)] = vectors
+            self._embeddings.flush()
+
+            now = time.time()
+            self._conn.executemany(
+                "INSERT INTO documents (row_id, filename, content, created_at, content_hash, file_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (start + i, filename, content, now, content_hash, file_hash)
+                    for i, (filename, content, _, content_hash, file_hash) in enumerate(rows)
+                ],
+            )
+            self._conn.commit()
+
+    def file_exists(self, filename: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM documents WHERE filename = ? LIMIT 1", (filename,)).fetchone()
+        return row is not None
+
+    def has_documents(self, filenames: Optional[Sequence[str]] = None) -> bool:
+        """Czy magazyn zawiera jakikolwiek fragment (opcjonalnie tylko z wybranych plików)."""
+        query, params = "SELECT 1 FROM documents LIMIT 1", ()
+        if filenames:
+            placeholders = ", ".join("?" for _ in filenames)
+            query, params = f"SELECT 1 FROM documents WHERE filename IN ({placeholders}) LIMIT 1", tuple(filenames)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone() is not None
+
+    def find_file(self, file_hash: str) -> Optional[str]:
+        """Nazwa pliku o identycznej treści (hash całego pliku), jeśli jest już w magazynie."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename FROM documents WHERE file_hash = ? LIMIT 1", (file_hash,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def find_embeddings(self, content_hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Zapisane już wektory fragmentów o danych hashach treści (hash -> wektor)."""
+        if not content_hashes:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT content_hash, MIN(row_id) FROM documents "
+                f"WHERE content_hash IN ({','.join('?' * len(content_hashes))}) GROUP BY content_hash",
+                list(content_hashes),
+            ).fetchall()
+            return {content_hash: np.array(self._embeddings[row_id]) for content_hash, row_id in rows}
+
+    def delete_file_versions(self, filename: str, keep_file_hash: str) -> int:
+        """Usuwa fragmenty poprzednich wersji pliku (inny hash pliku); zwraca liczbę usuniętych."""
+        return self._delete_where("filename = ? AND (file_hash IS NULL OR file_hash != ?)", (filename, keep_file_hash))
+
+    def delete_file_content(self, filename: str, file_hash: str) -> int:
+        """Usuwa fragmenty jednej wersji pliku (np. przerwanego wgrywania); zwraca liczbę usuniętych."""
+        return self._delete_where("filename = ? AND file_hash = ?", (filename, file_hash))
+
+    def _delete_where(self, condition: str, params: tuple) -> int:
+        with self._lock:
+            row_ids = [row[0] for row in self._conn.execute(f"SELECT row_id FROM documents WHERE {condition}", params)]
+            if not row_ids:
+                return 0
+            # wiersze .npy zostają (row_id = pozycja w pliku); zerujemy je, żeby nie wygrywały w wyszukiwaniu
+            self._embeddings[row_ids] = 0
+            self._embeddings.flush()
+            self._conn.executemany("DELETE FROM documents WHERE row_id = ?", [(row_id,) for row_id in row_ids])
+            self._conn.commit()
+        return len(row_ids)
+
+    def _ensure_capacity(self, needed: int, dim: int) -> None:
+        # wywoływane pod blokadą
+        if self._embeddings is not None:
+            if self._embeddings.shape[1] != dim:
+                raise ValueError(f"Wymiar wektora {dim} różni się od magazynu ({self._embeddings.shape[1]})")
+            if self._embeddings.shape[0] >= needed:
+                return
+
+        capacity = max(self.initial_capacity, needed)
+        if self._embeddings is not None:
+            capacity = max(capacity, self._embeddings.shape[0] * 2)
+
+        tmp_path = self.embeddings_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, dim))
+        if self._embeddings is not None:
+            used = self._next_row_id()
+            for offset in range(0, used, self.block_rows):
+                end = min(used, offset + self.block_rows)
+                grown[offset:end] = self._embeddings[offset:end]
+        grown.flush()
+        del grown
+        self._embeddings = None
+        os.replace(tmp_path, self.embeddings_path)
+        self._embeddings = np.load(self.embeddings_path, mmap_mode="r+")
+
+    # --- WYSZUKIWANIE ---
+
+    def search(
+        self,
+        query_vector,
+        k: int = 5,
+        filenames: Optional[Sequence[str]] = None,
+        created_after=None,
+        created_before=None,
+        **_ignored,
+    ) -> List[Dict]:
+        """
+        Top-k po podobieństwie kosinusowym; distance = 1 - cos (jak operator <=> w pgvector).
+        Parametry strojenia indeksu pgvector (ef_search, probes, exact) są ignorowane -
+        tutaj wyszukiwanie jest zawsze dokładne.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            count = self._next_row_id()
+            if self._embeddings is None or count == 0 or k <= 0:
+                return []
+
+            row_ids = self._filter_row_ids(filenames, created_after, created_before)
+            if row_ids is not None:
+                if row_ids.size == 0:
+                    return []
+                scores = self._embeddings[row_ids] @ query
+                candidates = row_ids
+            else:
+                scores = np.empty(count, dtype=np.float32)
+                for offset in range(0, count, self.block_rows):
+                    end = min(count, offset + self.block_rows)
+                    scores[offset:end] = self._embeddings[offset:end] @ query
+                candidates = np.arange(count)
+
+            top = min(k, scores.size)
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+
+            results = []
+            for index in best:
+                row_id = int(candidates[index])
+                row = self._conn.execute(
+                    "SELECT filename, content, created_at FROM documents WHERE row_id = ?", (row_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                filename, content, created_at = row
+                results.append({
+                    "row_id": row_id,
+                    "filename": filename,
+                    "content": content,
+                    "created_at": datetime.datetime.fromtimestamp(created_at),
+                    "distance": float(1 - scores[index]),
+                })
+        return results
+
+    def _filter_row_ids(self, filenames, created_after, created_before) -> Optional[np.ndarray]:
+        conditions, params = [], []
+        if filenames:
+            conditions.append(f"filename IN ({','.join('?' * len(filenames))})")
+            params += list(filenames)
+        if created_after is not None:
+            conditions.append("created_at >= ?")
+            params.append(_to_timestamp(created_after))
+        if created_before is not None:
+            conditions.append("created_at < ?")
+            params.append(_to_timestamp(created_before))
+        if not conditions:
+            return None
+
+        rows = self._conn.execute(
+            f"SELECT row_id FROM documents WHERE {' AND '.join(conditions)} ORDER BY row_id", params
+        ).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
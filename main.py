@@ -6,8 +6,9 @@ from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 
 import config2
-from safety_agent import safety_agent
+from safety_agent import safety_pass
 from scenario_agent_with_verificator import scenario_agent_with_verificator
+from llm_cache import init_llm_cache
 
 
 
@@ -451,6 +452,8 @@ dług publiczny w okolicach średniej unijnej
 
 if __name__ == "__main__":
 
+    init_llm_cache()
+
     external_agent = ExternalResearchAgent()
     predictive_agent = PredictiveImpactAgent()
     summary_agent = SummaryReportAgent()
@@ -459,7 +462,10 @@ if __name__ == "__main__":
     all_external_results_per_scenario = []
     HOME_COUNTRY_NAME = "Atlantis"
 
-    for scenario, weight in scenarios:
+    # Safety Agent - jeden przebieg dla kontekstu i wszystkich scenariuszy
+    sanitized_user_prompt, sanitized_scenarios = safety_pass(user_prompt, [scenario for scenario, _ in scenarios])
+
+    for (scenario, weight), sanitized_scenario in zip(scenarios, sanitized_scenarios):
 
         print("\n" + "=" * 100)
         print(f"SCENARIUSZ (waga={weight}):")
@@ -476,9 +482,6 @@ if __name__ == "__main__":
             print("❌ BŁĘDNA STRUKTURA:", resp)
             continue
 
-        # Safety Agent
-        sanitized_user_prompt, sanitized_scenario = safety_agent(user_prompt, scenario)
-
         print("\n===== OCZYSZCZONY SCENARIUSZ =====")
         print(sanitized_scenario)
 
@@ -0,0 +1,136 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional
+
+import pdfplumber
+from pypdf import PdfReader
+
+import config2
+
+# separator stron w pliku .txt (konwencja pdftotext) - chunker odtwarza z niego numery stron
+PAGE_SEPARATOR = "\f"
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Wspólna pula procesów do parsowania PDF (jedna na proces serwera).
+    Parsowanie stron to praca CPU - w wątkach blokowałaby GIL dla całego serwera.
+    Tryb "spawn": procesy nie dziedziczą wątków ani połączeń serwera. Proces potomny importuje
+    ten moduł (tylko config2, pypdf, pdfplumber) i moduł główny jako __mp_main__ - dlatego
+    flask_main nie tworzy przy imporcie klientów, połączeń ani cache (leniwe get_*/ensure_*).
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=config2.PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+
+
+def _reset_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """
+    Tekst stron [start, end). Najpierw szybka ścieżka pypdf (wystarcza dla PDF-ów tekstowych);
+    strony, z których pypdf wyciągnął mniej niż PDF_FASTPATH_MIN_CHARS znaków (skany z warstwą
+    tekstu, złożony układ), parsujemy ponownie pdfplumberem.
+    """
+    reader = PdfReader(path)
+    plumber = None
+    pages = []
+    try:
+        for number in range(start, end):
+            text = ""
+            if config2.PDF_FASTPATH_ENABLED:
+                try:
+                    text = reader.pages[number].extract_text() or ""
+                except Exception as e:
+                    logging.warning(f"pypdf nie odczytał strony {number + 1}: {e}")
+
+            if len(text.strip()) < config2.PDF_FASTPATH_MIN_CHARS:
+                if plumber is None:
+                    plumber = pdfplumber.open(path)
+                text = plumber.pages[number].extract_text() or text
+            pages.append(text)
+    finally:
+        if plumber is not None:
+            plumber.close()
+    return pages
+
+
+def iter_pdf_pages(path: str) -> Iterator[str]:
+    """
+    Tekst kolejnych stron PDF (w kolejności), parsowanych równolegle zakresami po PDF_PAGES_PER_TASK.
+    Małe dokumenty (jeden zakres) parsujemy w bieżącym procesie - narzut puli byłby większy niż zysk.
+    W toku jest najwyżej 2 * PDF_EXTRACT_WORKERS zakresów - kolejny zlecamy, gdy odbiorca pobierze
+    poprzedni, więc przy wolnym odbiorcy (backpressure potoku) tekst nie gromadzi się w pamięci.
+    """
+    total = len(PdfReader(path).pages)
+    step = max(1, config2.PDF_PAGES_PER_TASK)
+    ranges = [(start, min(start + step, total)) for start in range(0, total, step)]
+
+    if len(ranges) <= 1 or config2.PDF_EXTRACT_WORKERS <= 1:
+        for start, end in ranges:
+            yield from extract_page_range(path, start, end)
+        return
+
+    pool = get_process_pool()
+    window = 2 * config2.PDF_EXTRACT_WORKERS
+    pending = iter(ranges)
+    futures = deque()
+    try:
+        for start, end in itertools.islice(pending, window):
+            futures.append(pool.submit(extract_page_range, path, start, end))
+        # zakresy oddajemy po kolei - kolejne parsują się w tle, gdy poprzednie są zapisywane
+        while futures:
+            pages = futures.popleft().result()
+            for start, end in itertools.islice(pending, 1):
+                futures.append(pool.submit(extract_page_range, path, start, end))
+            yield from pages
+    except BrokenProcessPool:
+        # proces puli padł (np. brak pamięci) - następne zadanie dostanie nową pulę
+        _reset_process_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_pdf_text_to_file(pdf_path: str, txt_path: str) -> Iterator[str]:
+    """
+    Zapisuje tekst PDF do txt_path strumieniowo, strona po stronie (strony rozdziela PAGE_SEPARATOR),
+    i oddaje każdy zapisany kawałek - chunker może czytać dokument, zanim ekstrakcja się skończy.
+    Cały dokument nigdy nie jest składany w pamięci. Plik docelowy pojawia się dopiero po ostatniej
+    stronie (zapis do .part + os.replace), więc /research nigdy nie czyta połowy dokumentu.
+    """
+    partial_path = txt_path + ".part"
+    try:
+        with open(partial_path, "w", encoding="utf-8") as f:
+            for text in iter_pdf_pages(pdf_path):
+                block = text + "\n" + PAGE_SEPARATOR
+                f.write(block)
+                yield block
+        os.replace(partial_path, txt_path)
+    except BaseException:
+        # także przerwanie odczytu generatora (GeneratorExit)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
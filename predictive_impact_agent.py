@@ -2,10 +2,9 @@ import json
 from typing import Dict, List
 
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 
-import config2
+from llm_clients import get_chat_model
 from safety_agent import safety_agent
 from scenario_agent_with_verificator import scenario_agent_with_verificator
 
@@ -14,12 +13,7 @@ class PredictiveImpactAgent:
 
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4.1",
-            api_key=lambda: config2.OPENAI_API_KEY,
-            temperature=0.3,
-            max_tokens=900,
-        )
+        self.llm = get_chat_model(temperature=0.3, max_tokens=900)
 
         self.prompt = ChatPromptTemplate.from_messages([
             (
@@ -37,6 +31,7 @@ class PredictiveImpactAgent:
                 "Kontekst państwa Atlantis:\n{home_context}\n\n"
                 "Scenariusz sytuacyjny:\n{scenario}\n\n"
                 "Analizy wpływu zewnętrznego (dla różnych krajów i tematów):\n{external_analyses}\n\n"
+                "Fragmenty dokumentów wgranych przez analityków:\n{reference_docs}\n\n"
                 "Zadanie:\n"
                 "Przygotuj PROGNOZĘ dla państwa Atlantis w następującej, DOKŁADNIE określonej strukturze:\n\n"
                 "{{\n"
@@ -59,6 +54,7 @@ class PredictiveImpactAgent:
         home_context: str,
         scenario: str,
         external_results: Dict[str, Dict[str, str]],
+        reference_docs: str = "",
     ) -> Dict[str, str] | None:
         """
         Zwraca słownik:
@@ -85,6 +81,7 @@ class PredictiveImpactAgent:
             home_context=home_context,
             scenario=scenario,
             external_analyses=external_analyses_text,
+            reference_docs=reference_docs or "(brak)",
         )
 
         try:
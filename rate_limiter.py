@@ -0,0 +1,354 @@
+import asyncio
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+import requests
+
+import config2
+import tracing
+
+# statusy, przy których ponawiamy zapytanie (limit, timeout, chwilowe błędy serwera)
+RETRYABLE_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    Wiadro żetonów uzupełniane ze stałą szybkością per_minute / 60 na sekundę.
+    reserve() pobiera żetony od razu (stan może zejść poniżej zera) i zwraca, ile trzeba
+    odczekać - dzięki temu oczekujący są obsługiwani w kolejności zgłoszeń,
+    a ten sam mechanizm działa w wątkach i w asyncio.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            # pojedyncze zapytanie większe niż całe wiadro i tak musi kiedyś przejść
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Zwraca nadmiarowo pobrane żetony (ujemna wartość dobiera brakujące)."""
+        with self._lock:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Wspólny limit dla jednego zasobu (model OpenAI, Tavily): zapytania/min i tokeny/min.
+    pause() wstrzymuje wszystkie wywołania tego zasobu, np. po 429 z nagłówkiem Retry-After.
+    Limity obowiązują w obrębie procesu - przy kilku instancjach należy je podzielić.
+    """
+
+    def __init__(self, name: str, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.waited_seconds = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 0) -> float:
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            waits.append(self.tokens.reserve(tokens))
+        with self._lock:
+            waits.append(self.paused_until - time.monotonic())
+            wait = max(waits)
+            self.waited_seconds += wait
+        return wait
+
+    def acquire(self, tokens: int = 0) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Rozliczenie zapytania wg rzeczywistego zużycia tokenów (usage z odpowiedzi)."""
+        if self.tokens is not None:
+            self.tokens.refund(reserved - used)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.rate_limited += 1
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+        tracing.record(retries=1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "waited_seconds": round(self.waited_seconds, 3),
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+            }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> RateLimiter:
+    """
+    Limiter procesu dla zasobu: "tavily", "openai:<model>" (czat) albo "openai-embeddings:<model>".
+    Każdy model ma własne limity: config2.OPENAI_RATE_LIMITS (per model) lub domyślne
+    OPENAI_RPM / OPENAI_TPM dla czatu i OPENAI_EMBEDDING_RPM / OPENAI_EMBEDDING_TPM dla embeddingów.
+    Bez RATE_LIMIT_ENABLED limiter nie ma limitów na minutę - zostają ponowienia i wspólna pauza po 429.
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            if not config2.RATE_LIMIT_ENABLED:
+                _limiters[name] = RateLimiter(name)
+            elif name == "tavily":
+                _limiters[name] = RateLimiter(name, requests_per_minute=config2.TAVILY_RPM)
+            else:
+                resource, model = name.split(":", 1)
+                if resource == "openai-embeddings":
+                    defaults = (config2.OPENAI_EMBEDDING_RPM, config2.OPENAI_EMBEDDING_TPM)
+                else:
+                    defaults = (config2.OPENAI_RPM, config2.OPENAI_TPM)
+                limits = config2.OPENAI_RATE_LIMITS.get(model, {})
+                _limiters[name] = RateLimiter(
+                    name,
+                    requests_per_minute=limits.get("rpm", defaults[0]),
+                    tokens_per_minute=limits.get("tpm", defaults[1]),
+                )
+        return _limiters[name]
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def backoff_delay(attempt: int) -> float:
+    """Wykładniczy backoff z pełnym jitterem (losowo z przedziału [0, base * 2^attempt])."""
+    return random.uniform(0, min(config2.RATE_LIMIT_BACKOFF_MAX_SECONDS, config2.RATE_LIMIT_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Czas z nagłówków retry-after-ms / Retry-After (sekundy albo data HTTP)."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _retry_wait(limiter: RateLimiter, attempt: int, status: Optional[int], headers) -> float:
+    limiter.record_retry()
+    retry_after = retry_after_seconds(headers)
+    wait = max(retry_after or 0.0, backoff_delay(attempt))
+    if status == 429:
+        # limit dotyczy wszystkich wywołań zasobu, nie tylko tego jednego
+        limiter.pause(retry_after if retry_after is not None else wait)
+    return wait
+
+
+def call_with_retries(limiter: RateLimiter, fn: Callable, *args, tokens: int = 0, **kwargs) -> Any:
+    """
+    Wywołanie fn z limitem i ponowieniami (dla klientów spoza httpx, np. requests w Tavily).
+    Ponawiane są błędy sieci i statusy z RETRYABLE_STATUSES; pozostałe błędy przechodzą dalej.
+    """
+    max_retries = config2.RATE_LIMIT_MAX_RETRIES
+    for attempt in range(max_retries + 1):
+        limiter.acquire(tokens)
+        try:
+            return fn(*args, **kwargs)
+        except requests.HTTPError as e:
+            response = e.response
+            status = response.status_code if response is not None else None
+            if status not in RETRYABLE_STATUSES or attempt == max_retries:
+                raise
+            wait = _retry_wait(limiter, attempt, status, response.headers)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+            wait = _retry_wait(limiter, attempt, None, None)
+        logging.warning(f"Ponowienie zapytania {limiter.name} za {wait:.1f} s (próba {attempt + 2}/{max_retries + 1}).")
+        time.sleep(wait)
+
+
+def estimate_request_tokens(request: httpx.Request) -> Optional[tuple]:
+    """
+    (nazwa limitera, szacowane tokeny, czy rozliczyć wg usage) dla zapytania do API OpenAI:
+    prompt (~4 znaki na token) + szacowana odpowiedź (OPENAI_COMPLETION_ESTIMATE_TOKENS, najwyżej
+    max_tokens - pobieranie całego max_tokens dławiłoby limiter kilkukrotnie ponad rzeczywiste zużycie).
+    Odpowiedzi bez strumienia zawierają usage, więc są potem rozliczane. None dla innych zapytań.
+    """
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return None
+    if not isinstance(body, dict) or "model" not in body:
+        return None
+
+    if request.url.path.endswith("/embeddings"):
+        inputs = body.get("input")
+        texts = inputs if isinstance(inputs, list) else [inputs]
+        return f"openai-embeddings:{body['model']}", sum(len(str(text)) for text in texts) // 4 + 1, True
+
+    prompt_chars = sum(len(json.dumps(message.get("content"), ensure_ascii=False)) for message in body.get("messages", []))
+    completion = config2.OPENAI_COMPLETION_ESTIMATE_TOKENS
+    max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+    if max_tokens:
+        completion = min(completion, max_tokens)
+    return f"openai:{body['model']}", prompt_chars // 4 + 1 + completion, not body.get("stream")
+
+
+def _used_tokens(response: httpx.Response) -> Optional[int]:
+    """total_tokens z usage wczytanej odpowiedzi (None, jeśli go nie ma)."""
+    try:
+        usage = response.json().get("usage") or {}
+    except (ValueError, AttributeError):
+        return None
+    total = usage.get("total_tokens")
+    return total if isinstance(total, int) else None
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    Transport httpx wspólnego klienta OpenAI (llm_clients): każde zapytanie przechodzi przez
+    limiter swojego modelu, a 429 / 5xx / błędy sieci są ponawiane z backoffem i Retry-After.
+    Działa dla wszystkich agentów i embeddingów bez zmian w ich kodzie.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = estimate_request_tokens(request)
+        limiter = get_limiter(estimate[0]) if estimate else None
+        max_retries = config2.RATE_LIMIT_MAX_RETRIES if limiter else 0
+
+        for attempt in range(max_retries + 1):
+            if limiter is not None:
+                limiter.acquire(estimate[1])
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt == max_retries:
+                    raise
+                wait = _retry_wait(limiter, attempt, None, None)
+            else:
+                if response.status_code not in RETRYABLE_STATUSES or attempt == max_retries:
+                    if limiter is not None and estimate[2] and response.status_code == 200:
+                        # odpowiedź bez strumienia i tak jest czytana w całości - wczytujemy ją tu, żeby rozliczyć usage
+                        response.read()
+                        used = _used_tokens(response)
+                        if used is not None:
+                            limiter.settle(estimate[1], used)
+                    return response
+                wait = _retry_wait(limiter, attempt, response.status_code, response.headers)
+                response.close()
+            logging.warning(f"Ponowienie zapytania {limiter.name} za {wait:.1f} s (próba {attempt + 2}/{max_retries + 1}).")
+            time.sleep(wait)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Asynchroniczny odpowiednik RateLimitedTransport (ainvoke/astream)."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = estimate_request_tokens(request)
+        limiter = get_limiter(estimate[0]) if estimate else None
+        max_retries = config2.RATE_LIMIT_MAX_RETRIES if limiter else 0
+
+        for attempt in range(max_retries + 1):
+            if limiter is not None:
+                await limiter.acquire_async(estimate[1])
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt == max_retries:
+                    raise
+                wait = _retry_wait(limiter, attempt, None, None)
+            else:
+                if response.status_code not in RETRYABLE_STATUSES or attempt == max_retries:
+                    if limiter is not None and estimate[2] and response.status_code == 200:
+                        await response.aread()
+                        used = _used_tokens(response)
+                        if used is not None:
+                            limiter.settle(estimate[1], used)
+                    return response
+                wait = _retry_wait(limiter, attempt, response.status_code, response.headers)
+                await response.aclose()
+            logging.warning(f"Ponowienie zapytania {limiter.name} za {wait:.1f} s (próba {attempt + 2}/{max_retries + 1}).")
+            await asyncio.sleep(wait)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RateLimitedSearchTool:
+    """
+    Nakładka na TavilySearchResults z limitem zapytań Tavily i ponowieniami.
+    Oryginalne narzędzie zamienia błędy HTTP na tekst (repr wyjątku), więc wołamy
+    api_wrapper bezpośrednio - wtedy widać status 429 i nagłówek Retry-After.
+    Interfejs invoke({"query": ...}) jest taki sam jak w oryginalnym narzędziu.
+    """
+
+    def __init__(self, search_tool, limiter: Optional[RateLimiter] = None):
+        self.search_tool = search_tool
+        self.limiter = limiter or get_limiter("tavily")
+
+    def invoke(self, tool_input: dict) -> Any:
+        tool = self.search_tool
+        raw_results = call_with_retries(
+            self.limiter,
+            tool.api_wrapper.raw_results,
+            tool_input["query"],
+            tool.max_results,
+            tool.search_depth,
+            tool.include_domains,
+            tool.exclude_domains,
+            tool.include_answer,
+            tool.include_raw_content,
+            tool.include_images,
+        )
+        return tool.api_wrapper.clean_results(raw_results["results"])
@@ -0,0 +1,70 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from external_research_agent_2 import ExternalResearchAgent
+from search_cache import normalize_query
+
+
+@dataclass
+class SearchPlan:
+    """
+    Plan wyszukiwań dla całego zadania /research:
+    unikalne pary (kraj, temat) zebrane ze wszystkich scenariuszy.
+    """
+    cells: List[Tuple[str, str]] = field(default_factory=list)
+    total_cells: int = 0
+    # komórki odtworzone z checkpointów wznawianego zadania (bez wyszukiwania)
+    completed_cells: int = 0
+
+    @property
+    def distinct_searches(self) -> int:
+        return len(self.cells)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """
+        Jaka część komórek do przeanalizowania nie wymaga własnego wyszukiwania (0.0 = brak powtórzeń).
+        Komórki odtworzone z checkpointów nie są wyszukiwane, ale nie są też powtórzeniami - nie liczymy ich.
+        """
+        pending_cells = self.total_cells - self.completed_cells
+        if not pending_cells:
+            return 0.0
+        return round(1 - self.distinct_searches / pending_cells, 3)
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_cells": self.total_cells,
+            "distinct_searches": self.distinct_searches,
+            "dedup_ratio": self.dedup_ratio,
+            "completed_cells": self.completed_cells,
+        }
+
+
+def plan_searches(
+    scenario_specs: List[Dict],
+    completed: Optional[Set[Tuple[int, str, str]]] = None,
+) -> SearchPlan:
+    """
+    scenario_specs: lista słowników z kluczami "countries" i "subjects" (oraz "index").
+    Wyszukiwanie nie zależy od treści scenariusza, więc pary powtarzające się
+    między scenariuszami (np. "Niemcy"/"Motoryzacja") wykonujemy tylko raz.
+    completed: komórki (indeks scenariusza, kraj, temat) już przeanalizowane - nie wyszukujemy ich.
+    """
+    plan = SearchPlan()
+    seen = set()
+    completed = completed or set()
+
+    for spec in scenario_specs:
+        for country in spec["countries"]:
+            for subject in spec["subjects"]:
+                plan.total_cells += 1
+                if (spec.get("index"), country, subject) in completed:
+                    plan.completed_cells += 1
+                    continue
+                key = normalize_query(ExternalResearchAgent.build_query(country, subject))
+                if key in seen:
+                    continue
+                seen.add(key)
+                plan.cells.append((country, subject))
+
+    return plan
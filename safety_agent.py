@@ -1,31 +1,34 @@
+import hashlib
 import json
+import logging
+import threading
 
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
 import config2
+from cache_store import SQLiteCacheStore
+import tracing
+from llm_clients import get_chat_model
 
 
 # ✅ POPRAWIONY PROMPT SYSTEMOWY (literówki + jednoznaczność)
+# Wszystkie teksty zapytania (kontekst państwa + scenariusze) idą w jednym wywołaniu.
 system_prompt = """Jesteś analitykiem bezpieczeństwa dla fikcyjnego kraju Atlantis.
-W tekście, który dostaniesz, usuń TYLKO dane poufne.
-Zwróć WYŁĄCZNIE poprawny obiekt JSON z DWOMA polami: scenario oraz context.
-Nie dodawaj żadnego dodatkowego tekstu.
+W każdym z tekstów, które dostaniesz, usuń TYLKO dane poufne.
+Dostaniesz obiekt JSON {{"texts": [{{"id": ..., "text": ...}}]}}.
+Zwróć WYŁĄCZNIE poprawny obiekt JSON w tym samym formacie: dla każdego id pole text po redakcji.
+Nie pomijaj żadnego id i nie dodawaj żadnego dodatkowego tekstu.
 """
 
-user_prompt_template = """scenario:
-{scenario}
+batch_prompt = ChatPromptTemplate.from_messages([
+    ("system", system_prompt),
+    ("user", "{payload}"),
+])
 
-context:
-{context}
-"""
-
-api_key = config2.OPENAI_API_KEY
-model_name = "gpt-4.1"
+_redaction_store = None
+_redaction_store_lock = threading.Lock()
 
-llm = ChatOpenAI(
-    model=model_name,
-    api_key=lambda: api_key,
+llm = get_chat_model(
     temperature=0.4,   # mniej losowości = stabilniejszy JSON
     max_tokens=8000   # rozsądny limit
 )
@@ -37,42 +40,106 @@ def load_json(path):
 
 
 def safety_agent(user_prompt, scenario):
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("user", user_prompt_template)
-    ])
-
-    chain = prompt | llm
+    """Pojedyncza para (kontekst, scenariusz) - zgodność wsteczna; korzysta z safety_pass."""
+    sanitized_context, sanitized_scenarios = safety_pass(user_prompt, [scenario])
+    return sanitized_context, sanitized_scenarios[0]
+
+
+def _text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_redaction_store():
+    """Wspólny cache zredagowanych tekstów (klucz: SHA-256 treści) - jeden na proces."""
+    global _redaction_store
+    if not config2.SAFETY_CACHE_ENABLED:
+        return None
+    with _redaction_store_lock:
+        if _redaction_store is None:
+            _redaction_store = SQLiteCacheStore(
+                config2.SAFETY_CACHE_PATH,
+                table="safety_redactions",
+                ttl_seconds=config2.SAFETY_CACHE_TTL_SECONDS,
+                max_entries=config2.SAFETY_CACHE_MAX_ENTRIES,
+            )
+        return _redaction_store
+
+
+def _iter_batches(texts, max_chars):
+    # odpowiedź ma podobną długość jak wejście - paczka musi zmieścić się w max_tokens modelu
+    batch, batch_chars = [], 0
+    for text in texts:
+        if batch and batch_chars + len(text) > max_chars:
+            yield batch
+            batch, batch_chars = [], 0
+        batch.append(text)
+        batch_chars += len(text)
+    if batch:
+        yield batch
+
+
+def _redact_batch(texts):
+    """Jedno wywołanie LLM dla paczki tekstów; zwraca słownik tekst -> tekst zredagowany (bez braków)."""
+    payload = json.dumps({"texts": [{"id": i, "text": text} for i, text in enumerate(texts)]}, ensure_ascii=False)
+    messages = batch_prompt.format_messages(payload=payload)
 
     try:
-        response = chain.invoke({
-            "scenario": scenario,
-            "context": user_prompt
-        })
-
-        print("✅ SUROWA ODPOWIEDŹ LLM:")
-        print(response.content)
-
+        response = llm.bind(response_format={"type": "json_object"}).invoke(messages)
         loads = json.loads(response.content)
-
-        if "context" not in loads or "scenario" not in loads:
-            raise ValueError("Brakuje kluczy 'context' lub 'scenario' w odpowiedzi JSON")
-
-        print("✅ OCZYSZCZONY CONTEXT:")
-        print(loads["context"])
-
-        print("✅ OCZYSZCZONY SCENARIO:")
-        print(loads["scenario"])
-
-        return loads["context"], loads["scenario"]
-
+        redacted = {item["id"]: item["text"] for item in loads["texts"]}
     except json.JSONDecodeError:
         print("BŁĄD: Model nie zwrócił poprawnego JSON-a!")
-        print(response.content)
-        return None, None
-
+        return {}
     except Exception as e:
         print("BŁĄD KRYTYCZNY:")
         print(e)
-        return None, None
+        return {}
+
+    result = {}
+    for i, text in enumerate(texts):
+        if isinstance(redacted.get(i), str):
+            result[text] = redacted[i]
+        else:
+            print(f"BŁĄD: brak tekstu {i} w odpowiedzi JSON")
+    return result
+
+
+def sanitize_texts(texts):
+    """
+    Redaguje listę tekstów i zwraca listę tej samej długości (None dla tekstu, którego nie udało się
+    zredagować). Teksty są deduplikowane, zredagowane wcześniej są brane z cache po hashu treści,
+    a wszystkie nowe idą paczkami w jednym ustrukturyzowanym wywołaniu LLM.
+    """
+    store = get_redaction_store()
+    redacted = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        entry = store.get(_text_key(text)) if store is not None else None
+        if entry is not None:
+            redacted[text] = entry.value
+            tracing.record(cache_hits=1)
+        else:
+            missing.append(text)
+
+    for batch in _iter_batches(missing, config2.SAFETY_BATCH_MAX_CHARS):
+        batch_result = _redact_batch(batch)
+        for text, sanitized in batch_result.items():
+            redacted[text] = sanitized
+            if store is not None:
+                try:
+                    store.set(_text_key(text), sanitized)
+                except Exception as e:
+                    logging.warning(f"Nie udało się zapisać redakcji do cache: {e}")
+
+    print(f"✅ REDAKCJA: {len(redacted)}/{len(set(texts))} tekstów, nowych do LLM: {len(missing)}")
+    return [redacted.get(text) for text in texts]
+
+
+def safety_pass(user_prompt, scenarios):
+    """
+    Jeden przebieg safety dla całego zapytania: kontekst państwa i wszystkie scenariusze.
+    Zwraca (zredagowany kontekst, lista zredagowanych scenariuszy); None w miejscu tekstu,
+    którego nie udało się zredagować.
+    """
+    sanitized = sanitize_texts([user_prompt] + list(scenarios))
+    return sanitized[0], sanitized[1:]
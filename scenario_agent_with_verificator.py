@@ -1,18 +1,12 @@
 import json
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
-import config2
+from llm_clients import get_chat_model
 
 
 def scenario_agent_with_verificator(user_prompt, scenario, weight):
-    # Inicjalizacja klienta LLM
-    llm = ChatOpenAI(
-        model="gpt-4.1",
-        api_key=lambda: config2.OPENAI_API_KEY,
-        temperature=0.2,   # mniejsza losowość = stabilniejszy JSON
-        max_tokens=8000
-    )
+    # Współdzielony klient LLM (mniejsza losowość = stabilniejszy JSON)
+    llm = get_chat_model(temperature=0.2, max_tokens=8000)
 
     # Przygotowanie prostego promptu: stałe role system i user
     prompt = ChatPromptTemplate.from_messages([
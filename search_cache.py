@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+from typing import Any, Optional
+
+import config2
+import tracing
+from cache_store import CacheStore, SQLiteCacheStore
+
+_default_store: Optional[CacheStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_search_store() -> CacheStore:
+    """Jeden wspólny magazyn wyników wyszukiwania na proces."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SQLiteCacheStore(
+                config2.SEARCH_CACHE_PATH,
+                table="search_results",
+                # wpis jest przydatny do końca okna "stale", potem znika
+                ttl_seconds=config2.SEARCH_CACHE_TTL_SECONDS + config2.SEARCH_CACHE_STALE_SECONDS,
+                max_entries=config2.SEARCH_CACHE_MAX_ENTRIES,
+            )
+        return _default_store
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class CachedSearchTool:
+    """
+    Nakładka na TavilySearchResults z cache i oknami świeżości:
+    - wpis młodszy niż ttl_seconds -> zwracamy od razu, bez sieci,
+    - wpis starszy, ale w oknie stale_seconds -> zwracamy stary wynik
+      i odświeżamy go w tle (stale-while-revalidate),
+    - brak wpisu -> zwykłe zapytanie; równoległe identyczne zapytania czekają
+      na pierwsze zamiast odpytywać Tavily kilka razy.
+    Interfejs invoke({"query": ...}) jest taki sam jak w oryginalnym narzędziu.
+    """
+
+    def __init__(
+        self,
+        search_tool,
+        max_results: int,
+        search_depth: str,
+        store: Optional[CacheStore] = None,
+        ttl_seconds: Optional[float] = None,
+        stale_seconds: Optional[float] = None,
+    ):
+        self.search_tool = search_tool
+        self.max_results = max_results
+        self.search_depth = search_depth
+        self.store = store or get_search_store()
+        self.ttl_seconds = config2.SEARCH_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.stale_seconds = config2.SEARCH_CACHE_STALE_SECONDS if stale_seconds is None else stale_seconds
+
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def make_key(self, query: str) -> str:
+        raw = json.dumps(
+            [normalize_query(query), self.max_results, self.search_depth],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def invoke(self, tool_input: dict) -> Any:
+        query = tool_input["query"]
+        key = self.make_key(query)
+
+        cached = self._lookup(key)
+        if cached is not None:
+            tracing.record(cache_hits=1)
+            return cached
+
+        with self._key_lock(key):
+            # ktoś inny mógł już pobrać ten sam wynik, gdy czekaliśmy na blokadę
+            cached = self._lookup(key)
+            if cached is not None:
+                tracing.record(cache_hits=1)
+                return cached
+            return self._fetch_and_store(key, query)
+
+    def _lookup(self, key: str) -> Any:
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+
+        age = entry.age
+        if age > self.ttl_seconds + self.stale_seconds:
+            return None
+
+        payload = json.loads(entry.value)
+        if age > self.ttl_seconds:
+            self._refresh_in_background(key, payload["query"])
+
+        return payload["results"]
+
+    def _fetch_and_store(self, key: str, query: str) -> Any:
+        results = self.search_tool.invoke({"query": query})
+        # nie cache'ujemy komunikatów błędów zwracanych przez narzędzie jako tekst
+        if isinstance(results, list):
+            try:
+                self.store.set(key, json.dumps({"query": query, "results": results}, ensure_ascii=False))
+            except Exception as e:
+                logging.warning(f"Nie udało się zapisać wyników wyszukiwania do cache: {e}")
+        return results
+
+    def _refresh_in_background(self, key: str, query: str) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def worker():
+            try:
+                with self._key_lock(key):
+                    self._fetch_and_store(key, query)
+            except Exception as e:
+                logging.warning(f"Odświeżanie wyników wyszukiwania w tle nie powiodło się: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
@@ -170,14 +170,16 @@ def check_embedding_status(file_id, column):
             status = status_data.get('status')
             progress = status_data.get('progress', 'N/A')
 
-            if status == 'processing_embedding':
+            if status == 'processing_extraction':
+                status_placeholder.info("Status Embeddingu: EKSTRAKCJA TEKSTU Z PDF")
+            elif status == 'processing_embedding':
                 status_placeholder.info(f"Status Embeddingu: W TRAKCIE (Postęp: {progress})")
             elif status == 'done':
                 status_placeholder.success("✅ Embedding i zapis do DB ZAKOŃCZONY.")
                 return
             elif status == 'error':
                 status_placeholder.error(
-                    f"❌ BŁĄD Embeddingu: {status_data.get('error_details', 'Sprawdź logi serwera.')}")
+                    f"❌ BŁĄD Embeddingu: {status_data.get('error') or status_data.get('error_details', 'Sprawdź logi serwera.')}")
                 return
 
             time.sleep(3)  # Oczekiwanie 3 sekundy przed kolejnym zapytaniem
@@ -185,8 +187,60 @@ def check_embedding_status(file_id, column):
         status_placeholder.warning("⚠️ Przekroczono czas oczekiwania na zakończenie embeddingu.")
 
 
+def iter_sse_events(research_id):
+    """Czyta strumień SSE z /events i zwraca kolejne (nazwa_zdarzenia, dane)."""
+    url = f"{FLASK_API_URL}/events?research_id={research_id}"
+    with requests.get(url, stream=True, timeout=(10, RESEARCH_QUEUE_TIMEOUT)) as response:
+        response.raise_for_status()
+        event, data = None, []
+        for line in response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line == "":
+                if event:
+                    yield event, json.loads("\n".join(data) or "{}")
+                event, data = None, []
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+
+
+def follow_research_events(research_id):
+    """Pokazuje postęp analizy na żywo (SSE). Zwraca False, jeśli strumień jest niedostępny."""
+    status_placeholder = st.empty()
+    try:
+        for event, data in iter_sse_events(research_id):
+            if event == "cell_completed":
+                status_placeholder.info(
+                    f"Status Analizy: W TRAKCIE ({data.get('completed')}/{data.get('total')}) - "
+                    f"{data.get('country')} | {data.get('subject')}"
+                )
+            elif event == "report_started":
+                status_placeholder.info("Status Analizy: generowanie raportu zbiorczego...")
+            elif event == "done":
+                st.subheader("✅ RAPORT KOŃCOWY (Skrót)")
+                st.code(data.get('brief_summary') or get_status_api(research_id).get('result'), language='markdown')
+                status_placeholder.empty()
+                return True
+            elif event == "error":
+                st.error(f"❌ BŁĄD Analizy: {data.get('error', 'Sprawdź logi serwera.')}")
+                status_placeholder.empty()
+                return True
+            else:
+                status_placeholder.info(f"Status Analizy: {event}")
+    except Exception:
+        status_placeholder.empty()
+        return False
+    return False
+
+
 def check_research_status(research_id):
     """Monitoruje status zadania analitycznego i wyświetla raport końcowy."""
+    if follow_research_events(research_id):
+        return
+
+    # awaryjnie: odpytywanie /status
     start_time = time.time()
     status_placeholder = st.empty()
 
@@ -203,7 +257,7 @@ def check_research_status(research_id):
             status_placeholder.empty()
             return
         elif status == 'error':
-            st.error(f"❌ BŁĄD Analizy: {status_data.get('error_details', 'Sprawdź logi serwera.')}")
+            st.error(f"❌ BŁĄD Analizy: {status_data.get('error') or status_data.get('error_details', 'Sprawdź logi serwera.')}")
             status_placeholder.empty()
             return
 
@@ -1,23 +1,27 @@
+import re
+from typing import Iterator
+
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
 
-import config2
+from llm_clients import get_chat_model
+from llm_cache import stream_with_cache
 
 
 class SummaryBriefAgent:
     """
     Agent, który robi krótkie streszczenie (250–300 słów)
     na podstawie pełnego raportu tekstowego.
+
+    Streszczenie może wystartować z częściowego raportu, gdy sekcja rekomendacji
+    jest już kompletna (patrz is_report_ready).
     """
 
+    RECOMMENDATIONS_HEADING = "## Rekomendacje"
+    FALLBACK_SUMMARY = "Nie udało się wygenerować krótkiego streszczenia raportu."
+
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4.1",
-            api_key=lambda: config2.OPENAI_API_KEY,
-            temperature=0.3,
-            max_tokens=600,
-        )
+        self.llm = get_chat_model(temperature=0.3, max_tokens=600)
 
         self.prompt = ChatPromptTemplate.from_messages([
             (
@@ -40,6 +44,19 @@ class SummaryBriefAgent:
             ),
         ])
 
+    @classmethod
+    def is_report_ready(cls, partial_report: str) -> bool:
+        """
+        Czy częściowy raport wystarcza do streszczenia: sekcja rekomendacji jest zamknięta
+        kolejnym nagłówkiem. Liczba rekomendacji nie jest znana (5–7), więc bez takiego nagłówka
+        streszczenie czeka na koniec strumienia raportu.
+        """
+        start = partial_report.find(cls.RECOMMENDATIONS_HEADING)
+        if start < 0:
+            return False
+        section = partial_report[start + len(cls.RECOMMENDATIONS_HEADING):]
+        return re.search(r"^#{1,2} ", section, flags=re.MULTILINE) is not None
+
     def build_brief_summary(self, full_report: str) -> str:
         messages = self.prompt.format_messages(full_report=full_report)
 
@@ -48,5 +65,20 @@ class SummaryBriefAgent:
             return response.content
         except Exception as e:
             print("❌ Błąd LLM (krótkie streszczenie):", e)
-            return "Nie udało się wygenerować krótkiego streszczenia raportu."
+            return self.FALLBACK_SUMMARY
+
+    def stream_brief_summary(self, full_report: str) -> Iterator[str]:
+        messages = self.prompt.format_messages(full_report=full_report)
+
+        yielded = False
+        try:
+            for chunk in stream_with_cache(self.llm, messages):
+                yielded = True
+                yield chunk
+        except Exception as e:
+            print("❌ Błąd LLM (krótkie streszczenie, stream):", e)
+            # przerwany w połowie tekst nie może udawać kompletnego wyniku (trafiłby do checkpointu)
+            if yielded:
+                raise
+            yield self.FALLBACK_SUMMARY
 
@@ -1,8 +1,10 @@
 import json
+from typing import Iterator
+
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
-import config2
+from llm_clients import get_chat_model
+from llm_cache import stream_with_cache
 
 
 class SummaryReportAgent:
@@ -13,16 +15,16 @@ class SummaryReportAgent:
     - dzieli na: 12m/36m oraz pozytywny/negatywny,
     - pisze po polsku, w formacie Markdown,
     - długość raportu: ok. 2000 słów.
+
+    stream_global_report zwraca raport fragmentami, w miarę generowania; błąd przed pierwszym
+    fragmentem daje FALLBACK_REPORT, błąd w trakcie jest zgłaszany dalej.
     """
 
+    FALLBACK_REPORT = "# Raport strategiczny dla państwa Atlantis\n\nNie udało się wygenerować raportu."
+
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4.1",
-            api_key=lambda: config2.OPENAI_API_KEY,
-            temperature=0.3,
-            # 🔼 zwiększamy limit, żeby zmieścić ok. 2000 słów
-            max_tokens=4000,
-        )
+        # 🔼 zwiększamy limit, żeby zmieścić ok. 2000 słów
+        self.llm = get_chat_model(temperature=0.3, max_tokens=4000)
 
         self.prompt = ChatPromptTemplate.from_messages([
             (
@@ -76,7 +78,7 @@ class SummaryReportAgent:
             ),
         ])
 
-    def build_global_report(self, home_context: str, scenarios_data: list[dict]) -> str:
+    def _build_messages(self, home_context: str, scenarios_data: list[dict]):
         compact = []
         for item in scenarios_data:
             compact.append({
@@ -87,14 +89,32 @@ class SummaryReportAgent:
 
         scenarios_json = json.dumps(compact, ensure_ascii=False, indent=2)
 
-        messages = self.prompt.format_messages(
+        return self.prompt.format_messages(
             home_context=home_context,
             scenarios_json=scenarios_json,
         )
 
+    def build_global_report(self, home_context: str, scenarios_data: list[dict]) -> str:
+        messages = self._build_messages(home_context, scenarios_data)
+
         try:
             response = self.llm.invoke(messages)
             return response.content
         except Exception as e:
             print("❌ Błąd LLM (raport zbiorczy):", e)
-            return "# Raport strategiczny dla państwa Atlantis\n\nNie udało się wygenerować raportu."
+            return self.FALLBACK_REPORT
+
+    def stream_global_report(self, home_context: str, scenarios_data: list[dict]) -> Iterator[str]:
+        messages = self._build_messages(home_context, scenarios_data)
+
+        yielded = False
+        try:
+            for chunk in stream_with_cache(self.llm, messages):
+                yielded = True
+                yield chunk
+        except Exception as e:
+            print("❌ Błąd LLM (raport zbiorczy, stream):", e)
+            # przerwany w połowie tekst nie może udawać kompletnego wyniku (trafiłby do checkpointu)
+            if yielded:
+                raise
+            yield self.FALLBACK_REPORT
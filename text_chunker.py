@@ -0,0 +1,136 @@
+import itertools
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from pdf_extraction import PAGE_SEPARATOR
+
+# granica akapitu: pusta linia albo podział strony (wraz z otaczającymi białymi znakami)
+PARAGRAPH_BOUNDARY = re.compile(r"\s*(?:" + re.escape(PAGE_SEPARATOR) + r"|\n\s*\n)\s*")
+WHITESPACE = re.compile(r"\s+")
+# separator akapitów wewnątrz fragmentu - splitter i wyszukiwanie widzą granice akapitów
+CHUNK_PARAGRAPH_SEPARATOR = "\n\n"
+READ_BLOCK_CHARS = 64 * 1024
+
+
+@dataclass
+class TextChunk:
+    """
+    Fragment do embeddingu z pozycją w pliku .txt (offsety w znakach) i stronami PDF (od 1).
+    source: identyfikator dokumentu - w potoku fragmenty wielu plików idą wspólnymi paczkami.
+    """
+    index: int
+    text: str
+    page: int
+    page_end: int
+    start: int
+    end: int
+    source: Optional[str] = None
+
+
+def iter_file_blocks(path: str, block_chars: int = READ_BLOCK_CHARS) -> Iterator[str]:
+    """Plik tekstowy kawałkami po block_chars znaków."""
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            block = f.read(block_chars)
+            if not block:
+                return
+            yield block
+
+
+def iter_paragraphs(blocks: Iterable[str], max_chars: int) -> Iterator[Tuple[str, int, int]]:
+    """
+    Akapity (tekst, offset początku, strona) ze strumienia kawałków tekstu.
+    W pamięci jest tylko niedokończony akapit; akapit dłuższy niż max_chars (np. plik TXT
+    bez pustych linii) jest oddawany w częściach, cięty na końcu linii albo słowa.
+    """
+    buffer, offset, page = "", 0, 1
+    # None na końcu strumienia - wtedy granica na końcu bufora jest już pewna
+    for block in itertools.chain(blocks, [None]):
+        buffer += block or ""
+        position = 0
+        for match in PARAGRAPH_BOUNDARY.finditer(buffer):
+            # granica na samym końcu bufora może mieć ciąg dalszy w następnym kawałku
+            if block is not None and match.end() == len(buffer):
+                break
+            if match.start() > position:
+                yield buffer[position:match.start()], offset + position, page
+            page += match.group().count(PAGE_SEPARATOR)
+            position = match.end()
+
+        if block is None:
+            if position < len(buffer):
+                yield buffer[position:], offset + position, page
+            return
+
+        while len(buffer) - position > max_chars:
+            cut = max(buffer.rfind("\n", position, position + max_chars), buffer.rfind(" ", position, position + max_chars))
+            cut = cut + 1 if cut > position else position + max_chars
+            yield buffer[position:cut], offset + position, page
+            position = cut
+
+        buffer, offset = buffer[position:], offset + position
+
+
+def iter_text_chunks(
+    blocks: Iterable[str],
+    chunk_size: int = 1000,
+    overlap: int = 100,
+    source: Optional[str] = None,
+) -> Iterator[TextChunk]:
+    """
+    Generator fragmentów do embeddingu - czyta tekst przyrostowo, więc embedding może ruszyć,
+    zanim skończy się ekstrakcja, a zużycie pamięci nie zależy od rozmiaru dokumentu.
+    Akapity są łączone do chunk_size znaków (granice akapitów zostają zachowane), a kolejny
+    fragment zaczyna się od końcowych akapitów poprzedniego mieszczących się w overlap.
+    Akapit dłuższy niż chunk_size dzieli RecursiveCharacterTextSplitter (linie, słowa).
+    Białe znaki normalizujemy osobno w każdym akapicie, nie w całym dokumencie.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=overlap, length_function=len,
+        separators=["\n", " ", ""], add_start_index=True,
+    )
+    separator = len(CHUNK_PARAGRAPH_SEPARATOR)
+    window: List[Tuple[str, int, int, int]] = []
+    length = 0
+    index = 0
+
+    def make_chunk():
+        return TextChunk(
+            index=index,
+            text=CHUNK_PARAGRAPH_SEPARATOR.join(piece[0] for piece in window),
+            page=window[0][3],
+            page_end=window[-1][3],
+            start=window[0][1],
+            end=window[-1][2],
+            source=source,
+        )
+
+    for paragraph, start, page in iter_paragraphs(blocks, max_chars=max(chunk_size * 8, READ_BLOCK_CHARS)):
+        cleaned = WHITESPACE.sub(" ", paragraph).strip()
+        if not cleaned:
+            continue
+        if len(cleaned) <= chunk_size:
+            pieces = [(cleaned, start, start + len(paragraph), page)]
+        else:
+            pieces = []
+            for document in splitter.create_documents([paragraph]):
+                piece_start = start + document.metadata["start_index"]
+                pieces.append((
+                    WHITESPACE.sub(" ", document.page_content).strip(),
+                    piece_start, piece_start + len(document.page_content), page,
+                ))
+
+        for piece in pieces:
+            if window and length + separator + len(piece[0]) > chunk_size:
+                yield make_chunk()
+                index += 1
+                while window and (length > overlap or length + separator + len(piece[0]) > chunk_size):
+                    length -= len(window.pop(0)[0]) + (separator if window else 0)
+            length += len(piece[0]) + (separator if window else 0)
+            window.append(piece)
+
+    if window:
+        yield make_chunk()
@@ -0,0 +1,228 @@
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# progi histogramu czasu etapów (sekundy) - od pojedynczego wyszukiwania po cały raport
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SPAN_COUNTERS = ("prompt_tokens", "completion_tokens", "cache_hits", "retries", "errors")
+
+_current_trace: contextvars.ContextVar[Optional["JobTrace"]] = contextvars.ContextVar("job_trace", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    """Jeden pomiar etapu: czas ściany oraz liczniki tokenów, trafień w cache i ponowień."""
+
+    def __init__(self, stage: str, attributes: Dict[str, Any]):
+        self.stage = stage
+        self.attributes = attributes
+        self.started = time.monotonic()
+        self.duration = 0.0
+        self.counters = dict.fromkeys(SPAN_COUNTERS, 0)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentyl metodą najbliższej pozycji (q w zakresie 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class JobTrace:
+    """Zagregowane spany jednego zadania - rozbicie czasu i tokenów na etapy dla /status."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.stages: Dict[str, Dict[str, float]] = {}
+        # czasy pojedynczych spanów - do percentyli
+        self.durations: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(
+                span.stage, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, **dict.fromkeys(SPAN_COUNTERS, 0)}
+            )
+            self.durations.setdefault(span.stage, []).append(span.duration)
+            stage["count"] += 1
+            stage["total_seconds"] += span.duration
+            stage["max_seconds"] = max(stage["max_seconds"], span.duration)
+            for name, value in span.counters.items():
+                stage[name] += value
+
+    def finish(self) -> None:
+        self.finished = time.monotonic()
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.finished or time.monotonic()
+        with self._lock:
+            stages = {
+                name: {
+                    **{key: round(value, 3) if isinstance(value, float) else value for key, value in stage.items()},
+                    "p50_seconds": round(percentile(self.durations[name], 50), 3),
+                    "p95_seconds": round(percentile(self.durations[name], 95), 3),
+                }
+                for name, stage in self.stages.items()
+            }
+        return {"wall_seconds": round(end - self.started, 3), "stages": stages}
+
+
+class Metrics:
+    """
+    Metryki procesu w formacie tekstowym Prometheusa (endpoint /metrics):
+    histogram czasu etapów oraz liczniki tokenów, trafień w cache, ponowień i błędów.
+    """
+
+    def __init__(self, prefix: str = "atlantis"):
+        self.prefix = prefix
+        self._durations: Dict[str, List[int]] = {}
+        self._duration_sums: Dict[str, float] = {}
+        self._counters: Dict[str, Dict[str, float]] = {name: {} for name in SPAN_COUNTERS}
+        self._lock = threading.Lock()
+
+    def observe(self, span: Span) -> None:
+        with self._lock:
+            buckets = self._durations.setdefault(span.stage, [0] * (len(DURATION_BUCKETS) + 1))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    buckets[i] += 1
+            buckets[-1] += 1
+            self._duration_sums[span.stage] = self._duration_sums.get(span.stage, 0.0) + span.duration
+            for name, value in span.counters.items():
+                if value:
+                    self._counters[name][span.stage] = self._counters[name].get(span.stage, 0) + value
+
+    def render(self, gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+        """gauges: dodatkowe wartości chwilowe {nazwa: {etykieta_kind: wartość}}, np. stan kolejek zadań."""
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_duration_seconds Czas etapu (span) w sekundach.",
+            f"# TYPE {p}_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for stage, buckets in sorted(self._durations.items()):
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {buckets[-1]}')
+                lines.append(f'{p}_stage_duration_seconds_sum{{stage="{stage}"}} {self._duration_sums[stage]:.6f}')
+                lines.append(f'{p}_stage_duration_seconds_count{{stage="{stage}"}} {buckets[-1]}')
+
+            for name, values in self._counters.items():
+                lines.append(f"# TYPE {p}_{name}_total counter")
+                for stage, value in sorted(values.items()):
+                    lines.append(f'{p}_{name}_total{{stage="{stage}"}} {value}')
+
+        for name, values in (gauges or {}).items():
+            lines.append(f"# TYPE {p}_{name} gauge")
+            for kind, value in sorted(values.items()):
+                lines.append(f'{p}_{name}{{kind="{kind}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+_traces: Dict[str, JobTrace] = {}
+_traces_lock = threading.Lock()
+
+
+def start_trace(job_id: str) -> JobTrace:
+    """Rozpoczyna śledzenie zadania w bieżącym kontekście (wątku workera)."""
+    trace = JobTrace(job_id)
+    with _traces_lock:
+        _traces[job_id] = trace
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace(job_id: str) -> Optional[Dict[str, Any]]:
+    """Kończy śledzenie i zwraca podsumowanie (do zapisania w magazynie zadań)."""
+    with _traces_lock:
+        trace = _traces.pop(job_id, None)
+    if trace is None:
+        return None
+    # wątki workerów są wielokrotnego użytku - kolejne zadanie nie może trafić do tego śladu
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    trace.finish()
+    return trace.summary()
+
+
+def get_trace_summary(job_id: str) -> Optional[Dict[str, Any]]:
+    """Bieżące rozbicie czasu działającego zadania (None, jeśli nie działa w tym procesie)."""
+    with _traces_lock:
+        trace = _traces.get(job_id)
+    return trace.summary() if trace is not None else None
+
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Span]:
+    """
+    Mierzy etap. Tokeny, trafienia w cache i ponowienia zgłoszone w trakcie (record)
+    trafiają do najbardziej zagnieżdżonego spanu. Wyjątek jest liczony jako błąd i przekazywany dalej.
+    """
+    current = Span(stage, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception:
+        current.counters["errors"] += 1
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration = time.monotonic() - current.started
+        METRICS.observe(current)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+
+
+def record(**counters) -> None:
+    """Dodaje liczniki (prompt_tokens, completion_tokens, cache_hits, retries, errors) do bieżącego spanu."""
+    current = _current_span.get()
+    if current is None:
+        return
+    for name, value in counters.items():
+        current.counters[name] += value
+
+
+def in_context(fn: Callable) -> Callable:
+    """
+    Przenosi bieżący kontekst (zadanie, span) do funkcji wykonywanej w puli wątków -
+    nowe wątki nie dziedziczą contextvars. Każde wywołanie dostaje własną kopię kontekstu.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Callback LangChain podpięty do wspólnych modeli (llm_clients) - zlicza tokeny odpowiedzi."""
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        try:
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    # LangChain zeruje total_cost przy trafieniu w cache - za te tokeny nie płacimy
+                    if usage.get("total_cost") == 0:
+                        continue
+                    record(
+                        prompt_tokens=usage.get("input_tokens", 0),
+                        completion_tokens=usage.get("output_tokens", 0),
+                    )
+        except Exception as e:
+            logging.warning(f"Nie udało się odczytać zużycia tokenów: {e}")
@@ -0,0 +1,374 @@
+import argparse
+import json
+import logging
+import statistics
+import time
+from typing import Dict, List, Optional, Sequence
+
+import sqlalchemy
+
+# operator odległości i odpowiadająca mu klasa operatorów indeksu pgvector
+METRICS = {
+    "cosine": ("<=>", "vector_cosine_ops"),
+    "l2": ("<->", "vector_l2_ops"),
+    "ip": ("<#>", "vector_ip_ops"),
+}
+INDEX_METHODS = ("hnsw", "ivfflat")
+# od tej wersji pgvector indeks ANN z filtrem WHERE skanuje dalej, aż znajdzie k pasujących wierszy
+ITERATIVE_SCAN_VERSION = (0, 8)
+
+
+def to_pgvector_param(embedding_vector) -> str:
+    """Wektor jako parametr zapytania w formacie tekstowym pgvector ('[0.1,0.2,...]')."""
+    if isinstance(embedding_vector, str):
+        return embedding_vector
+    return json.dumps([float(x) for x in embedding_vector], separators=(",", ":"))
+
+
+class VectorSearch:
+    """
+    Magazyn wektorów na tabeli documents (pgvector):
+    - zapis paczek fragmentów i wyszukiwanie top-k (ten sam interfejs co LocalVectorStore),
+    - deduplikacja po hashach treści pliku i fragmentu (kolumny file_hash / content_hash),
+    - zarządzanie indeksami ANN (HNSW / IVFFlat): tworzenie, przebudowa, usuwanie,
+    - strojenie dokładności zapytań (hnsw.ef_search / ivfflat.probes),
+    - top-k z filtrem po nazwie pliku i czasie wgrania,
+    - benchmark recall vs opóźnienie względem wyszukiwania dokładnego.
+    """
+
+    # wierszy w jednym INSERT (5 parametrów na wiersz; limit protokołu Postgresa to 32767 parametrów)
+    SAVE_BATCH_ROWS = 1000
+
+    def __init__(self, engine, table: str = "documents", metric: str = "cosine"):
+        if metric not in METRICS:
+            raise ValueError(f"Nieznana metryka: {metric}")
+        self.engine = engine
+        self.table = table
+        self.metric = metric
+        self.operator, self.opclass = METRICS[metric]
+        self._iterative_scan: Optional[bool] = None
+
+    def index_name(self, method: str) -> str:
+        return f"{self.table}_embedding_{method}_{self.metric}_idx"
+
+    # --- INDEKSY ---
+
+    def ensure_index(
+        self,
+        method: Optional[str] = "hnsw",
+        m: int = 16,
+        ef_construction: int = 64,
+        lists: int = 100,
+        concurrently: bool = True,
+    ) -> Optional[str]:
+        """
+        Tworzy indeks ANN (jeśli nie istnieje; method=None - bez niego) oraz indeksy pomocnicze
+        dla filtrów i deduplikacji. Na dużej tabeli trwa długo - wywołujemy przy starcie serwera
+        albo z CLI, nigdy w trakcie żądania.
+        """
+        if method is not None and method not in INDEX_METHODS:
+            raise ValueError(f"Nieznana metoda indeksu: {method}")
+
+        mode = "CONCURRENTLY " if concurrently else ""
+        statements = [
+            f"CREATE INDEX {mode}IF NOT EXISTS {self.table}_filename_idx ON {self.table} (filename)",
+            f"CREATE INDEX {mode}IF NOT EXISTS {self.table}_created_at_idx ON {self.table} (created_at)",
+            f"CREATE INDEX {mode}IF NOT EXISTS {self.table}_content_hash_idx ON {self.table} (content_hash)",
+            f"CREATE INDEX {mode}IF NOT EXISTS {self.table}_file_hash_idx ON {self.table} (file_hash)",
+        ]
+        name = None
+        if method is not None:
+            if method == "hnsw":
+                options = f"(m = {int(m)}, ef_construction = {int(ef_construction)})"
+            else:
+                options = f"(lists = {int(lists)})"
+            name = self.index_name(method)
+            statements.append(
+                f"CREATE INDEX {mode}IF NOT EXISTS {name} ON {self.table} "
+                f"USING {method} (embedding {self.opclass}) WITH {options}"
+            )
+        # CREATE INDEX CONCURRENTLY nie może działać w transakcji
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for statement in statements:
+                conn.execute(sqlalchemy.text(statement))
+        logging.info(f"Indeksy tabeli {self.table} gotowe" + (f" (wektorowy: {name})" if name else ""))
+        return name
+
+    def ensure_schema(self) -> None:
+        """
+        Kolumny z hashami treści (deduplikacja plików i fragmentów) - dla tabel sprzed tej zmiany.
+        Samo dodanie kolumn bez wartości domyślnej jest natychmiastowe; indeksy na nich tworzy ensure_index.
+        """
+        statements = [
+            f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS content_hash TEXT",
+            f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS file_hash TEXT",
+        ]
+        with self.engine.begin() as conn:
+            for statement in statements:
+                conn.execute(sqlalchemy.text(statement))
+
+    def rebuild_index(self, method: str = "hnsw", concurrently: bool = True) -> None:
+        """Przebudowa indeksu - np. IVFFlat po dużym przyroście danych (listy liczone przy tworzeniu)."""
+        mode = "CONCURRENTLY " if concurrently else ""
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(sqlalchemy.text(f"REINDEX INDEX {mode}{self.index_name(method)}"))
+
+    def drop_index(self, method: str = "hnsw") -> None:
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(sqlalchemy.text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.index_name(method)}"))
+
+    def list_indexes(self) -> List[Dict]:
+        query = sqlalchemy.text(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :table ORDER BY indexname"
+        )
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query, {"table": self.table}).mappings()]
+
+    # --- ZAPIS ---
+
+    def save_batch(self, rows: Sequence[tuple]) -> None:
+        """
+        Zapisuje paczkę (filename, content, embedding_vector, content_hash, file_hash)
+        w jednej transakcji, jednym INSERT z wieloma wierszami VALUES (po SAVE_BATCH_ROWS) -
+        executemany w pg8000 wysyła osobne zapytanie na każdy wiersz. Wektor przekazujemy
+        jako parametr i rzutujemy na vector po stronie bazy.
+        """
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            for offset in range(0, len(rows), self.SAVE_BATCH_ROWS):
+                values, params = [], {}
+                for i, (filename, content, vector, content_hash, file_hash) in enumerate(
+                    rows[offset:offset + self.SAVE_BATCH_ROWS]
+                ):
+                    values.append(
+                        f"(:filename_{i}, :content_{i}, CAST(:embedding_{i} AS vector), now(), :content_hash_{i}, :file_hash_{i})"
+                    )
+                    params.update({
+                        f"filename_{i}": filename, f"content_{i}": content, f"embedding_{i}": to_pgvector_param(vector),
+                        f"content_hash_{i}": content_hash, f"file_hash_{i}": file_hash,
+                    })
+                insert_query = sqlalchemy.text(
+                    f"INSERT INTO {self.table} (filename, content, embedding, created_at, content_hash, file_hash) "
+                    f"VALUES {', '.join(values)}"
+                )
+                conn.execute(insert_query, params)
+
+    def file_exists(self, filename: str) -> bool:
+        select_query = sqlalchemy.text(f"SELECT COUNT(*) FROM {self.table} WHERE filename = :filename")
+        with self.engine.connect() as conn:
+            return conn.execute(select_query, {"filename": filename}).scalar() > 0
+
+    def has_documents(self, filenames: Optional[Sequence[str]] = None) -> bool:
+        """Czy tabela zawiera jakikolwiek fragment (opcjonalnie tylko z wybranych plików)."""
+        if filenames:
+            select_query = sqlalchemy.text(
+                f"SELECT EXISTS (SELECT 1 FROM {self.table} WHERE filename IN :filenames)"
+            ).bindparams(sqlalchemy.bindparam("filenames", expanding=True))
+            params = {"filenames": list(filenames)}
+        else:
+            select_query, params = sqlalchemy.text(f"SELECT EXISTS (SELECT 1 FROM {self.table})"), {}
+        with self.engine.connect() as conn:
+            return bool(conn.execute(select_query, params).scalar())
+
+    def find_file(self, file_hash: str) -> Optional[str]:
+        """Nazwa pliku o identycznej treści (hash całego pliku), jeśli jest już w tabeli."""
+        select_query = sqlalchemy.text(f"SELECT filename FROM {self.table} WHERE file_hash = :file_hash LIMIT 1")
+        with self.engine.connect() as conn:
+            return conn.execute(select_query, {"file_hash": file_hash}).scalar()
+
+    def find_embeddings(self, content_hashes: Sequence[str]) -> Dict[str, str]:
+        """Zapisane już wektory fragmentów o danych hashach treści (hash -> wektor w formacie pgvector)."""
+        if not content_hashes:
+            return {}
+        select_query = sqlalchemy.text(f"""
+            SELECT DISTINCT ON (content_hash) content_hash, embedding::text AS embedding
+            FROM {self.table}
+            WHERE content_hash IN :content_hashes
+        """).bindparams(sqlalchemy.bindparam("content_hashes", expanding=True))
+        with self.engine.connect() as conn:
+            rows = conn.execute(select_query, {"content_hashes": list(content_hashes)}).all()
+        return {content_hash: embedding for content_hash, embedding in rows}
+
+    def delete_file_versions(self, filename: str, keep_file_hash: str) -> int:
+        """Usuwa fragmenty poprzednich wersji pliku (inny hash pliku); zwraca liczbę usuniętych."""
+        delete_query = sqlalchemy.text(
+            f"DELETE FROM {self.table} WHERE filename = :filename AND file_hash IS DISTINCT FROM :file_hash"
+        )
+        with self.engine.begin() as conn:
+            return conn.execute(delete_query, {"filename": filename, "file_hash": keep_file_hash}).rowcount
+
+    def delete_file_content(self, filename: str, file_hash: str) -> int:
+        """Usuwa fragmenty jednej wersji pliku (np. przerwanego wgrywania); zwraca liczbę usuniętych."""
+        delete_query = sqlalchemy.text(
+            f"DELETE FROM {self.table} WHERE filename = :filename AND file_hash = :file_hash"
+        )
+        with self.engine.begin() as conn:
+            return conn.execute(delete_query, {"filename": filename, "file_hash": file_hash}).rowcount
+
+    # --- WYSZUKIWANIE ---
+
+    def supports_iterative_scan(self) -> bool:
+        """Czy zainstalowany pgvector (>= 0.8) ma hnsw/ivfflat.iterative_scan (sprawdzane raz)."""
+        if self._iterative_scan is None:
+            query = sqlalchemy.text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            with self.engine.connect() as conn:
+                version = conn.execute(query).scalar() or "0"
+            try:
+                parsed = tuple(int(part) for part in version.split(".")[:2])
+            except ValueError:
+                parsed = (0,)
+            self._iterative_scan = parsed >= ITERATIVE_SCAN_VERSION
+        return self._iterative_scan
+
+    def search(
+        self,
+        query_vector,
+        k: int = 5,
+        filenames: Optional[Sequence[str]] = None,
+        created_after=None,
+        created_before=None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        exact: bool = False,
+    ) -> List[Dict]:
+        """
+        Top-k najbliższych fragmentów. ef_search / probes zwiększają recall kosztem czasu,
+        exact=True wyłącza indeks (pełny skan - wynik referencyjny dla benchmarku).
+        Filtry są stosowane po skanie kandydatów z indeksu ANN, więc przy wybranych plikach będących
+        małą częścią tabeli indeks zwróciłby mniej niż k wierszy (albo żadnego). Dlatego z filtrem
+        włączamy iterative_scan (pgvector >= 0.8), a na starszych wersjach szukamy dokładnie.
+        """
+        conditions, params = [], {"query_vector": to_pgvector_param(query_vector), "k": int(k)}
+        if filenames:
+            conditions.append("filename IN :filenames")
+            params["filenames"] = list(filenames)
+        if created_after is not None:
+            conditions.append("created_at >= :created_after")
+            params["created_after"] = created_after
+        if created_before is not None:
+            conditions.append("created_at < :created_before")
+            params["created_before"] = created_before
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        distance = f"embedding {self.operator} CAST(:query_vector AS vector)"
+        select_query = sqlalchemy.text(f"""
+            SELECT ctid::text AS row_id, filename, content, created_at, {distance} AS distance
+            FROM {self.table}
+            {where}
+            ORDER BY {distance}
+            LIMIT :k
+        """)
+        if filenames:
+            select_query = select_query.bindparams(sqlalchemy.bindparam("filenames", expanding=True))
+
+        iterative = False
+        if conditions and not exact:
+            iterative = self.supports_iterative_scan()
+            exact = not iterative
+
+        # SET LOCAL działa tylko do końca transakcji - nie wpływa na inne zapytania z puli
+        with self.engine.begin() as conn:
+            if exact:
+                conn.execute(sqlalchemy.text("SET LOCAL enable_indexscan = off"))
+            if iterative:
+                conn.execute(sqlalchemy.text("SET LOCAL hnsw.iterative_scan = relaxed_order"))
+                conn.execute(sqlalchemy.text("SET LOCAL ivfflat.iterative_scan = relaxed_order"))
+            if ef_search is not None:
+                conn.execute(sqlalchemy.text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+            if probes is not None:
+                conn.execute(sqlalchemy.text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+            rows = conn.execute(select_query, params).mappings().all()
+        results = [dict(row) for row in rows]
+        if iterative:
+            # relaxed_order może zwrócić wiersze nieznacznie poza kolejnością odległości
+            results.sort(key=lambda row: row["distance"])
+        return results
+
+    # --- BENCHMARK ---
+
+    def sample_query_vectors(self, n: int = 20) -> List[str]:
+        """Losowe wektory z tabeli jako zapytania testowe (bez wywołań API embeddingów)."""
+        query = sqlalchemy.text(f"SELECT embedding::text FROM {self.table} ORDER BY random() LIMIT :n")
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(query, {"n": int(n)})]
+
+    def benchmark(
+        self,
+        query_vectors: Sequence,
+        k: int = 10,
+        ef_search_values: Sequence[int] = (20, 40, 80, 160),
+        probes_values: Sequence[int] = (),
+    ) -> List[Dict]:
+        """Recall@k i opóźnienia (p50/p95) dla kolejnych ustawień względem pełnego skanu."""
+
+        def run(settings):
+            latencies, found = [], []
+            for vector in query_vectors:
+                start = time.perf_counter()
+                rows = self.search(vector, k, **settings)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found.append({row["row_id"] for row in rows})
+            return latencies, found
+
+        exact_latencies, exact_ids = run({"exact": True})
+        configurations = [{"exact": True}]
+        configurations += [{"ef_search": value} for value in ef_search_values]
+        configurations += [{"probes": value} for value in probes_values]
+
+        report = []
+        for settings in configurations:
+            if settings.get("exact"):
+                latencies, found = exact_latencies, exact_ids
+            else:
+                latencies, found = run(settings)
+            recalls = [
+                len(ann & exact) / len(exact) if exact else 1.0
+                for ann, exact in zip(found, exact_ids)
+            ]
+            report.append({
+                "settings": settings,
+                "recall_at_k": round(statistics.mean(recalls), 4) if recalls else None,
+                "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+                "p95_ms": round(_percentile(latencies, 95), 2) if latencies else None,
+            })
+        return report
+
+
+def _percentile(values: Sequence[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+if __name__ == "__main__":
+    from flask_main import init_db_engine
+
+    parser = argparse.ArgumentParser(description="Zarządzanie indeksem wektorowym tabeli documents")
+    parser.add_argument("command", choices=["create", "rebuild", "drop", "list", "benchmark"])
+    parser.add_argument("--method", choices=INDEX_METHODS, default="hnsw")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--lists", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    vector_search = VectorSearch(init_db_engine())
+
+    if args.command == "create":
+        vector_search.ensure_schema()
+        vector_search.ensure_index(args.method, m=args.m, ef_construction=args.ef_construction, lists=args.lists)
+    elif args.command == "rebuild":
+        vector_search.rebuild_index(args.method)
+    elif args.command == "drop":
+        vector_search.drop_index(args.method)
+    elif args.command == "list":
+        print(json.dumps(vector_search.list_indexes(), ensure_ascii=False, indent=2))
+    else:
+        queries = vector_search.sample_query_vectors(args.queries)
+        if args.method == "hnsw":
+            result = vector_search.benchmark(queries, args.k)
+        else:
+            result = vector_search.benchmark(queries, args.k, ef_search_values=(), probes_values=(1, 5, 10, 20))
+        print(json.dumps(result, ensure_ascii=False, indent=2))